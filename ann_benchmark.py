@@ -0,0 +1,109 @@
+"""Recall and latency of ANN retrieval against the exact recommend path.
+
+Usage::
+
+    python ann_benchmark.py --model recipe_recommender --queries 200 --n-probe 1 4 8 16
+
+Queries are sampled from the catalog itself (a product name plus two of its
+ingredients). Recall@k is the share of the exact top-k products that the ANN
+path also returns.
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+import pandas as pd
+from typing import Dict, List
+
+import app
+from recommender import RecipeProductRecommender
+
+
+def sample_queries(recommender: RecipeProductRecommender, n_queries: int, seed: int = 0) -> List[Dict]:
+    rng = np.random.default_rng(seed)
+    live = np.flatnonzero(~recommender.removed)
+    positions = rng.choice(live, min(n_queries, len(live)), replace=False)
+    rows = recommender._format_output(positions, np.zeros(len(positions)), np.zeros(len(positions)))
+
+    queries = []
+    for _, row in rows.iterrows():
+        ingredients = [part.strip() for part in str(row.get('ingredients_text', '')).split(',') if part.strip()]
+        queries.append({'recipe_text': row['product_name'], 'ingredients': ingredients[:2]})
+    return queries
+
+
+def result_keys(result: pd.DataFrame) -> List[tuple]:
+    cols = [col for col in ('product_name', 'brands', 'ingredients_text') if col in result.columns]
+    return list(result[cols].itertuples(index=False, name=None))
+
+
+def run(recommender: RecipeProductRecommender, queries: List[Dict], retrieval: str) -> Dict:
+    latencies, results = [], []
+    for query in queries:
+        start = time.perf_counter()
+        results.append(recommender.recommend(**query, retrieval=retrieval))
+        latencies.append(time.perf_counter() - start)
+    latencies = np.array(latencies) * 1000
+    return {
+        'results': results,
+        'p50_ms': float(np.percentile(latencies, 50)),
+        'p95_ms': float(np.percentile(latencies, 95)),
+        'mean_ms': float(latencies.mean())
+    }
+
+
+def recall(exact: List[pd.DataFrame], approximate: List[pd.DataFrame]) -> float:
+    found = total = 0
+    for expected, actual in zip(exact, approximate):
+        expected, actual = result_keys(expected), set(result_keys(actual))
+        found += sum(1 for key in expected if key in actual)
+        total += len(expected)
+    return found / total if total else 1.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--model', default='recipe_recommender2.pkl', help='artifact directory or pickle')
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--n-probe', type=int, nargs='+', default=[1, 4, 8, 16, 32])
+    parser.add_argument('--pool-size', type=int, default=RecipeProductRecommender.ann_pool_size)
+    parser.add_argument('--n-components', type=int, default=128)
+    parser.add_argument('--json', action='store_true', help='print machine-readable results')
+    args = parser.parse_args()
+
+    if not app.load_recommender(args.model):
+        raise SystemExit(f"Could not load model from {args.model}")
+    recommender = app.recommender
+    recommender.result_cache = None
+
+    if not recommender.ann_indexes:
+        build_times = recommender.build_ann_index(n_components=args.n_components)
+    else:
+        build_times = {}
+    recommender.ann_pool_size = args.pool_size
+
+    queries = sample_queries(recommender, args.queries)
+    exact = run(recommender, queries, 'exact')
+    rows = [{'mode': 'exact', 'n_probe': None, 'recall': 1.0,
+             **{k: v for k, v in exact.items() if k != 'results'}}]
+
+    for n_probe in args.n_probe:
+        recommender.ann_n_probe = n_probe
+        approximate = run(recommender, queries, 'ann')
+        rows.append({'mode': 'ann', 'n_probe': n_probe, 'recall': recall(exact['results'], approximate['results']),
+                     **{k: v for k, v in approximate.items() if k != 'results'}})
+
+    if args.json:
+        print(json.dumps({'build_seconds': build_times, 'products': len(recommender.df), 'runs': rows}, indent=1))
+        return
+
+    print(f"{len(recommender.df)} products, {len(queries)} queries, pool size {args.pool_size}")
+    print(f"{'mode':<6}{'n_probe':>8}{'recall':>8}{'p50 ms':>9}{'p95 ms':>9}{'mean ms':>9}")
+    for row in rows:
+        n_probe = '-' if row['n_probe'] is None else row['n_probe']
+        print(f"{row['mode']:<6}{n_probe:>8}{row['recall']:>8.3f}{row['p50_ms']:>9.2f}{row['p95_ms']:>9.2f}{row['mean_ms']:>9.2f}")
+
+
+if __name__ == '__main__':
+    main()
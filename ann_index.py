@@ -0,0 +1,118 @@
+import numpy as np
+import scipy.sparse as sp
+from typing import Dict, Optional
+
+# Rows per block when assigning products to their nearest centroid
+ASSIGN_BLOCK_SIZE = 65536
+
+
+class IvfIndex:
+    """Approximate cosine search over TF-IDF rows (inverted file over SVD embeddings).
+
+    The TF-IDF matrix is reduced with TruncatedSVD to dense float32 embeddings,
+    which are L2-normalized and clustered with spherical k-means. Products are
+    stored in one inverted list per centroid (``list_order`` sliced by
+    ``list_offsets``), so a query only scores the products of the ``n_probe``
+    centroids closest to it.
+
+    The index only proposes candidates: the recommender recomputes the exact
+    TF-IDF similarities for them before ranking.
+    """
+
+    def __init__(self, matrix: sp.csr_matrix, n_components: int = 128, n_lists: Optional[int] = None,
+                 n_iter: int = 10, random_state: int = 0):
+        n_products, n_features = matrix.shape
+        n_components = max(1, min(n_components, n_features - 1, n_products - 1))
+        if n_lists is None:
+            n_lists = int(np.sqrt(n_products))
+        n_lists = max(1, min(n_lists, n_products))
+
+        # Only building needs scikit-learn; loaded indexes just project queries onto the components
+        from sklearn.decomposition import TruncatedSVD
+        svd = TruncatedSVD(n_components=n_components, random_state=random_state)
+        self.embeddings = self._normalize(svd.fit_transform(matrix).astype(np.float32))
+        self.components = svd.components_.astype(np.float32)
+
+        self.centroids = self._kmeans(n_lists, n_iter, np.random.default_rng(random_state))
+        self._build_lists(self._assign(self.embeddings))
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms > 0, norms, 1).astype(np.float32)
+
+    def _kmeans(self, n_lists: int, n_iter: int, rng: np.random.Generator) -> np.ndarray:
+        """Spherical k-means on a sample of the embeddings."""
+        n_products = len(self.embeddings)
+        sample = self.embeddings[rng.choice(n_products, min(n_products, 256 * n_lists), replace=False)]
+        centroids = sample[rng.choice(len(sample), n_lists, replace=False)]
+
+        for _ in range(n_iter):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, sample)
+            empty = np.bincount(assignment, minlength=n_lists) == 0
+            # Reseed empty clusters with random sample points
+            sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+            centroids = self._normalize(sums)
+        return centroids
+
+    def _assign(self, embeddings: np.ndarray) -> np.ndarray:
+        assignment = np.empty(len(embeddings), dtype=np.int32)
+        for start in range(0, len(embeddings), ASSIGN_BLOCK_SIZE):
+            block = embeddings[start:start + ASSIGN_BLOCK_SIZE]
+            assignment[start:start + len(block)] = np.argmax(block @ self.centroids.T, axis=1)
+        return assignment
+
+    def _build_lists(self, assignment: np.ndarray):
+        self.assignment = assignment
+        self.list_order = np.argsort(assignment, kind='stable').astype(np.int32)
+        self.list_offsets = np.concatenate(
+            [[0], np.cumsum(np.bincount(assignment, minlength=len(self.centroids)))]
+        )
+
+    def embed(self, vectors: sp.csr_matrix) -> np.ndarray:
+        """Project TF-IDF rows into the normalized embedding space."""
+        return self._normalize(np.asarray(vectors @ self.components.T, dtype=np.float32))
+
+    def append(self, matrix: sp.csr_matrix):
+        """Add products (new TF-IDF rows) to their nearest existing lists."""
+        embeddings = self.embed(matrix)
+        self.embeddings = np.concatenate([self.embeddings, embeddings])
+        self._build_lists(np.concatenate([self.assignment, self._assign(embeddings)]))
+
+    def search(self, query_vec: sp.csr_matrix, n_probe: int = 8, pool_size: int = 1000) -> np.ndarray:
+        """Sorted positions of up to ``pool_size`` products closest to the query."""
+        query = self.embed(query_vec)[0]
+        if not query.any():
+            return np.array([], dtype=np.int64)
+
+        n_probe = min(n_probe, len(self.centroids))
+        lists = np.argpartition(-(self.centroids @ query), n_probe - 1)[:n_probe]
+        positions = np.concatenate(
+            [self.list_order[self.list_offsets[i]:self.list_offsets[i + 1]] for i in lists]
+        ).astype(np.int64)
+
+        if len(positions) > pool_size:
+            scores = self.embeddings[positions] @ query
+            positions = positions[np.argpartition(-scores, pool_size - 1)[:pool_size]]
+        return np.sort(positions)
+
+    def to_arrays(self):
+        """Arrays and metadata needed to restore the index without rebuilding it."""
+        arrays = {
+            'embeddings': self.embeddings,
+            'components': self.components,
+            'centroids': self.centroids,
+            'assignment': self.assignment,
+            'list_order': self.list_order,
+            'list_offsets': self.list_offsets
+        }
+        return arrays, {}
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict, meta: Dict) -> 'IvfIndex':
+        index = cls.__new__(cls)
+        for name, values in arrays.items():
+            setattr(index, name, values)
+        return index
@@ -1,13 +1,25 @@
 import traceback
+import json
+import math
+import time
 from flask import Flask, request, jsonify, render_template
 from flask_cors import CORS
 import pickle
 import pandas as pd
 import numpy as np
-import joblib
-from typing import List, Dict
+from typing import List, Dict, Optional, Tuple
 import logging 
+import mimetypes
+import os
+from werkzeug.security import safe_join
 from recommender import RecipeProductRecommender
+from product_table import ProductColumns
+from latency_metrics import render_gauges
+
+try:
+    import orjson
+except ImportError:  # optional, faster JSON encoding of recommendation responses
+    orjson = None
 
 app = Flask(__name__)
 
@@ -23,94 +35,236 @@ logger = logging.getLogger(__name__)
 
 recommender = None
 
+# Result cache for repeated /recommend queries (see query_cache)
+CACHE_SETTINGS = {'max_entries': 1024, 'ttl': 300.0}
+
+# Scored candidate sets behind /recommend pagination cursors (see result_pages)
+PAGE_SETTINGS = {'max_entries': 256, 'ttl': 300.0}
+
+# Results a paged /recommend query can page through, and the default page size
+MAX_PAGED_RESULTS = 200
+DEFAULT_PAGE_SIZE = 10
+
+# Typo correction of query words (see query_expansion); off unless RECOMMENDER_QUERY_EXPANSION=1
+QUERY_EXPANSION = os.environ.get('RECOMMENDER_QUERY_EXPANSION', '0') == '1'
+
+# Per-stage latency histograms served by /metrics (see latency_metrics); off unless RECOMMENDER_METRICS=1
+METRICS = os.environ.get('RECOMMENDER_METRICS', '0') == '1'
+
+# Threads scoring row shards of the catalog in parallel (see sharded_scoring); 0 keeps scoring serial
+SCORING_THREADS = int(os.environ.get('RECOMMENDER_SCORING_THREADS', 0))
+
 def load_recommender(model_path: str = 'recipe_recommender2.pkl'):
     global recommender
     try:
-        with open(model_path, 'rb') as f:
-            recommender = joblib.load(f)
+        if os.path.isdir(model_path):
+            # Versioned artifact directory written by RecipeProductRecommender.save
+            recommender = RecipeProductRecommender.load(model_path)
+        else:
+            # Legacy pickles hold scikit-learn vectorizers, so only they pay for importing it
+            import joblib
+            with open(model_path, 'rb') as f:
+                recommender = joblib.load(f)
+        if not QUERY_EXPANSION:
+            recommender.query_expanders = {}
+        elif not recommender.query_expanders:
+            # Models saved before query expansion existed get it built on load
+            recommender.build_query_expansion()
+        recommender.enable_result_cache(**CACHE_SETTINGS)
+        recommender.enable_pagination(**PAGE_SETTINGS)
+        if METRICS:
+            recommender.enable_metrics()
+        if SCORING_THREADS > 1:
+            recommender.enable_parallel_scoring(SCORING_THREADS)
         logger.info("Recommender system loaded successfully")
         return True
     except Exception as e:
         logger.error(f"Error loading recommender: {str(e)}")
         return False
 
-def format_recommendation_response(recommendations_df: pd.DataFrame) -> List[Dict]:
-    if recommendations_df.empty:
+def _health_category(health_score: float) -> str:
+    if health_score >= 7:
+        return "Excellent"
+    elif health_score >= 5:
+        return "Good"
+    elif health_score >= 3:
+        return "Average"
+    return "Poor"
+
+def _present(value) -> bool:
+    # Missing values come back as None or NaN (NaN != NaN)
+    return value is not None and value == value
+
+# Response fields: the result columns each is built from, its default when the
+# column is missing, and how a value is formatted
+RESPONSE_FIELDS = {
+    'name': ('product_name', 'Unknown Product', str),
+    'brand': ('brands', 'Unknown Brand', str),
+    'score': ('final_score', 0.0, lambda v: float(v) if _present(v) else 0.0),
+    'calories': ('energy-kcal_100g', 0, lambda v: int(v) if _present(v) and 0 < v < math.inf else 0),
+    'protein': ('proteins_100g', 0.0, lambda v: round(float(v), 1) if _present(v) else 0.0),
+    'sugar': ('sugars_100g', 0.0, lambda v: round(float(v), 1) if _present(v) else 0.0),
+    'nutriscore': ('nutriscore_grade', 'C', lambda v: str(v).upper() if _present(v) else "C"),
+    'healthCategory': ('health_score', 5, _health_category),
+    'categories': ('categories', '', str),
+    'ingredients': ('ingredients_text', '', str),
+    'matched_ingredients': ('matched_ingredients', 0, int),
+    'matched_ingredient_names': ('matched_ingredient_names', (), list)
+}
+
+def result_fields(fields: Optional[List[str]] = None) -> Optional[List[str]]:
+    """Recommender result columns needed for the given response fields (all when None)."""
+    if fields is None:
+        return None
+    return [RESPONSE_FIELDS[field][0] for field in fields]
+
+def parse_fields(data: Dict) -> Optional[List[str]]:
+    """Response fields requested with ``fields``; raises ValueError for unknown names."""
+    fields = data.get('fields')
+    if fields is None:
+        return None
+    if not isinstance(fields, list) or not all(isinstance(field, str) for field in fields):
+        raise ValueError("'fields' must be a list of field names")
+    unknown = [field for field in fields if field not in RESPONSE_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields {unknown} (expected some of {', '.join(RESPONSE_FIELDS)})")
+    return fields
+
+def parse_page_size(data: Dict) -> Optional[int]:
+    """Results per page requested with ``pageSize``; raises ValueError unless it is a positive integer."""
+    page_size = data.get('pageSize')
+    if page_size is None:
+        return None
+    if isinstance(page_size, bool) or not isinstance(page_size, int) or not 1 <= page_size <= MAX_PAGED_RESULTS:
+        raise ValueError(f"'pageSize' must be an integer from 1 to {MAX_PAGED_RESULTS}")
+    return page_size
+
+def format_recommendation_response(result: ProductColumns, fields: Optional[List[str]] = None) -> List[Dict]:
+    """JSON-ready products, built column by column from a recommender result."""
+    if len(result) == 0:
         return []
+
+    fields = fields or list(RESPONSE_FIELDS)
+    values = []
+    for field in fields:
+        col, default, convert = RESPONSE_FIELDS[field]
+        column = result[col].tolist() if col in result else [default] * len(result)
+        values.append([convert(value) for value in column])
+
+    return [dict(zip(fields, row)) for row in zip(*values)]
+
+def dump_json(payload) -> bytes:
+    """Serialize a response payload, with orjson when it is installed."""
+    if orjson is not None:
+        # NumPy scalars (e.g. nutrition summary statistics) like json.dumps accepts them
+        return orjson.dumps(payload, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(payload, separators=(',', ':')).encode('utf-8')
+
+def json_response(payload, status: int = 200):
+    start = time.perf_counter()
+    body = dump_json(payload)
+    observe_stage('serialize', time.perf_counter() - start)
+    return app.response_class(body, status=status, mimetype='application/json')
+
+def observe_stage(name: str, seconds: float):
+    """Add an API-side stage (response formatting, JSON encoding) to the recommender's metrics."""
+    if recommender is not None and recommender.metrics is not None:
+        recommender.metrics.observe_seconds(name, seconds)
+
+def metrics_text() -> str:
+    """Stage histograms and cache statistics in the Prometheus text format."""
+    if recommender is None or recommender.metrics is None:
+        return ''
+    return recommender.metrics.render() + render_gauges(
+        'recommender_cache', recommender.cache_stats(), 'Result cache statistic.'
+    )
+
+# Map allergens to dietary preferences
+ALLERGEN_MAPPING = {
+    'gluten': 'gluten_free',
+    'milk': 'dairy_free', 
+    'nuts': 'nut_free',
+    'soy': 'soy_free',
+    'eggs': 'egg_free'
+}
+
+# Ranking settings shared by the single and batch endpoints
+RECOMMEND_SETTINGS = {
+    'top_n': 10,
+    'min_similarity': 0.01,
+    'prioritize_health': True,
+    'ingredient_weight': 0.4
+}
+
+def process_filters(filters: Dict):
+    """Translate frontend filters into recommender filters and dietary preferences.
+
+    Raises ValueError for non-numeric nutritional filter values.
+    """
+    processed_filters = {}
     
-    results = []
-    for _, row in recommendations_df.iterrows():
-        try:
-            # Extract nutritional information
-            calories = row.get('energy-kcal_100g', 0)
-            protein = row.get('proteins_100g', 0)
-            sugar = row.get('sugars_100g', 0)
-            
-            
-            score = row.get('final_score', 0)
-            
-            # Get health category based on nutriscore or health score
-            nutriscore = row.get('nutriscore_grade', 'C')
-            health_score = row.get('health_score', 5)
-            
-            if health_score >= 7:
-                health_category = "Excellent"
-            elif health_score >= 5:
-                health_category = "Good"
-            elif health_score >= 3:
-                health_category = "Average"
-            else:
-                health_category = "Poor"
-            
-            product = {
-                "name": str(row.get('product_name', 'Unknown Product')),
-                "brand": str(row.get('brands', 'Unknown Brand')),
-                "score": float(score) if pd.notna(score) else 0.0,
-                "calories": int(calories) if pd.notna(calories) and calories > 0 else 0,
-                "protein": round(float(protein), 1) if pd.notna(protein) else 0.0,
-                "sugar": round(float(sugar), 1) if pd.notna(sugar) else 0.0,
-                "nutriscore": str(nutriscore).upper() if pd.notna(nutriscore) else "C",
-                "healthCategory": health_category,
-                "categories": str(row.get('categories', '')),
-                "ingredients": str(row.get('ingredients_text', '')),
-                "matched_ingredients": int(row.get('matched_ingredients', 0)) if 'matched_ingredients' in row else 0
-            }
-            results.append(product)
-        except Exception as e:
-            logger.error(f"Error formatting product: {str(e)}")
-            continue
+    # Nutritional filters
+    if filters.get('maxCalories'):
+        processed_filters['max_calories'] = float(filters['maxCalories'])
+    
+    if filters.get('maxSugar'):
+        processed_filters['max_sugar'] = float(filters['maxSugar'])
+    
+    if filters.get('minProtein'):
+        processed_filters['min_protein'] = float(filters['minProtein'])
+    
+    # NutriScore filter
+    if filters.get('nutriScore') and len(filters['nutriScore']) > 0:
+        processed_filters['nutriscore'] = filters['nutriScore']
+    
+    # Dietary preferences (allergen exclusions)
+    dietary_preferences = []
+    for allergen in filters.get('excludeAllergens', []):
+        if allergen in ALLERGEN_MAPPING:
+            dietary_preferences.append(ALLERGEN_MAPPING[allergen])
     
-    return results
+    return processed_filters, dietary_preferences
 
 @app.route('/health', methods=['GET'])
 def health_check():
     return jsonify({
         "status": "healthy",
-        "recommender_loaded": recommender is not None
+        "recommender_loaded": recommender is not None,
+        "refit_recommended": recommender is not None and recommender.refit_recommended()
     })
 
-@app.route('/recommend', methods=['POST'])
-def get_recommendations():
+@app.route('/cache-stats', methods=['GET'])
+def get_cache_stats():
     if recommender is None:
-        return jsonify({
+        return jsonify({"stats": {}})
+    
+    return jsonify({"stats": recommender.cache_stats() or {}})
+
+def recommend_response(data, is_json: bool = True) -> Tuple[Dict, int]:
+    """JSON payload and status code for a /recommend request body.
+
+    Shared by the Flask view and the async server (see asgi_app), which runs
+    it in a worker thread or process.
+    """
+    if recommender is None:
+        return {
             "error": "Recommender system not loaded",
             "recommendations": []
-        }), 500
+        }, 500
     
     try:
         # Add better error handling
-        if not request.is_json:
-            return jsonify({
+        if not is_json:
+            return {
                 "error": "Request must be JSON",
                 "recommendations": []
-            }), 400
+            }, 400
             
-        data = request.get_json()
-        if not data:
-            return jsonify({
+        if not data or not isinstance(data, dict):
+            return {
                 "error": "Invalid JSON data",
                 "recommendations": []
-            }), 400
+            }, 400
         
         # Extract parameters from request
         recipe_text = data.get('recipeText', '')
@@ -119,63 +273,70 @@ def get_recommendations():
         
         logger.info(f"Received request - Recipe: '{recipe_text[:50]}...', Ingredients: {ingredients}, Filters: {filters}")
       
-        processed_filters = {}
-        
-        # Nutritional filters
         try:
-            if filters.get('maxCalories'):
-                processed_filters['max_calories'] = float(filters['maxCalories'])
-            
-            if filters.get('maxSugar'):
-                processed_filters['max_sugar'] = float(filters['maxSugar'])
-            
-            if filters.get('minProtein'):
-                processed_filters['min_protein'] = float(filters['minProtein'])
+            processed_filters, dietary_preferences = process_filters(filters)
         except ValueError as e:
-            return jsonify({
+            return {
                 "error": f"Invalid numeric filter value: {str(e)}",
                 "recommendations": []
-            }), 400
+            }, 400
         
-        # NutriScore filter
-        if filters.get('nutriScore') and len(filters['nutriScore']) > 0:
-            processed_filters['nutriscore'] = filters['nutriScore']
+        try:
+            fields = parse_fields(data)
+            page_size = parse_page_size(data)
+        except ValueError as e:
+            return {
+                "error": str(e),
+                "recommendations": []
+            }, 400
         
-        # Dietary preferences (allergen exclusions)
-        dietary_preferences = []
-        exclude_allergens = filters.get('excludeAllergens', [])
+        # Per-stage timings in the response, when the client asks for them
+        timings = {} if data.get('debugTimings') else None
         
-        # Map allergens to dietary preferences
-        allergen_mapping = {
-            'gluten': 'gluten_free',
-            'milk': 'dairy_free', 
-            'nuts': 'nut_free',
-            'soy': 'soy_free',
-            'eggs': 'egg_free'
-        }
-        
-        for allergen in exclude_allergens:
-            if allergen in allergen_mapping:
-                dietary_preferences.append(allergen_mapping[allergen])
+        # Filter-only requests list the healthiest matching products
+        browse = not str(recipe_text).strip() and not any(str(ingredient).strip() for ingredient in ingredients or [])
         
         # Get recommendations from the model
-        recommendations_df = recommender.recommend(
-            recipe_text=recipe_text,
-            ingredients=ingredients,
-            dietary_preferences=dietary_preferences,
-            filters=processed_filters,
-            top_n=10,
-            min_similarity=0.01,
-            prioritize_health=True,
-            ingredient_weight=0.4
-        )
+        query = {
+            'recipe_text': recipe_text,
+            'ingredients': ingredients,
+            'dietary_preferences': dietary_preferences,
+            'filters': processed_filters,
+            'fields': result_fields(fields),
+            'as_frame': False,
+            'timings': timings,
+            'retrieval': 'browse' if browse else 'exact'
+        }
+        cursor = data.get('cursor')
+        paged = cursor is not None or page_size is not None
+        if cursor is not None:
+            # Later pages come from the candidates scored for the first one (scored again by other workers)
+            try:
+                recommendations, next_cursor = recommender.next_page(
+                    cursor, page_size or DEFAULT_PAGE_SIZE, fields=result_fields(fields),
+                    as_frame=False, timings=timings
+                )
+            except ValueError as e:
+                return {
+                    "error": str(e),
+                    "recommendations": []
+                }, 400
+        elif page_size is not None:
+            recommendations, next_cursor = recommender.recommend(
+                **query, page_size=page_size, **{**RECOMMEND_SETTINGS, 'top_n': MAX_PAGED_RESULTS}
+            )
+        else:
+            recommendations = recommender.recommend(**query, **RECOMMEND_SETTINGS)
         
         # Format response
-        formatted_results = format_recommendation_response(recommendations_df)
+        start = time.perf_counter()
+        formatted_results = format_recommendation_response(recommendations, fields)
+        format_seconds = time.perf_counter() - start
+        observe_stage('response_format', format_seconds)
         
         logger.info(f"Returning {len(formatted_results)} recommendations")
         
-        return jsonify({
+        response = {
             "recommendations": formatted_results,
             "total_found": len(formatted_results),
             "query_info": {
@@ -183,15 +344,148 @@ def get_recommendations():
                 "ingredients": ingredients,
                 "filters_applied": len(processed_filters) > 0 or len(dietary_preferences) > 0
             }
-        })
+        }
+        if paged:
+            response["next_cursor"] = next_cursor
+        if timings is not None:
+            timings['stages_ms']['response_format'] = round(format_seconds * 1000, 3)
+            response["debug_timings"] = timings
+        return response, 200
         
     except Exception as e:
         logger.error(f"Error processing recommendation request: {str(e)}")
         logger.error(traceback.format_exc())
-        return jsonify({
+        return {
             "error": f"Internal server error: {str(e)}",
             "recommendations": []
-        }), 500
+        }, 500
+
+def batch_response(data) -> Tuple[Dict, int]:
+    """JSON payload and status code for a /recommend/batch request body."""
+    if recommender is None:
+        return {
+            "error": "Recommender system not loaded",
+            "results": []
+        }, 500
+    
+    try:
+        if not isinstance(data, dict) or not isinstance(data.get('queries'), list):
+            return {
+                "error": "Request must be JSON with a 'queries' list",
+                "results": []
+            }, 400
+        
+        try:
+            fields = parse_fields(data)
+        except ValueError as e:
+            return {
+                "error": str(e),
+                "results": []
+            }, 400
+        
+        queries = []
+        for i, item in enumerate(data['queries']):
+            try:
+                processed_filters, dietary_preferences = process_filters(item.get('filters', {}))
+            except ValueError as e:
+                return {
+                    "error": f"Invalid numeric filter value in query {i}: {str(e)}",
+                    "results": []
+                }, 400
+            
+            queries.append({
+                'recipe_text': item.get('recipeText', ''),
+                'ingredients': item.get('ingredients', []),
+                'dietary_preferences': dietary_preferences,
+                'filters': processed_filters
+            })
+        
+        logger.info(f"Received batch request with {len(queries)} queries")
+        
+        recommendations = recommender.recommend_batch(
+            queries, fields=result_fields(fields), as_frame=False, **RECOMMEND_SETTINGS
+        )
+        
+        results = []
+        for result in recommendations:
+            formatted_results = format_recommendation_response(result, fields)
+            results.append({
+                "recommendations": formatted_results,
+                "total_found": len(formatted_results)
+            })
+        
+        return {"results": results}, 200
+        
+    except Exception as e:
+        logger.error(f"Error processing batch recommendation request: {str(e)}")
+        logger.error(traceback.format_exc())
+        return {
+            "error": f"Internal server error: {str(e)}",
+            "results": []
+        }, 500
+
+def similar_response(args: Dict[str, str]) -> Tuple[Dict, int]:
+    """JSON payload and status code for a /similar-products request (query arguments)."""
+    if recommender is None:
+        return {
+            "error": "Recommender system not loaded",
+            "recommendations": []
+        }, 500
+    
+    if recommender.neighbour_graph is None:
+        return {
+            "error": "Similar products are not available for this model",
+            "recommendations": []
+        }, 404
+    
+    product_id = args.get('id', '')
+    try:
+        k = int(args.get('k', 10))
+        if pd.api.types.is_integer_dtype(recommender.df.index):
+            product_id = int(product_id)
+    except ValueError as e:
+        return {
+            "error": f"Invalid parameter: {str(e)}",
+            "recommendations": []
+        }, 400
+    healthier_only = args.get('healthierOnly', '').lower() in ('1', 'true', 'yes')
+    
+    try:
+        similar = recommender.similar_products(
+            product_id, k, healthier_only, fields=result_fields(list(RESPONSE_FIELDS)), as_frame=False
+        )
+    except KeyError:
+        return {
+            "error": f"Unknown product {args.get('id', '')!r}",
+            "recommendations": []
+        }, 404
+    
+    formatted_results = format_recommendation_response(similar)
+    return {
+        "recommendations": formatted_results,
+        "total_found": len(formatted_results),
+        "product_id": args.get('id', ''),
+        "healthier_only": healthier_only
+    }, 200
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    return app.response_class(metrics_text(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/recommend', methods=['POST'])
+def get_recommendations():
+    payload, status = recommend_response(request.get_json(silent=True), request.is_json)
+    return json_response(payload, status)
+
+@app.route('/recommend/batch', methods=['POST'])
+def get_batch_recommendations():
+    payload, status = batch_response(request.get_json(silent=True))
+    return json_response(payload, status)
+
+@app.route('/similar-products', methods=['GET'])
+def get_similar_products():
+    payload, status = similar_response(request.args.to_dict())
+    return json_response(payload, status)
 
 @app.route('/ingredient-suggestions', methods=['GET'])
 def get_ingredient_suggestions():
@@ -217,10 +511,10 @@ def get_ingredient_suggestions():
         logger.error(f"Error getting ingredient suggestions: {str(e)}")
         return jsonify({"suggestions": []})
 
-@app.route('/dietary-options', methods=['GET'])
-def get_dietary_options():
+def dietary_options_response() -> Tuple[Dict, int]:
+    """JSON payload and status code for a /dietary-options request."""
     if recommender is None:
-        return jsonify({"options": {}})
+        return {"options": {}}, 200
     
     try:
         if hasattr(recommender, 'get_dietary_options'):
@@ -231,20 +525,18 @@ def get_dietary_options():
                 "allergens": ["gluten", "milk", "nuts", "soy", "eggs"],
                 "nutriscore": ["A", "B", "C", "D", "E"]
             }
-        return jsonify({"options": options})
+        return {"options": options}, 200
         
     except Exception as e:
         logger.error(f"Error getting dietary options: {str(e)}")
-        return jsonify({"options": {}})
-    
+        return {"options": {}}, 200
 
-@app.route('/nutrition-summary', methods=['POST'])
-def get_nutrition_summary():
+def nutrition_summary_response(data) -> Tuple[Dict, int]:
+    """JSON payload and status code for a /nutrition-summary request body."""
     if recommender is None:
-        return jsonify({"summary": {}})
+        return {"summary": {}}, 200
     
     try:
-        data = request.get_json()
         indices = data.get('indices', [])
         
         if hasattr(recommender, 'get_nutrition_summary'):
@@ -252,11 +544,36 @@ def get_nutrition_summary():
         else:
             summary = {"message": "Nutrition summary not available"}
         
-        return jsonify({"summary": summary})
+        return {"summary": summary}, 200
         
     except Exception as e:
         logger.error(f"Error getting nutrition summary: {str(e)}")
-        return jsonify({"summary": {}})
+        return {"summary": {}}, 200
+
+def frontend_file(path: str) -> Optional[Tuple[bytes, str]]:
+    """Body and content type of the index page or a static file, for servers other than Flask (see asgi_app)."""
+    if path == '/':
+        with app.test_request_context('/'):
+            return render_template('index.html').encode('utf-8'), 'text/html; charset=utf-8'
+    
+    prefix = app.static_url_path + '/'
+    if not path.startswith(prefix):
+        return None
+    filename = safe_join(app.static_folder, path[len(prefix):])
+    if filename is None or not os.path.isfile(filename):
+        return None
+    with open(filename, 'rb') as f:
+        return f.read(), mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+@app.route('/dietary-options', methods=['GET'])
+def get_dietary_options():
+    payload, status = dietary_options_response()
+    return json_response(payload, status)
+
+@app.route('/nutrition-summary', methods=['POST'])
+def get_nutrition_summary():
+    payload, status = nutrition_summary_response(request.get_json(silent=True))
+    return json_response(payload, status)
 
 if __name__ == '__main__':
     model_loaded = load_recommender()
@@ -0,0 +1,245 @@
+"""Async (ASGI) variant of the recommender API.
+
+Every endpoint of the Flask app is served, through the same handlers. Scoring
+is CPU-bound, so ``/recommend``, ``/recommend/batch`` and
+``/nutrition-summary`` (``app.recommend_response`` and friends) run in a
+bounded thread or process pool, while the event loop keeps accepting
+connections. When every worker is busy and the queue is full, requests are
+rejected immediately with 429; requests waiting longer than the timeout get 504.
+
+Run it with any ASGI server, e.g.::
+
+    python serve.py asgi --model recipe_recommender --workers 4
+    uvicorn --factory asgi_app:create_app      # configured via RECOMMENDER_* variables
+"""
+import asyncio
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+from urllib.parse import parse_qs
+
+import app as api
+
+# Largest accepted request body
+MAX_BODY_BYTES = 1024 * 1024
+
+# Origins allowed to call the API from a browser (same as the Flask app)
+ALLOWED_ORIGINS = ('http://localhost:5000', 'http://127.0.0.1:5000')
+
+
+class Overloaded(Exception):
+    """Raised when the worker pool and its queue are full."""
+
+
+def _load_worker_model(model_path: str):
+    # Forked workers inherit the parent's model; spawned ones load their own
+    if api.recommender is None and not api.load_recommender(model_path):
+        raise RuntimeError(f"Could not load model from {model_path}")
+
+
+class RecommendPool:
+    """Runs blocking handlers in a thread or process pool with bounded admission.
+
+    At most ``workers + queue_size`` calls are admitted at once; beyond that
+    ``run`` raises ``Overloaded``. A call that times out keeps its slot until
+    its worker actually finishes, so the bound also covers abandoned work.
+    """
+
+    def __init__(self, kind: str = 'thread', workers: int = 4, queue_size: int = 64,
+                 timeout: float = 10.0, model_path: Optional[str] = None):
+        if kind == 'process':
+            self.executor = ProcessPoolExecutor(workers, initializer=_load_worker_model, initargs=(model_path,))
+        elif kind == 'thread':
+            self.executor = ThreadPoolExecutor(workers, thread_name_prefix='recommend')
+        else:
+            raise ValueError(f"Unknown pool kind {kind!r} (expected 'thread' or 'process')")
+        self.kind = kind
+        self.capacity = workers + queue_size
+        self.timeout = timeout
+        self.in_flight = 0
+
+    async def run(self, func, *args):
+        # Only touched from the event loop thread, so no lock is needed
+        if self.in_flight >= self.capacity:
+            raise Overloaded()
+        self.in_flight += 1
+
+        future = asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+        future.add_done_callback(self._release)
+        return await asyncio.wait_for(asyncio.shield(future), self.timeout)
+
+    def _release(self, _):
+        self.in_flight -= 1
+
+    def stats(self) -> Dict:
+        return {'kind': self.kind, 'in_flight': self.in_flight, 'capacity': self.capacity}
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+class RecommenderASGI:
+    def __init__(self, pool: RecommendPool):
+        self.pool = pool
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+
+        headers = {name.decode('latin-1').lower(): value.decode('latin-1') for name, value in scope['headers']}
+        cors = {}
+        if headers.get('origin') in ALLOWED_ORIGINS:
+            cors = {'access-control-allow-origin': headers['origin'], 'vary': 'Origin'}
+
+        if scope['method'] == 'OPTIONS':
+            await self._send(send, 204, None, {
+                **cors,
+                'access-control-allow-methods': 'GET, POST, OPTIONS',
+                'access-control-allow-headers': 'Content-Type'
+            })
+            return
+
+        body = await self._read_body(receive)
+        if body is None:
+            await self._send(send, 413, {"error": "Request body too large"}, cors)
+            return
+
+        if (scope['method'], scope['path']) == ('GET', '/metrics'):
+            # Metrics of this process; with a process pool, scoring stages are recorded in the workers
+            await self._send_body(send, 200, api.metrics_text().encode('utf-8'), 'text/plain; version=0.0.4', cors)
+            return
+
+        if scope['method'] == 'GET' and (scope['path'] == '/' or scope['path'].startswith('/static/')):
+            # The web frontend, as the Flask app serves it
+            found = api.frontend_file(scope['path'])
+            if found is None:
+                await self._send(send, 404, {"error": "Not found"}, cors)
+            else:
+                await self._send_body(send, 200, found[0], found[1], cors)
+            return
+
+        payload, status, extra = await self._dispatch(scope, headers, body)
+        await self._send(send, status, payload, {**cors, **extra})
+
+    async def _dispatch(self, scope, headers: Dict[str, str], body: bytes) -> Tuple[Dict, int, Dict]:
+        route = (scope['method'], scope['path'])
+
+        if route == ('GET', '/health'):
+            recommender = api.recommender
+            return {
+                "status": "healthy",
+                "recommender_loaded": recommender is not None,
+                "refit_recommended": recommender is not None and recommender.refit_recommended(),
+                "pool": self.pool.stats()
+            }, 200, {}
+
+        if route == ('GET', '/cache-stats'):
+            stats = api.recommender.cache_stats() if api.recommender is not None else None
+            return {"stats": stats or {}}, 200, {}
+
+        if route == ('GET', '/ingredient-suggestions'):
+            # Suffix-array lookups are fast enough to answer on the event loop
+            query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+            partial = query.get('q', [''])[0]
+            try:
+                limit = int(query.get('limit', ['10'])[0])
+            except ValueError:
+                return {"suggestions": []}, 200, {}
+            suggestions = api.recommender.get_ingredient_suggestions(partial, limit) if api.recommender else []
+            return {"suggestions": suggestions, "query": partial}, 200, {}
+
+        if route == ('GET', '/dietary-options'):
+            payload, status = api.dietary_options_response()
+            return payload, status, {}
+
+        if route == ('GET', '/similar-products'):
+            # A neighbour graph row read plus formatting k products, also answered on the event loop
+            query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+            payload, status = api.similar_response({name: values[0] for name, values in query.items()})
+            return payload, status, {}
+
+        if route in (('POST', '/recommend'), ('POST', '/recommend/batch'), ('POST', '/nutrition-summary')):
+            is_json = headers.get('content-type', '').split(';')[0].strip() == 'application/json'
+            try:
+                data = json.loads(body) if is_json and body else None
+            except ValueError:
+                data = None
+
+            handlers = {
+                '/recommend': (api.recommend_response, data, is_json),
+                '/recommend/batch': (api.batch_response, data),
+                '/nutrition-summary': (api.nutrition_summary_response, data)
+            }
+            try:
+                payload, status = await self.pool.run(*handlers[route[1]])
+            except Overloaded:
+                return {"error": "Server busy, retry later"}, 429, {'retry-after': '1'}
+            except asyncio.TimeoutError:
+                return {"error": "Request timed out"}, 504, {}
+            return payload, status, {}
+
+        return {"error": "Not found"}, 404, {}
+
+    @staticmethod
+    async def _read_body(receive) -> Optional[bytes]:
+        chunks, size = [], 0
+        while True:
+            message = await receive()
+            chunk = message.get('body', b'')
+            size += len(chunk)
+            if size > MAX_BODY_BYTES:
+                return None
+            chunks.append(chunk)
+            if not message.get('more_body', False):
+                return b''.join(chunks)
+
+    @classmethod
+    async def _send(cls, send, status: int, payload: Optional[Dict], headers: Dict[str, str]):
+        if payload is None:
+            await cls._send_body(send, status, b'', None, headers)
+        else:
+            await cls._send_body(send, status, api.dump_json(payload), 'application/json', headers)
+
+    @staticmethod
+    async def _send_body(send, status: int, body: bytes, content_type: Optional[str], headers: Dict[str, str]):
+        response_headers = [(b'content-length', str(len(body)).encode())]
+        if content_type is not None:
+            response_headers.append((b'content-type', content_type.encode('latin-1')))
+        response_headers.extend((name.encode('latin-1'), value.encode('latin-1')) for name, value in headers.items())
+
+        await send({'type': 'http.response.start', 'status': status, 'headers': response_headers})
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.pool.shutdown()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+def create_app(model_path: Optional[str] = None, pool: Optional[str] = None, workers: Optional[int] = None,
+               queue_size: Optional[int] = None, timeout: Optional[float] = None) -> RecommenderASGI:
+    """Load the model once and build the ASGI application.
+
+    Unset arguments fall back to the ``RECOMMENDER_MODEL``, ``RECOMMENDER_POOL``,
+    ``RECOMMENDER_WORKERS``, ``RECOMMENDER_QUEUE_SIZE`` and
+    ``RECOMMENDER_TIMEOUT`` environment variables.
+    """
+    model_path = model_path or os.environ.get('RECOMMENDER_MODEL', 'recipe_recommender2.pkl')
+    pool = pool or os.environ.get('RECOMMENDER_POOL', 'thread')
+    workers = workers or int(os.environ.get('RECOMMENDER_WORKERS', os.cpu_count() or 1))
+    queue_size = queue_size if queue_size is not None else int(os.environ.get('RECOMMENDER_QUEUE_SIZE', 64))
+    timeout = timeout or float(os.environ.get('RECOMMENDER_TIMEOUT', 10.0))
+
+    # Loaded before the pool starts, so forked process workers share it copy-on-write
+    if not api.load_recommender(model_path):
+        raise RuntimeError(f"Could not load model from {model_path}")
+    return RecommenderASGI(RecommendPool(pool, workers, queue_size, timeout, model_path))
@@ -0,0 +1,8 @@
+"""Benchmarks for the recommender on synthetic Open Food Facts-like catalogs.
+
+Run ``python -m benchmarks --help`` from the repository root.
+"""
+from benchmarks.synthetic_catalog import generate_catalog, write_catalog_csv
+from benchmarks.suite import run_size, run_isolated
+
+__all__ = ['generate_catalog', 'write_catalog_csv', 'run_size', 'run_isolated']
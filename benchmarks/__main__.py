@@ -0,0 +1,81 @@
+"""Command line entry point of the benchmark suite.
+
+Usage::
+
+    python -m benchmarks --sizes 10k 100k --output results.json
+    python -m benchmarks --sizes 1m 5m --fit-from-csv --retrieval exact inverted
+    python -m benchmarks --sizes 5m --fit-from-csv --term-counts hashed   # bounded-memory vocabulary counting
+    python -m benchmarks --sizes 100k --compare results.json   # exits 1 on regressions
+"""
+import argparse
+import json
+import sys
+
+from benchmarks.suite import SIZES, compare, environment, parse_size, run_isolated
+
+
+def print_table(report):
+    for run in report['results']:
+        fit = run['fit']
+        print(f"\n{run['products']:,} products  generate {run['generate_seconds']:.1f}s  "
+              f"fit {fit['total_seconds']:.1f}s  load {run['load_seconds']:.2f}s  "
+              f"artifact {run['save']['size_mb']} MB  peak RSS {max(run['peak_rss_mb'].values())} MB")
+        print('  fit stages: ' + ', '.join(f'{stage} {seconds:.2f}s' for stage, seconds in fit['stages'].items()))
+        if 'peak_rss_mb' in fit:
+            print('  fit peak RSS: ' + ', '.join(f'{stage} {mb:.0f} MB' for stage, mb in fit['peak_rss_mb'].items()))
+        print(f"  {'recommend':<24}{'p50 ms':>9}{'p95 ms':>9}{'mean ms':>9}{'results':>9}")
+        for name, stats in run['recommend'].items():
+            print(f"  {name:<24}{stats['p50_ms']:>9.2f}{stats['p95_ms']:>9.2f}"
+                  f"{stats['mean_ms']:>9.2f}{stats['mean_results']:>9.1f}")
+        stats = run['suggestions']
+        print(f"  {'suggestions':<24}{stats['p50_ms']:>9.2f}{stats['p95_ms']:>9.2f}{stats['mean_ms']:>9.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the recommender on synthetic catalogs")
+    parser.add_argument('--sizes', nargs='+', default=['10k', '100k'],
+                        help=f"catalog sizes ({', '.join(SIZES)} or a number of products)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--queries', type=int, default=50, help='queries per filter scenario')
+    parser.add_argument('--retrieval', nargs='+', default=['exact'], choices=['exact', 'ann', 'inverted', 'bm25'])
+    parser.add_argument('--fit-from-csv', action='store_true',
+                        help='write the catalog to CSV and fit with from_csv (needed for the largest sizes)')
+    parser.add_argument('--term-counts', default='exact', choices=['exact', 'hashed'],
+                        help='how --fit-from-csv counts n-grams (hashed: bounded memory, one more read)')
+    parser.add_argument('--scoring-threads', type=int, default=0,
+                        help='score queries over row shards with this many threads (0: serial)')
+    parser.add_argument('--workdir', help='directory for temporary catalogs and artifacts')
+    parser.add_argument('--output', help='write the JSON report to this file')
+    parser.add_argument('--json', action='store_true', help='print the JSON report instead of a table')
+    parser.add_argument('--compare', help='baseline JSON report to check for regressions')
+    parser.add_argument('--threshold', type=float, default=0.2, help='slowdown counted as a regression')
+    args = parser.parse_args()
+
+    report = {'environment': environment(), 'results': []}
+    for size in args.sizes:
+        report['results'].append(run_isolated(
+            parse_size(size), seed=args.seed, n_queries=args.queries, retrieval=args.retrieval,
+            fit_from_csv=args.fit_from_csv, workdir=args.workdir, scoring_threads=args.scoring_threads,
+            term_counts=args.term_counts
+        ))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=1)
+    if args.json:
+        print(json.dumps(report, indent=1))
+    else:
+        print_table(report)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), report, args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression['products']:,} products {regression['metric']}: "
+                  f"{regression['baseline']} -> {regression['current']} ({regression['ratio']}x)", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
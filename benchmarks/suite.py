@@ -0,0 +1,245 @@
+"""Fit, load and query benchmarks of ``RecipeProductRecommender`` on synthetic catalogs.
+
+Every catalog size runs in a fresh process, so the reported peak RSS belongs
+to that size alone. Per size the suite records:
+
+- ``generate``: time to build the synthetic catalog (or write it to CSV);
+- ``fit``: total fit time and the per-stage ``fit_timings``
+  (``prepare_text``, ``general_vectorizer``, ... or the ``from_csv`` stages),
+  plus the build time of any retrieval index needed; ``from_csv`` fits also
+  report the running peak RSS after each of their stages;
+- ``save``/``load``: artifact save time, size on disk and memory-mapped load time;
+- ``recommend``: latency percentiles per filter scenario and retrieval mode,
+  measured on the loaded artifact with the result cache off;
+- ``suggestions``: ``get_ingredient_suggestions`` latency percentiles;
+- ``peak_rss_mb``: running peak RSS after each phase.
+"""
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from multiprocessing import get_context
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from benchmarks.synthetic_catalog import (BASE_INGREDIENTS, CATEGORIES, FLAVOURS, generate_catalog,
+                                          write_catalog_csv)
+
+# Catalog sizes accepted by name
+SIZES = {'10k': 10000, '100k': 100000, '1m': 1000000, '5m': 5000000}
+
+# recommend() filter combinations, as (filters, dietary_preferences)
+FILTER_SCENARIOS = {
+    'none': ({}, []),
+    'nutrition': ({'max_calories': 300, 'max_sugar': 10}, []),
+    'dietary': ({}, ['gluten_free', 'dairy_free']),
+    'nutriscore': ({'nutriscore': ['a', 'b']}, []),
+    'brand': ({'brands': ['Carrefour']}, []),
+    'selective': ({'max_calories': 150, 'min_protein': 10, 'nutriscore': ['a']}, ['gluten_free'])
+}
+
+# Prefixes timed against the ingredient suggestion index
+SUGGESTION_PREFIXES = ['su', 'fa', 'la', 'cho', 'hui', 'noi', 'to', 'sel', 'beu', 'e3', 'pom', 'xq']
+
+# Ranking settings, as used by the API
+RECOMMEND_SETTINGS = {'top_n': 10, 'min_similarity': 0.01, 'prioritize_health': True, 'ingredient_weight': 0.4}
+
+
+def parse_size(value: str) -> int:
+    """Catalog size from a name in ``SIZES`` or a plain number."""
+    return SIZES[value.lower()] if value.lower() in SIZES else int(value)
+
+
+def sample_queries(n_queries: int, seed: int = 0) -> List[Dict]:
+    """Recipe-like queries: a product noun and flavour plus two or three common ingredients."""
+    rng = np.random.default_rng([seed, 3])
+    nouns = [noun for nouns, *_ in CATEGORIES.values() for noun in nouns]
+    common = BASE_INGREDIENTS[:60]
+
+    queries = []
+    for _ in range(n_queries):
+        ingredients = rng.choice(common, rng.integers(2, 4), replace=False).tolist()
+        queries.append({'recipe_text': f'{rng.choice(nouns)} {rng.choice(FLAVOURS)}', 'ingredients': ingredients})
+    return queries
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process so far, in MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def percentiles(seconds: List[float]) -> Dict[str, float]:
+    ms = np.array(seconds) * 1000
+    return {
+        'p50_ms': round(float(np.percentile(ms, 50)), 3),
+        'p95_ms': round(float(np.percentile(ms, 95)), 3),
+        'p99_ms': round(float(np.percentile(ms, 99)), 3),
+        'mean_ms': round(float(ms.mean()), 3)
+    }
+
+
+def directory_size_mb(path: str) -> float:
+    size = sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+    return round(size / 1e6, 1)
+
+
+def run_size(n_products: int, seed: int = 0, n_queries: int = 50, retrieval: List[str] = ('exact',),
+             fit_from_csv: bool = False, workdir: Optional[str] = None, scoring_threads: int = 0,
+             term_counts: str = 'exact') -> Dict:
+    """Benchmark one catalog size in the current process.
+
+    With ``scoring_threads`` above 1, queries are scored with ``enable_parallel_scoring``.
+    ``term_counts`` is passed to ``from_csv`` when fitting from CSV.
+    """
+    from recommender import RecipeProductRecommender
+
+    workdir = tempfile.mkdtemp(prefix='recommender-bench-', dir=workdir)
+    result = {'products': n_products, 'seed': seed, 'fit_from_csv': fit_from_csv, 'scoring_threads': scoring_threads,
+              'term_counts': term_counts, 'peak_rss_mb': {}}
+    try:
+        start = time.perf_counter()
+        if fit_from_csv:
+            catalog = write_catalog_csv(os.path.join(workdir, 'catalog.csv'), n_products, seed)
+        else:
+            catalog = generate_catalog(n_products, seed)
+        result['generate_seconds'] = round(time.perf_counter() - start, 3)
+        result['peak_rss_mb']['generate'] = peak_rss_mb()
+
+        start = time.perf_counter()
+        if fit_from_csv:
+            recommender = RecipeProductRecommender.from_csv(catalog, term_counts=term_counts)
+        else:
+            recommender = RecipeProductRecommender(catalog)
+        del catalog
+        fit = {'total_seconds': round(time.perf_counter() - start, 3),
+               'stages': {stage: round(seconds, 3) for stage, seconds in recommender.fit_timings.items()}}
+        if recommender.fit_peak_rss_mb:
+            fit['peak_rss_mb'] = dict(recommender.fit_peak_rss_mb)
+        if 'ann' in retrieval:
+            fit['ann_index'] = recommender.build_ann_index()
+        if 'inverted' in retrieval or 'bm25' in retrieval:
+            fit['inverted_index'] = recommender.build_inverted_index()
+        result['fit'] = fit
+        result['vocabulary'] = {
+            'general': len(recommender.vectorizer.vocabulary_),
+            'ingredient': len(recommender.ingredient_vectorizer.vocabulary_) if recommender.ingredient_vectorizer else 0
+        }
+        result['peak_rss_mb']['fit'] = peak_rss_mb()
+
+        artifact = os.path.join(workdir, 'model')
+        start = time.perf_counter()
+        recommender.save(artifact)
+        result['save'] = {'seconds': round(time.perf_counter() - start, 3), 'size_mb': directory_size_mb(artifact)}
+        del recommender
+
+        start = time.perf_counter()
+        recommender = RecipeProductRecommender.load(artifact)
+        result['load_seconds'] = round(time.perf_counter() - start, 3)
+        result['peak_rss_mb']['load'] = peak_rss_mb()
+        if scoring_threads > 1:
+            recommender.enable_parallel_scoring(scoring_threads)
+
+        queries = sample_queries(n_queries, seed)
+        result['recommend'] = {}
+        for mode in retrieval:
+            for scenario, (filters, dietary_preferences) in FILTER_SCENARIOS.items():
+                latencies, found = [], 0
+                for query in queries:
+                    start = time.perf_counter()
+                    recommendations = recommender.recommend(
+                        **query, filters=filters, dietary_preferences=dietary_preferences,
+                        retrieval=mode, as_frame=False, **RECOMMEND_SETTINGS
+                    )
+                    latencies.append(time.perf_counter() - start)
+                    found += len(recommendations)
+                result['recommend'][f'{mode}/{scenario}'] = {
+                    **percentiles(latencies), 'mean_results': round(found / len(queries), 2)
+                }
+        result['peak_rss_mb']['recommend'] = peak_rss_mb()
+
+        latencies = []
+        for _ in range(5):
+            for prefix in SUGGESTION_PREFIXES:
+                start = time.perf_counter()
+                recommender.get_ingredient_suggestions(prefix)
+                latencies.append(time.perf_counter() - start)
+        result['suggestions'] = percentiles(latencies)
+        result['peak_rss_mb']['suggestions'] = peak_rss_mb()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return result
+
+
+def run_isolated(n_products: int, **kwargs) -> Dict:
+    """``run_size`` in a fresh process, so memory from other sizes does not count."""
+    with ProcessPoolExecutor(1, mp_context=get_context('spawn')) as pool:
+        return pool.submit(run_size, n_products, **kwargs).result()
+
+
+def environment() -> Dict:
+    """Versions and machine details stored with the results."""
+    import pandas
+    import scipy
+    import sklearn
+
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))).stdout.strip()
+    except OSError:
+        commit = ''
+    return {
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'commit': commit or None,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pandas.__version__,
+        'scipy': scipy.__version__,
+        'sklearn': sklearn.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count()
+    }
+
+
+def flatten(result: Dict, prefix: str = '') -> Dict[str, float]:
+    """Numeric metrics of one size's result, keyed by dotted path."""
+    metrics = {}
+    for key, value in result.items():
+        name = f'{prefix}{key}'
+        if isinstance(value, dict):
+            metrics.update(flatten(value, f'{name}.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            metrics[name] = value
+    return metrics
+
+
+def compare(baseline: Dict, current: Dict, threshold: float = 0.2) -> List[Dict]:
+    """Timing and memory metrics that got worse than ``baseline`` by more than ``threshold``.
+
+    Runs are matched by catalog size, fit mode, term counting and scoring threads.
+    """
+    def key(run):
+        return run['products'], run['fit_from_csv'], run.get('term_counts', 'exact'), run.get('scoring_threads', 0)
+
+    previous = {key(run): flatten(run) for run in baseline['results']}
+    regressions = []
+    for run in current['results']:
+        before = previous.get(key(run))
+        if before is None:
+            continue
+        for name, value in flatten(run).items():
+            if not (name.endswith('_ms') or name.endswith('seconds') or 'peak_rss_mb' in name):
+                continue
+            old = before.get(name)
+            if old and value > old * (1 + threshold):
+                regressions.append({'products': run['products'], 'metric': name, 'baseline': old,
+                                    'current': value, 'ratio': round(value / old, 2)})
+    return regressions
@@ -0,0 +1,349 @@
+"""Synthetic Open Food Facts-like product catalogs.
+
+Catalogs have the columns of ``French-dataset/cleaned_data.csv`` with
+distributions shaped like the real export:
+
+- ingredients follow a Zipf law over a vocabulary with a long tail of
+  qualified ingredients and additives, so the TF-IDF vocabularies keep
+  growing with the catalog size;
+- each category has a nutrition profile and signature ingredients, and
+  product names are built from category nouns and flavours;
+- brands are Zipf-distributed over a few dozen real brands plus a long tail
+  of generated ones, whose count grows with the catalog;
+- allergens, dietary flags, ``health_flags`` and ``allergen_friendly`` are
+  derived with the rules of the cleaning notebook, and some values are
+  missing, as in the export.
+
+Generation is deterministic in ``(n_products, seed)`` and works in chunks
+of ``CHUNK_SIZE`` products, so multi-million product catalogs can be
+written to CSV without holding them in memory.
+"""
+import numpy as np
+import pandas as pd
+from typing import Dict, Iterator, List, Tuple
+
+# Ingredients, most common first (their Zipf rank)
+BASE_INGREDIENTS = [
+    'sucre', 'eau', 'sel', 'farine de blé', 'huile de tournesol', 'lait écrémé en poudre', 'beurre',
+    'huile de palme', 'amidon de maïs', 'sirop de glucose', 'oeufs', 'lait', 'crème', 'arôme naturel',
+    'levure', 'cacao maigre en poudre', 'lécithine de soja', 'huile de colza', 'vinaigre', 'tomates',
+    'oignons', 'ail', 'poivre', 'dextrose', 'fromage', 'jus de citron concentré', 'gluten de blé',
+    'pâte de cacao', 'beurre de cacao', 'noisettes', 'amandes', 'lactosérum', 'protéines de lait',
+    'huile d\'olive vierge extra', 'fécule de pomme de terre', 'farine de riz', 'riz', 'semoule de blé dur',
+    'viande de porc', 'poulet', 'boeuf', 'jambon', 'saumon', 'thon', 'lait entier', 'yaourt', 'fraises',
+    'pommes', 'abricots', 'framboises', 'bananes', 'citron', 'orange', 'vanille', 'cannelle', 'miel',
+    'flocons d\'avoine', 'orge', 'seigle', 'épeautre', 'chocolat noir', 'chocolat au lait', 'caramel',
+    'pistaches', 'noix', 'cacahuètes', 'sésame', 'moutarde', 'persil', 'basilic', 'thym', 'origan',
+    'champignons', 'carottes', 'pommes de terre', 'petits pois', 'haricots verts', 'courgettes',
+    'poivrons', 'épinards', 'lentilles', 'pois chiches', 'maïs', 'soja', 'tofu', 'sirop d\'agave',
+    'sucre de canne', 'fructose', 'maltodextrine', 'gélatine', 'pectine', 'agar-agar', 'acide citrique',
+    'bicarbonate de sodium', 'poudre à lever', 'extrait de malt d\'orge', 'lait de coco', 'coco râpée',
+    'raisins secs', 'dattes', 'figues', 'pruneaux', 'mangue', 'ananas', 'fruit de la passion',
+    'wheat flour', 'sugar', 'salt', 'water', 'palm oil', 'milk', 'eggs', 'butter', 'cocoa butter',
+    'skimmed milk powder', 'soy lecithin', 'natural flavouring', 'hazelnuts', 'almonds', 'peanuts',
+    'glucose syrup', 'whey powder', 'vegetable oil', 'rapeseed oil', 'yeast', 'oats', 'barley malt'
+]
+
+# Qualifiers and additives forming the long tail of rare ingredients
+QUALIFIERS = ['bio', 'en poudre', 'déshydraté', 'concentré', 'de France', 'issu de l\'agriculture biologique',
+              'réhydraté', 'torréfié', 'fumé', 'grillé', 'caramélisé', 'aromatisé', 'équitable',
+              'de Bretagne', 'd\'Italie', 'd\'Espagne', 'frais', 'surgelé', 'entier', 'demi-écrémé']
+ADDITIVES = [f'E{number}' for number in list(range(100, 200, 2)) + list(range(300, 342)) + list(range(400, 480, 2))]
+
+# Products generated per chunk; each chunk has its own random stream
+CHUNK_SIZE = 100000
+
+# Zipf exponent of the ingredient and brand frequencies
+ZIPF_EXPONENT = 1.07
+
+# Category hierarchy -> (product nouns, signature ingredients,
+# mean energy kcal, carbohydrates, sugar share of carbohydrates, proteins, fat) per 100g
+CATEGORIES = {
+    'Snacks, Snacks sucrés, Biscuits et gâteaux, Biscuits': (
+        ['Biscuits', 'Sablés', 'Cookies', 'Galettes', 'Petits beurre'],
+        ['farine de blé', 'sucre', 'beurre'], 470, 68, 0.4, 6, 19),
+    'Snacks, Snacks sucrés, Cacao et dérivés, Chocolats': (
+        ['Chocolat', 'Tablette de chocolat', 'Bouchées', 'Pralinés'],
+        ['sucre', 'pâte de cacao', 'beurre de cacao'], 540, 50, 0.9, 7, 33),
+    'Snacks, Snacks salés, Chips et frites': (
+        ['Chips', 'Tortillas', 'Crackers', 'Bretzels'],
+        ['pommes de terre', 'huile de tournesol', 'sel'], 520, 52, 0.05, 6, 31),
+    'Produits laitiers, Desserts lactés, Yaourts': (
+        ['Yaourt', 'Fromage blanc', 'Skyr', 'Petits suisses'],
+        ['lait', 'yaourt', 'protéines de lait'], 80, 10, 0.8, 5, 2),
+    'Produits laitiers, Fromages': (
+        ['Fromage', 'Camembert', 'Emmental', 'Comté', 'Chèvre'],
+        ['lait', 'sel', 'fromage'], 350, 1, 0.5, 23, 28),
+    'Boissons, Jus de fruits': (
+        ['Jus', 'Nectar', 'Pur jus', 'Smoothie'],
+        ['eau', 'jus de citron concentré', 'orange'], 45, 10, 0.95, 0.5, 0.1),
+    'Boissons, Sodas': (
+        ['Soda', 'Limonade', 'Cola', 'Thé glacé'],
+        ['eau', 'sucre', 'acide citrique'], 38, 9.5, 1.0, 0, 0),
+    'Aliments d\'origine végétale, Céréales et dérivés, Pâtes alimentaires': (
+        ['Pâtes', 'Spaghetti', 'Penne', 'Tagliatelles', 'Fusilli'],
+        ['semoule de blé dur', 'eau', 'oeufs'], 355, 70, 0.05, 12, 1.5),
+    'Aliments d\'origine végétale, Céréales et dérivés, Céréales pour petit-déjeuner': (
+        ['Céréales', 'Muesli', 'Granola', 'Pétales de maïs'],
+        ['flocons d\'avoine', 'sucre', 'maïs'], 400, 70, 0.3, 9, 8),
+    'Épicerie, Sauces': (
+        ['Sauce', 'Ketchup', 'Mayonnaise', 'Pesto', 'Sauce tomate'],
+        ['tomates', 'huile de colza', 'vinaigre'], 180, 15, 0.5, 2, 12),
+    'Épicerie, Confitures et pâtes à tartiner': (
+        ['Confiture', 'Pâte à tartiner', 'Gelée', 'Compote'],
+        ['sucre', 'fraises', 'pectine'], 260, 60, 0.9, 1, 2),
+    'Boulangerie, Pains': (
+        ['Pain', 'Pain de mie', 'Baguette', 'Brioche', 'Pain complet'],
+        ['farine de blé', 'eau', 'levure'], 270, 50, 0.1, 9, 4),
+    'Viandes, Charcuteries': (
+        ['Jambon', 'Saucisson', 'Rillettes', 'Pâté', 'Lardons'],
+        ['viande de porc', 'sel', 'poivre'], 250, 1.5, 0.5, 18, 19),
+    'Produits de la mer, Poissons': (
+        ['Saumon fumé', 'Thon', 'Filets de maquereau', 'Sardines'],
+        ['saumon', 'sel', 'huile de tournesol'], 190, 0.5, 0.5, 22, 11),
+    'Plats préparés, Pizzas': (
+        ['Pizza', 'Quiche', 'Tarte salée', 'Croque-monsieur'],
+        ['farine de blé', 'tomates', 'fromage'], 240, 28, 0.1, 10, 9),
+    'Plats préparés, Soupes': (
+        ['Soupe', 'Velouté', 'Gaspacho', 'Potage'],
+        ['eau', 'carottes', 'pommes de terre'], 45, 6, 0.3, 1.2, 1.5),
+    'Aliments d\'origine végétale, Légumineuses': (
+        ['Lentilles', 'Pois chiches', 'Haricots', 'Houmous'],
+        ['lentilles', 'eau', 'sel'], 120, 15, 0.05, 8, 2.5),
+    'Desserts, Glaces et sorbets': (
+        ['Glace', 'Sorbet', 'Crème glacée', 'Bâtonnets glacés'],
+        ['lait', 'sucre', 'crème'], 220, 27, 0.85, 3.5, 11)
+}
+
+# Category frequencies, most common first
+CATEGORY_WEIGHTS = [14, 10, 7, 8, 7, 4, 4, 6, 5, 6, 4, 6, 5, 3, 4, 3, 2, 2]
+
+FLAVOURS = ['nature', 'au chocolat', 'à la fraise', 'à la vanille', 'au caramel', 'aux noisettes', 'au citron',
+            'à la framboise', 'aux fruits rouges', 'à l\'abricot', 'aux herbes', 'à la tomate', 'au fromage',
+            'aux champignons', 'aux légumes', 'au poulet', 'épicé', 'au miel', 'à la pomme', 'aux amandes']
+VARIANTS = ['', '', '', 'bio', 'allégé', 'sans sucres ajoutés', 'format familial', 'x6', 'extra', 'classique']
+
+BRANDS = ['Carrefour', 'Auchan', 'Leclerc', 'U', 'Intermarché', 'Casino', 'Lidl', 'Monoprix', 'Franprix',
+          'Nestlé', 'Danone', 'Lu', 'Bonne Maman', 'Président', 'Lindt', 'Barilla', 'Panzani', 'Herta',
+          'Fleury Michon', 'Lactalis', 'Bel', 'Andros', 'St Michel', 'Harrys', 'Jacquet', 'Kellogg\'s',
+          'Poulain', 'Côte d\'Or', 'Milka', 'Heudebert', 'Bjorg', 'Lesieur', 'Amora', 'Maille', 'Knorr',
+          'Liebig', 'Findus', 'Marie', 'Sodebo', 'Charal', 'Petit Navire', 'Saupiquet', 'Coca-Cola',
+          'Orangina', 'Tropicana', 'Joker', 'Yoplait', 'Activia', 'Paysan Breton', 'Elle & Vire']
+BRAND_SYLLABLES = ['ba', 'lo', 'ri', 'mo', 'ta', 'ne', 'vi', 'su', 'ka', 'de', 'pa', 'li', 'go', 'ra', 'me',
+                   'ti', 'no', 'fa', 'zu', 'ché']
+
+# Allergen tags triggered by ingredient keywords (checked on the lowercased ingredient)
+ALLERGEN_KEYWORDS = {
+    'en:gluten': ['blé', 'gluten', 'orge', 'seigle', 'épeautre', 'avoine', 'wheat', 'oats', 'barley'],
+    'en:milk': ['lait', 'beurre', 'crème', 'fromage', 'yaourt', 'lactosérum', 'milk', 'butter', 'whey'],
+    'en:eggs': ['oeufs', 'eggs'],
+    'en:nuts': ['noisettes', 'amandes', 'noix', 'pistaches', 'hazelnuts', 'almonds'],
+    'en:peanuts': ['cacahuètes', 'peanuts'],
+    'en:soybeans': ['soja', 'tofu', 'soy'],
+    'en:sesame-seeds': ['sésame'],
+    'en:mustard': ['moutarde'],
+    'en:fish': ['saumon', 'thon']
+}
+
+# Share of missing values per column, roughly as in the export
+MISSING_SHARE = {
+    'brands': 0.08,
+    'categories': 0.05,
+    'ingredients_text': 0.06,
+    'nutriscore_grade': 0.25,
+    'energy-kcal_100g': 0.04,
+    'carbohydrates_100g': 0.05,
+    'sugars_100g': 0.05,
+    'proteins_100g': 0.05
+}
+
+
+def ingredient_vocabulary() -> List[str]:
+    """Every ingredient a catalog can contain, most common first."""
+    tail = [f'{ingredient} {qualifier}' for qualifier in QUALIFIERS for ingredient in BASE_INGREDIENTS]
+    return BASE_INGREDIENTS + ADDITIVES + tail
+
+
+def brand_vocabulary(n_products: int, seed: int = 0) -> List[str]:
+    """Real brands followed by generated ones; the long tail grows with the catalog."""
+    rng = np.random.default_rng([seed, 1])
+    n_generated = min(n_products // 25, 200000)
+    lengths = rng.integers(2, 4, n_generated)
+    syllables = rng.integers(0, len(BRAND_SYLLABLES), (n_generated, 3))
+    generated = [''.join(BRAND_SYLLABLES[s] for s in row[:length]).capitalize() + f' {i}'
+                 for i, (row, length) in enumerate(zip(syllables, lengths))]
+    return BRANDS + generated
+
+
+def _zipf_probabilities(n: int) -> np.ndarray:
+    weights = 1.0 / np.arange(1, n + 1) ** ZIPF_EXPONENT
+    return weights / weights.sum()
+
+
+def _allergen_tags(vocabulary: List[str]) -> List[Tuple[str, ...]]:
+    tags = []
+    for ingredient in vocabulary:
+        lowered = ingredient.lower()
+        tags.append(tuple(tag for tag, keywords in ALLERGEN_KEYWORDS.items()
+                          if any(keyword in lowered for keyword in keywords)))
+    return tags
+
+
+class CatalogGenerator:
+    """Generates catalog chunks for one ``(n_products, seed)`` pair."""
+
+    def __init__(self, n_products: int, seed: int = 0):
+        self.n_products = n_products
+        self.seed = seed
+
+        self.ingredients = ingredient_vocabulary()
+        self.ingredient_index = {ingredient: i for i, ingredient in enumerate(self.ingredients)}
+        self.ingredient_p = _zipf_probabilities(len(self.ingredients))
+        self.allergens = _allergen_tags(self.ingredients)
+
+        self.brands = brand_vocabulary(n_products, seed)
+        self.brand_p = _zipf_probabilities(len(self.brands))
+
+        self.categories = list(CATEGORIES)
+        self.category_p = np.array(CATEGORY_WEIGHTS, dtype=float) / sum(CATEGORY_WEIGHTS)
+        self.profiles = np.array([profile[2:] for profile in CATEGORIES.values()])
+        self.signatures = [[self.ingredient_index[name] for name in CATEGORIES[category][1]]
+                           for category in self.categories]
+
+    def chunks(self) -> Iterator[pd.DataFrame]:
+        for start in range(0, self.n_products, CHUNK_SIZE):
+            yield self.chunk(start, min(CHUNK_SIZE, self.n_products - start))
+
+    def chunk(self, start: int, size: int) -> pd.DataFrame:
+        """Products ``start`` to ``start + size``."""
+        rng = np.random.default_rng([self.seed, 2, start])
+
+        category = rng.choice(len(self.categories), size, p=self.category_p)
+        ingredients, allergens = self._ingredient_lists(rng, category)
+        nutrition = self._nutrition(rng, category)
+
+        df = pd.DataFrame({
+            'product_name': self._product_names(rng, category),
+            'brands': self._brands(rng, size),
+            'categories': np.array(self.categories, dtype=object)[category],
+            'ingredients_text': ingredients,
+            'allergens': allergens,
+            'nutriscore_grade': self._nutriscore(rng, nutrition),
+            **nutrition
+        }, index=pd.Index([f'{3000000000000 + start + i:013d}' for i in range(size)], name='code'))
+
+        # Derived after the nutrition values, before dropping some of them
+        self._add_dietary_flags(df)
+
+        for col, share in MISSING_SHARE.items():
+            df.loc[rng.random(size) < share, col] = np.nan
+        return df
+
+    def _ingredient_lists(self, rng: np.random.Generator, category: np.ndarray) -> Tuple[List[str], List[str]]:
+        size = len(category)
+        counts = np.clip(rng.lognormal(1.8, 0.6, size).astype(int), 1, 40)
+        drawn = rng.choice(len(self.ingredients), int(counts.sum()), p=self.ingredient_p)
+        offsets = np.concatenate([[0], np.cumsum(counts)]).tolist()
+        share = rng.integers(5, 80, size).tolist()
+        annotated = (rng.random(size) < 0.3).tolist()
+        use_signature = (rng.random(size) < 0.85).tolist()
+
+        texts, allergen_texts = [], []
+        for row, cat in enumerate(category.tolist()):
+            terms = drawn[offsets[row]:offsets[row + 1]].tolist()
+            if use_signature[row]:
+                terms = self.signatures[cat] + terms
+            terms = list(dict.fromkeys(terms))
+
+            names = [self.ingredients[term] for term in terms]
+            if annotated[row]:
+                # Share of the main ingredient, as on many labels
+                names[0] = f'{names[0]} ({share[row]}%)'
+            texts.append(', '.join(names).capitalize())
+
+            tags = sorted({tag for term in terms for tag in self.allergens[term]})
+            allergen_texts.append(','.join(tags))
+        return texts, allergen_texts
+
+    def _product_names(self, rng: np.random.Generator, category: np.ndarray) -> List[str]:
+        size = len(category)
+        noun_choice = rng.integers(0, 5, size).tolist()
+        flavours = rng.integers(0, len(FLAVOURS), size).tolist()
+        variants = rng.integers(0, len(VARIANTS), size).tolist()
+
+        names = []
+        for cat, noun, flavour, variant in zip(category.tolist(), noun_choice, flavours, variants):
+            nouns = CATEGORIES[self.categories[cat]][0]
+            name = f'{nouns[noun % len(nouns)]} {FLAVOURS[flavour]}'
+            names.append(f'{name} {VARIANTS[variant]}' if VARIANTS[variant] else name)
+        return names
+
+    def _brands(self, rng: np.random.Generator, size: int) -> np.ndarray:
+        brands = np.array(self.brands, dtype=object)[rng.choice(len(self.brands), size, p=self.brand_p)]
+        # Some products list a second, sub-brand
+        second = rng.random(size) < 0.05
+        brands[second] = [f'{brand}, {brand} Bio' for brand in brands[second]]
+        return brands
+
+    def _nutrition(self, rng: np.random.Generator, category: np.ndarray) -> Dict[str, np.ndarray]:
+        _, carbs_mean, sugar_share, protein_mean, fat_mean = self.profiles[category].T
+        spread = rng.lognormal(0, 0.35, (4, len(category)))
+
+        carbs = np.minimum(carbs_mean * spread[0], 100)
+        sugars = np.minimum(carbs * np.clip(sugar_share * spread[1], 0, 1), carbs)
+        proteins = np.minimum(protein_mean * spread[2], 90)
+        fat = np.minimum(fat_mean * spread[3], 100)
+        kcal = 4 * carbs + 4 * proteins + 9 * fat
+
+        return {
+            'energy-kcal_100g': kcal.round(0),
+            'carbohydrates_100g': carbs.round(1),
+            'sugars_100g': sugars.round(1),
+            'proteins_100g': proteins.round(1)
+        }
+
+    @staticmethod
+    def _nutriscore(rng: np.random.Generator, nutrition: Dict[str, np.ndarray]) -> np.ndarray:
+        # Simplified Nutri-Score points: energy and sugar count against, protein for
+        points = (nutrition['energy-kcal_100g'] / 80 + nutrition['sugars_100g'] / 4.5
+                  - np.minimum(nutrition['proteins_100g'] / 1.6, 5) + rng.normal(0, 2, len(nutrition['sugars_100g'])))
+        grades = np.array(list('abcde'), dtype=object)
+        return grades[np.digitize(points, [0, 3, 11, 19])]
+
+    @staticmethod
+    def _add_dietary_flags(df: pd.DataFrame):
+        """Dietary columns, ``health_flags`` and ``allergen_friendly`` as the cleaning notebook derives them."""
+        allergens = df['allergens'].str
+        df['is_gluten_free'] = ~allergens.contains('gluten')
+        df['is_low_sugar'] = df['sugars_100g'] < 5.0
+        df['is_high_protein'] = df['proteins_100g'] > 10.0
+        df['is_low_calorie'] = df['energy-kcal_100g'] < 200
+        df['is_dairy_free'] = ~allergens.contains('milk')
+        df['is_nut_free'] = ~allergens.contains('nuts')
+        df['is_soy_free'] = ~allergens.contains('soy')
+        df['is_egg_free'] = ~allergens.contains('eggs')
+
+        df['health_flags'] = _join_flags(df, {'is_gluten_free': 'gluten_free', 'is_low_sugar': 'low_sugar',
+                                              'is_high_protein': 'high_protein', 'is_low_calorie': 'low_calorie'})
+        df['allergen_friendly'] = _join_flags(df, {'is_dairy_free': 'dairy_free', 'is_nut_free': 'nut_free',
+                                                   'is_soy_free': 'soy_free', 'is_egg_free': 'egg_free'})
+
+
+def _join_flags(df: pd.DataFrame, labels: Dict[str, str]) -> List[str]:
+    columns = [df[col].to_numpy() for col in labels]
+    names = list(labels.values())
+    return [','.join(name for name, flag in zip(names, flags) if flag) for flags in zip(*columns)]
+
+
+def generate_catalog(n_products: int, seed: int = 0) -> pd.DataFrame:
+    """A synthetic catalog of ``n_products`` products, indexed by barcode."""
+    generator = CatalogGenerator(n_products, seed)
+    return pd.concat(generator.chunks()) if n_products else generator.chunk(0, 0)
+
+
+def write_catalog_csv(path: str, n_products: int, seed: int = 0) -> str:
+    """Write a synthetic catalog to CSV chunk by chunk; same rows as ``generate_catalog``."""
+    generator = CatalogGenerator(n_products, seed)
+    for i, chunk in enumerate(generator.chunks()):
+        chunk.to_csv(path, mode='w' if i == 0 else 'a', header=i == 0)
+    return path
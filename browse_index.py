@@ -0,0 +1,90 @@
+"""Product orderings presorted by health score, for queries without text.
+
+A query with filters but no recipe text or ingredients ranks the matching
+products by health score alone. Instead of scoring the whole catalog, it
+walks a list of product positions presorted by descending health score
+(ties by position, like ``_top_k``) and checks the filters on growing blocks
+of it until ``k`` products pass.
+
+Besides the list of every product there is one per NutriScore grade and
+per dietary flag, holding only the products with that grade or flag in the
+same order; walking the shortest list that applies skips products the
+filters would reject anyway.
+"""
+import numpy as np
+from typing import Callable, Dict, List, Optional, Tuple
+
+from filter_index import FilterIndex
+
+# Positions checked by the first block of a walk (blocks double after that)
+FIRST_BLOCK = 256
+
+
+class BrowseIndex:
+    """Presorted product lists, keyed ``'all'``, ``'grade/<grade>'`` and ``'flag/<column>'``."""
+
+    def __init__(self, health: np.ndarray, filter_index: FilterIndex):
+        order = np.argsort(-np.asarray(health, dtype=np.float64), kind='stable').astype(np.int32)
+        self.lists = {'all': order}
+        for grade, bits in (filter_index.grade_bits or {}).items():
+            self.lists[f'grade/{grade}'] = order[filter_index._unpack(bits)[order]]
+        for col, bits in filter_index.flag_bits.items():
+            self.lists[f'flag/{col}'] = order[filter_index._unpack(bits)[order]]
+
+    def list_for(self, filters: Optional[Dict], dietary_columns: List[str]) -> str:
+        """Name of the shortest list holding every product that can pass the filters."""
+        names = ['all'] + [f'flag/{col}' for col in dietary_columns]
+        grades = (filters or {}).get('nutriscore')
+        if isinstance(grades, str):
+            grades = [grades]
+        if grades is not None and len(set(grades)) == 1:
+            names.append(f'grade/{grades[0]}')
+        return min((name for name in names if name in self.lists), key=lambda name: len(self.lists[name]))
+
+    def first(self, name: str, check: Callable[[np.ndarray], np.ndarray], k: int,
+              key: Optional[Callable[[np.ndarray], np.ndarray]] = None) -> Tuple[np.ndarray, int]:
+        """The first ``k`` positions of a list passing ``check``, and how many positions were checked.
+
+        ``key`` maps positions to a value that never increases along the
+        lists (e.g. a ranking score computed from the health score). With it,
+        later positions whose key ties the ``k``-th one are returned too, so
+        the caller can break those ties itself.
+        """
+        ordered = self.lists[name]
+        found, n_found = [], 0
+        start, block = 0, max(FIRST_BLOCK, 4 * k)
+        while start < len(ordered) and n_found < k:
+            positions = ordered[start:start + block]
+            positions = positions[check(positions)]
+            found.append(positions)
+            n_found += len(positions)
+            start += block
+            block *= 2
+        if not found:
+            return np.array([], dtype=np.int32), 0
+        found = np.concatenate(found)
+        if key is None or len(found) <= k:
+            return found[:k], min(start, len(ordered))
+
+        # Health scores a few ulps apart can still give equal keys
+        last = key(found[k - 1:k])[0]
+        found = found[:k + np.count_nonzero(key(found[k:]) >= last)]
+        while start < len(ordered):
+            positions = ordered[start:start + block]
+            tied = np.count_nonzero(key(positions) >= last)
+            found = np.concatenate([found, positions[:tied][check(positions[:tied])]])
+            start += tied
+            if tied < len(positions):
+                break
+            block *= 2
+        return found, min(start, len(ordered))
+
+    def to_arrays(self):
+        """Arrays and metadata needed to restore the index without rebuilding it."""
+        return dict(self.lists), {'names': list(self.lists)}
+
+    @classmethod
+    def from_arrays(cls, arrays, meta) -> 'BrowseIndex':
+        index = cls.__new__(cls)
+        index.lists = {name: arrays[name] for name in meta['names']}
+        return index
@@ -0,0 +1,435 @@
+"""Fit a RecipeProductRecommender by streaming a CSV export in chunks.
+
+The export is read twice, ``chunksize`` rows at a time and only for the
+columns the recommender uses:
+
+1. every chunk is cleaned with ``_prepare_frame``; the document and term
+   frequencies of every n-gram are accumulated, the ingredient indexes
+   count its ingredient terms, and the chunk is compacted straight away
+   into the serving representation (see ``product_table``), so the catalog
+   is never held as full-text rows
+2. the vocabularies are pruned exactly as ``TfidfVectorizer.fit`` would
+   (``min_df``/``max_df``/``max_features``), IDF weights are computed, and each
+   chunk is prepared again and transformed into TF-IDF rows, kept only as
+   float32 pieces of the similarity kernel
+
+The vocabularies and IDF weights are identical to fitting on the whole frame
+(TF-IDF values match up to floating-point rounding), but the raw export and
+its copy are never held in memory together, and columns the recommender does
+not use are never parsed.
+
+Counting every distinct n-gram still takes memory growing with the export.
+With ``term_counts='hashed'`` step 1 only adds the counts into a fixed number
+of hash buckets, whose totals bound the frequencies of the n-grams hashed
+there. An extra read then counts exactly the n-grams whose buckets could
+still make the pruned vocabulary, and is repeated with a lower bar in the
+rare case the bucket totals overestimated the cut-off (see
+``count_candidates``). N-grams tied at the ``max_features`` cut-off are then
+kept in alphabetical order rather than scikit-learn's, so the vocabularies
+can differ from exact mode among those ties. The peak RSS after each stage
+is recorded in ``fit_peak_rss_mb``.
+"""
+import resource
+import sys
+
+import numpy as np
+import pandas as pd
+from numbers import Integral
+from sklearn.feature_extraction.text import CountVectorizer, HashingVectorizer, TfidfVectorizer
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from recommender import (
+    RecipeProductRecommender, NUTRITION_COLS, DIETARY_COLS,
+    GENERAL_VECTORIZER_PARAMS, INGREDIENT_VECTORIZER_PARAMS
+)
+from filter_index import FilterIndex, RANGE_FILTERS
+from ingredient_index import IngredientIncidence, IngredientSuggestionIndex
+from product_table import TextColumn, compact_frame, concat_frames
+from similarity_kernel import SimilarityKernel
+
+# Text columns read from the export
+TEXT_COLS = [
+    'product_name', 'brands', 'categories', 'ingredients_text', 'allergens',
+    'nutriscore_grade', 'health_category', 'health_flags', 'allergen_friendly'
+]
+
+# Fixed-width columns kept per product for the filter index, which the compact
+# catalog drops (dietary flags) or narrows to float32 (nutrition values)
+FILTER_COLS = (set(DIETARY_COLS.values()) | set(NUTRITION_COLS.values())
+               | {col for col, _ in RANGE_FILTERS.values()})
+
+# Vectorizer parameters that only affect how documents are analyzed
+ANALYZER_PARAMS = ('lowercase', 'strip_accents', 'stop_words', 'ngram_range', 'token_pattern')
+
+# How from_csv counts n-grams: every distinct one, or in hash buckets first
+TERM_COUNT_MODES = ('exact', 'hashed')
+
+# Hash buckets per vectorizer for term_counts='hashed' (two float64 counts each)
+HASH_BUCKETS = 1 << 21
+
+# Buckets first counted exactly: those with a term frequency at least that of
+# the bucket ranked this many times max_features
+CANDIDATE_RANK_FACTOR = 2
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process so far, in MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def csv_dtypes() -> Dict:
+    """Explicit dtypes for every column the recommender reads."""
+    dtypes = {col: str for col in TEXT_COLS}
+    for col in NUTRITION_COLS.values():
+        dtypes[col] = 'float64'
+    dtypes['health_score'] = 'float64'
+    for col in DIETARY_COLS.values():
+        dtypes[col] = 'boolean'
+    return dtypes
+
+
+def read_chunks(path: str, chunksize: int, index_col: Optional[str] = None,
+                **read_csv_kwargs) -> Iterator[pd.DataFrame]:
+    """Stream the used columns of the export, ``chunksize`` rows at a time.
+
+    ``index_col`` names a column of product codes to index the chunks by;
+    it is read as text so codes keep their leading zeros.
+    """
+    dtypes = csv_dtypes()
+    if index_col is not None:
+        dtypes.setdefault(index_col, str)
+    reader = pd.read_csv(
+        path,
+        usecols=lambda col: col in dtypes,
+        dtype=dtypes,
+        index_col=index_col,
+        chunksize=chunksize,
+        **read_csv_kwargs
+    )
+    with reader:
+        yield from reader
+
+
+def doc_count_bounds(vectorizer: TfidfVectorizer, n_docs: int) -> Tuple[float, float]:
+    """``min_df`` and ``max_df`` as document counts."""
+    max_df, min_df = vectorizer.max_df, vectorizer.min_df
+    max_doc_count = max_df if isinstance(max_df, Integral) else max_df * n_docs
+    min_doc_count = min_df if isinstance(min_df, Integral) else min_df * n_docs
+    if max_doc_count < min_doc_count:
+        raise ValueError("max_df corresponds to < documents than min_df")
+    return min_doc_count, max_doc_count
+
+
+def kth_largest(values: np.ndarray, k: int) -> float:
+    return float(np.partition(values, len(values) - k)[len(values) - k])
+
+
+class TermStatistics:
+    """Document and term frequencies of every n-gram, accumulated chunk by chunk."""
+
+    # argsort kind choosing among n-grams tied at the max_features cut-off
+    tie_sort = None
+
+    def __init__(self, params: Dict):
+        self.params = params
+        self.counter = CountVectorizer(**{name: params[name] for name in ANALYZER_PARAMS if name in params})
+        self.doc_freq = pd.Series(dtype=np.float64)
+        self.term_freq = pd.Series(dtype=np.float64)
+        self.n_docs = 0
+        self.n_nonempty = 0
+
+    def update(self, texts: pd.Series):
+        self.n_docs += len(texts)
+        self.n_nonempty += int((texts.str.len() > 0).sum())
+        self._count(texts)
+
+    def _count(self, texts: pd.Series):
+        try:
+            counts = self.counter.fit_transform(texts)
+        except ValueError:
+            # No chunk document produced a single token
+            return
+
+        terms = self.counter.get_feature_names_out()
+        keep = self._keep(terms)
+        doc_freq = np.bincount(counts.indices, minlength=len(terms))[keep]
+        term_freq = np.asarray(counts.sum(axis=0)).ravel()[keep]
+        self.doc_freq = self.doc_freq.add(pd.Series(doc_freq, index=terms[keep]), fill_value=0)
+        self.term_freq = self.term_freq.add(pd.Series(term_freq, index=terms[keep]), fill_value=0)
+
+    def _keep(self, terms: np.ndarray) -> slice:
+        return slice(None)
+
+    def fit_vectorizer(self) -> TfidfVectorizer:
+        """Prune the vocabulary and compute IDF weights like ``TfidfVectorizer.fit``."""
+        vectorizer = TfidfVectorizer(**self.params)
+
+        terms = sorted(self.doc_freq.index)
+        dfs = self.doc_freq[terms].to_numpy(dtype=np.int64)
+        tfs = self.term_freq[terms].to_numpy(dtype=np.float64)
+
+        min_doc_count, max_doc_count = doc_count_bounds(vectorizer, self.n_docs)
+        mask = (dfs <= max_doc_count) & (dfs >= min_doc_count)
+        limit = vectorizer.max_features
+        if limit is not None and mask.sum() > limit:
+            # Same selection (and tie order) as CountVectorizer._limit_features
+            mask_inds = (-tfs[mask]).argsort(kind=self.tie_sort)[:limit]
+            new_mask = np.zeros(len(dfs), dtype=bool)
+            new_mask[np.where(mask)[0][mask_inds]] = True
+            mask = new_mask
+
+        kept = np.flatnonzero(mask)
+        if len(kept) == 0:
+            raise ValueError("After pruning, no terms remain. Try a lower min_df or a higher max_df.")
+
+        # Smoothed IDF, computed with the same float operations as TfidfTransformer.fit
+        df = dfs[kept].astype(np.float64)
+        df += float(vectorizer.smooth_idf)
+        n_samples = self.n_docs + int(vectorizer.smooth_idf)
+        idf = np.full_like(df, fill_value=n_samples, dtype=np.float64)
+        idf /= df
+        np.log(idf, out=idf)
+        idf += 1.0
+
+        vectorizer.vocabulary_ = {terms[index]: column for column, index in enumerate(kept)}
+        vectorizer.idf_ = idf
+        return vectorizer
+
+
+def _single_feature(term: str) -> List[str]:
+    return [term]
+
+
+class HashedTermCounts:
+    """Document and term frequencies summed per hash bucket of the n-grams, in fixed memory.
+
+    A bucket's totals are upper bounds on the frequencies of every n-gram
+    hashed into it. ``buckets`` maps n-grams to buckets with the same hash.
+    """
+
+    def __init__(self, params: Dict, n_buckets: int = HASH_BUCKETS):
+        self.params = params
+        analyzer_params = {name: params[name] for name in ANALYZER_PARAMS if name in params}
+        self.hasher = HashingVectorizer(n_features=n_buckets, alternate_sign=False, norm=None, **analyzer_params)
+        self.term_hasher = HashingVectorizer(n_features=n_buckets, alternate_sign=False, norm=None,
+                                             analyzer=_single_feature)
+        self.doc_freq = np.zeros(n_buckets)
+        self.term_freq = np.zeros(n_buckets)
+        self.n_docs = 0
+        self.n_nonempty = 0
+
+    def update(self, texts: pd.Series):
+        self.n_docs += len(texts)
+        self.n_nonempty += int((texts.str.len() > 0).sum())
+
+        counts = self.hasher.transform(texts)
+        self.doc_freq += np.bincount(counts.indices, minlength=len(self.doc_freq))
+        self.term_freq += np.bincount(counts.indices, weights=counts.data, minlength=len(self.term_freq))
+
+    def buckets(self, terms: np.ndarray) -> np.ndarray:
+        return self.term_hasher.transform(terms).indices
+
+    def candidate_buckets(self, min_doc_count: float, min_term_freq: float) -> np.ndarray:
+        return (self.doc_freq >= min_doc_count) & (self.term_freq >= min_term_freq)
+
+
+class CandidateTermStatistics(TermStatistics):
+    """Exact ``TermStatistics`` of the n-grams falling into candidate hash buckets only.
+
+    Which n-grams tied at the ``max_features`` cut-off scikit-learn keeps
+    depends on how its unstable sort permutes all of them, counted or not,
+    so ties are broken alphabetically instead. The vocabulary can then
+    differ from exact mode in any n-gram tied at the cut-off (IDF weights
+    of the n-grams both keep are the same).
+    """
+
+    tie_sort = 'stable'
+
+    def __init__(self, counts: HashedTermCounts, min_term_freq: float):
+        super().__init__(counts.params)
+        self.counts = counts
+        self.min_term_freq = min_term_freq
+        self.n_docs = counts.n_docs
+        self.n_nonempty = counts.n_nonempty
+        min_doc_count, _ = doc_count_bounds(TfidfVectorizer(**self.params), self.n_docs)
+        self.candidates = counts.candidate_buckets(min_doc_count, min_term_freq)
+
+    def update(self, texts: pd.Series):
+        # Documents were counted by the hashed pass
+        self._count(texts)
+
+    def _keep(self, terms: np.ndarray) -> np.ndarray:
+        return self.candidates[self.counts.buckets(terms)]
+
+    def cutoff_term_freq(self) -> Optional[float]:
+        """Term frequency of the last n-gram ``max_features`` keeps, or None if fewer pass the df bounds."""
+        vectorizer = TfidfVectorizer(**self.params)
+        min_doc_count, max_doc_count = doc_count_bounds(vectorizer, self.n_docs)
+        valid = (self.doc_freq >= min_doc_count) & (self.doc_freq <= max_doc_count)
+        tfs = self.term_freq[valid].to_numpy()
+        if vectorizer.max_features is None or len(tfs) < vectorizer.max_features:
+            return None
+        return kth_largest(tfs, vectorizer.max_features)
+
+    def verified(self) -> bool:
+        """Whether every n-gram left out (all below ``min_term_freq``) is certainly pruned."""
+        if self.min_term_freq <= 1:
+            return True
+        cutoff = self.cutoff_term_freq()
+        return cutoff is not None and cutoff >= self.min_term_freq
+
+
+def candidate_threshold(counts: HashedTermCounts) -> float:
+    """Initial ``min_term_freq`` of the candidate buckets (1 counts every bucket passing ``min_df``)."""
+    vectorizer = TfidfVectorizer(**counts.params)
+    if vectorizer.max_features is None:
+        return 1
+    min_doc_count, _ = doc_count_bounds(vectorizer, counts.n_docs)
+    totals = counts.term_freq[counts.doc_freq >= min_doc_count]
+    rank = CANDIDATE_RANK_FACTOR * vectorizer.max_features
+    if len(totals) <= rank:
+        return 1
+    return max(1.0, kth_largest(totals, rank))
+
+
+def count_candidates(recommender: RecipeProductRecommender, path: str, chunksize: int,
+                     counts: Dict[str, HashedTermCounts], **read_csv_kwargs) -> Dict[str, TermStatistics]:
+    """Exact statistics of every n-gram that can make the pruned vocabularies.
+
+    ``counts`` maps text columns (``search_text``, ``cleaned_ingredients``) to
+    their hashed counts. Only n-grams in buckets reaching a term frequency
+    threshold are counted. If fewer than ``max_features`` counted n-grams
+    reach the threshold, an n-gram left out might have made the vocabulary,
+    so the export is read again with the threshold lowered to the exact
+    cut-off found (or halved). Once the cut-off is at least the threshold,
+    every n-gram left out is below it and the vocabulary is exact.
+    """
+    thresholds = {column: candidate_threshold(column_counts) for column, column_counts in counts.items()}
+    stats = {}
+    while thresholds:
+        pending = {column: CandidateTermStatistics(counts[column], threshold)
+                   for column, threshold in thresholds.items()}
+        for chunk in read_chunks(path, chunksize, **read_csv_kwargs):
+            text = recommender._prepare_text(chunk)
+            for column, column_stats in pending.items():
+                column_stats.update(text[column])
+
+        thresholds = {}
+        for column, column_stats in pending.items():
+            if column_stats.verified():
+                stats[column] = column_stats
+            else:
+                cutoff = column_stats.cutoff_term_freq()
+                thresholds[column] = column_stats.min_term_freq // 2 if cutoff is None else cutoff
+    return stats
+
+
+def build_from_csv(path: str, chunksize: int = 100000, n_jobs: int = 1, term_counts: str = 'exact',
+                   hash_buckets: int = HASH_BUCKETS, index_col: Optional[str] = None,
+                   **read_csv_kwargs) -> RecipeProductRecommender:
+    """Fit a recommender on a CSV export without loading it all at once.
+
+    The catalog is indexed by the ``index_col`` column (e.g. the product
+    ``code``) when given, by row number otherwise.
+    """
+    if term_counts not in TERM_COUNT_MODES:
+        raise ValueError(f"Unknown term_counts {term_counts!r} (expected one of {', '.join(TERM_COUNT_MODES)})")
+
+    recommender = RecipeProductRecommender.__new__(RecipeProductRecommender)
+    recommender._init_state(pd.DataFrame(), n_jobs)
+    timings = recommender.fit_timings
+    memory = recommender.fit_peak_rss_mb
+
+    # Pass 1: catalog columns and n-gram statistics
+    if term_counts == 'hashed':
+        general_stats = HashedTermCounts(GENERAL_VECTORIZER_PARAMS, hash_buckets)
+        ingredient_stats = HashedTermCounts(INGREDIENT_VECTORIZER_PARAMS, hash_buckets)
+    else:
+        general_stats = TermStatistics(GENERAL_VECTORIZER_PARAMS)
+        ingredient_stats = TermStatistics(INGREDIENT_VECTORIZER_PARAMS)
+    frames, texts, filter_columns = [], [], []
+    suggestion_counts = pd.Series(dtype=np.int64)
+    incidence = IngredientIncidence.from_ingredients(pd.Series(dtype=object))
+    offset = 0
+
+    with recommender._timed('count_terms', timings):
+        for chunk in read_chunks(path, chunksize, index_col, **read_csv_kwargs):
+            if index_col is None:
+                chunk.index = pd.RangeIndex(offset, offset + len(chunk))
+            offset += len(chunk)
+
+            chunk = recommender._prepare_frame(chunk)
+            general_stats.update(chunk['search_text'])
+            ingredient_stats.update(chunk['cleaned_ingredients'])
+
+            # Ingredient indexes read the raw text before the chunk is compacted
+            ingredients = chunk.get('ingredients_text', pd.Series('', index=chunk.index, dtype=object))
+            suggestion_counts = suggestion_counts.add(IngredientSuggestionIndex.count_terms(ingredients), fill_value=0)
+            incidence.append(ingredients)
+            filter_columns.append(chunk[[col for col in chunk.columns if col in FILTER_COLS]])
+            frame, text = compact_frame(chunk, recommender.nutrition_cols)
+            frames.append(frame)
+            texts.append(text)
+    memory['count_terms'] = peak_rss_mb()
+
+    if general_stats.n_nonempty == 0:
+        raise ValueError("No valid text data found")
+
+    catalog = concat_frames(frames, sort_categories=True)
+    product_text = {col: TextColumn.concat([text[col] for text in texts]) for col in texts[0]}
+    filter_frame = pd.concat(filter_columns)
+    del frames, texts, filter_columns
+
+    if term_counts == 'hashed':
+        # Pass 1b: exact counts of the n-grams whose buckets can make the vocabularies
+        counts = {'search_text': general_stats}
+        if ingredient_stats.n_nonempty > 0:
+            counts['cleaned_ingredients'] = ingredient_stats
+        with recommender._timed('count_candidates', timings):
+            stats = count_candidates(recommender, path, chunksize, counts, **read_csv_kwargs)
+        general_stats, ingredient_stats = stats['search_text'], stats.get('cleaned_ingredients', ingredient_stats)
+        del counts, stats
+        memory['count_candidates'] = peak_rss_mb()
+
+    with recommender._timed('fit_vocabularies', timings):
+        recommender.vectorizer = general_stats.fit_vectorizer()
+        if ingredient_stats.n_nonempty > 0:
+            recommender.ingredient_vectorizer = ingredient_stats.fit_vectorizer()
+    del general_stats, ingredient_stats
+    memory['fit_vocabularies'] = peak_rss_mb()
+
+    # Pass 2: TF-IDF rows with the fixed vocabularies, kept only as float32 kernel pieces
+    kernel_rows = []
+    with recommender._timed('transform', timings):
+        for chunk in read_chunks(path, chunksize, **read_csv_kwargs):
+            text = recommender._prepare_text(chunk)
+            general = recommender.vectorizer.transform(text['search_text'])
+            ingredient = None
+            if recommender.ingredient_vectorizer is not None:
+                ingredient = recommender.ingredient_vectorizer.transform(text['cleaned_ingredients'])
+            kernel_rows.append(SimilarityKernel(general, ingredient))
+    memory['transform'] = peak_rss_mb()
+    with recommender._timed('similarity_kernel', timings):
+        recommender.similarity_kernel = SimilarityKernel.stack(kernel_rows)
+    del kernel_rows
+
+    recommender.df = catalog
+    recommender.product_text = product_text
+    recommender.removed = np.zeros(len(catalog), dtype=bool)
+    recommender.ingredient_incidence = incidence
+    with recommender._timed('suggestion_index', timings):
+        recommender.suggestion_index = IngredientSuggestionIndex.from_counts(suggestion_counts)
+    with recommender._timed('filter_index', timings):
+        # Brands and grades come back from the categoricals of the compact catalog
+        for col in ('brands', 'nutriscore_grade'):
+            if col in catalog.columns:
+                filter_frame[col] = catalog[col].to_numpy(dtype=object)
+        recommender.filter_index = FilterIndex(filter_frame, recommender.dietary_cols, recommender.nutrition_cols)
+    del filter_frame
+    with recommender._timed('browse_index', timings):
+        recommender._build_browse_index()
+    memory['indexes'] = peak_rss_mb()
+
+    return recommender
@@ -0,0 +1,364 @@
+import numpy as np
+import pandas as pd
+from typing import Callable, Dict, List, Optional
+
+# Numeric filters: filter key -> (column, comparison)
+RANGE_FILTERS = {
+    'max_calories': ('energy-kcal_100g', '<='),
+    'max_sugar': ('sugars_100g', '<='),
+    'min_protein': ('proteins_100g', '>='),
+    'max_carbs': ('carbohydrates_100g', '<=')
+}
+
+
+class FilterIndex:
+    """Columnar filter structures built once when the recommender is fitted.
+
+    - dietary flags and NutriScore grades are packed bitsets (one bit per product)
+    - nutrition columns keep a sort order and per-product ranks, so a range
+      filter is a binary search followed by an integer rank comparison
+    - brands are factorized, with an inverted index from brand tokens to codes
+      and from codes to product positions
+
+    Removed products are tombstoned in a bitset rather than dropped, so
+    positions stay aligned with the TF-IDF matrix rows.
+
+    Filters can be checked for an arbitrary candidate set in time proportional
+    to the number of candidates, or expanded into the sorted positions of every
+    matching product so similarity can be restricted to them up front.
+    """
+
+    def __init__(self, df: pd.DataFrame, dietary_cols: Dict[str, str], nutrition_cols: Dict[str, str]):
+        self.n_products = len(df)
+        self.dietary_cols = dict(dietary_cols)
+
+        # Tombstones for products removed from the catalog
+        self.removed_bits = None
+
+        # Packed bitsets for boolean dietary flags
+        self.flag_bits = {}
+        self.flag_counts = {}
+        for col in self.dietary_cols.values():
+            if col in df.columns:
+                flags = df[col].to_numpy(dtype=bool)
+                self.flag_bits[col] = self._pack(flags)
+                self.flag_counts[col] = int(flags.sum())
+
+        # Packed bitsets for each NutriScore grade
+        self.grade_bits = None
+        self.grade_counts = {}
+        if 'nutriscore_grade' in df.columns:
+            self.grade_bits = {}
+            grades = df['nutriscore_grade']
+            for grade in grades.dropna().unique():
+                flags = (grades == grade).to_numpy(dtype=bool)
+                self.grade_bits[grade] = self._pack(flags)
+                self.grade_counts[grade] = int(flags.sum())
+
+        # Sorted order and ranks for nutrition columns
+        self.sorted_values = {}
+        self.sort_order = {}
+        self.ranks = {}
+        self.n_numeric = {}
+        range_cols = set(nutrition_cols.values()) | {col for col, _ in RANGE_FILTERS.values()}
+        for col in range_cols:
+            if col in df.columns:
+                self._index_numeric(col, pd.to_numeric(df[col], errors='coerce').to_numpy(dtype=float))
+
+        # Inverted brand index
+        self.brand_codes = None
+        if 'brands' in df.columns:
+            codes, values = pd.factorize(self._normalize_brands(df['brands']))
+            self.brand_values = list(values)
+            self._index_brand_codes(codes.astype(np.int32))
+        self._build_brand_tokens()
+
+    def _index_numeric(self, col: str, values: np.ndarray):
+        order = np.argsort(values, kind='stable').astype(np.int32)
+        ranks = np.empty(len(values), dtype=np.int32)
+        ranks[order] = np.arange(len(values), dtype=np.int32)
+        self.sorted_values[col] = values[order]
+        self.sort_order[col] = order
+        self.ranks[col] = ranks
+        self.n_numeric[col] = int(np.count_nonzero(~np.isnan(values)))
+
+    @staticmethod
+    def _normalize_brands(brands: pd.Series) -> pd.Series:
+        return brands.fillna('').astype(str).str.lower()
+
+    def _index_brand_codes(self, codes: np.ndarray):
+        self.brand_codes = codes
+        self.brand_order = np.argsort(codes, kind='stable').astype(np.int32)
+        self.brand_offsets = np.concatenate(
+            [[0], np.cumsum(np.bincount(codes, minlength=len(self.brand_values)))]
+        )
+
+    def append(self, df: pd.DataFrame):
+        """Index new products, which take positions after the existing ones."""
+        n_old, n_new = self.n_products, len(df)
+        self.n_products = n_old + n_new
+
+        for col, bits in self.flag_bits.items():
+            flags = df[col].to_numpy(dtype=bool) if col in df.columns else np.zeros(n_new, dtype=bool)
+            self.flag_bits[col] = self._pack(np.concatenate([self._unpack(bits, n_old), flags]))
+            self.flag_counts[col] += int(flags.sum())
+
+        if self.grade_bits is not None:
+            grades = df['nutriscore_grade'] if 'nutriscore_grade' in df.columns else pd.Series(index=df.index)
+            for grade in set(self.grade_bits) | set(grades.dropna().unique()):
+                old = self._unpack(self.grade_bits[grade], n_old) if grade in self.grade_bits else np.zeros(n_old, dtype=bool)
+                flags = (grades == grade).to_numpy(dtype=bool)
+                self.grade_bits[grade] = self._pack(np.concatenate([old, flags]))
+                self.grade_counts[grade] = self.grade_counts.get(grade, 0) + int(flags.sum())
+
+        for col in list(self.ranks):
+            old = self.sorted_values[col][self.ranks[col]]
+            if col in df.columns:
+                new = pd.to_numeric(df[col], errors='coerce').to_numpy(dtype=float)
+            else:
+                new = np.full(n_new, np.nan)
+            self._index_numeric(col, np.concatenate([old, new]))
+
+        if self.brand_codes is not None:
+            known = {value: code for code, value in enumerate(self.brand_values)}
+            brands = self._normalize_brands(df['brands']) if 'brands' in df.columns else pd.Series('', index=df.index)
+            new_codes = np.empty(n_new, dtype=np.int32)
+            for i, value in enumerate(brands):
+                if value not in known:
+                    known[value] = len(self.brand_values)
+                    self.brand_values.append(value)
+                new_codes[i] = known[value]
+            self._index_brand_codes(np.concatenate([self.brand_codes, new_codes]))
+            self._build_brand_tokens()
+
+        if self.removed_bits is not None:
+            self.removed_bits = self._pack(np.concatenate([self._unpack(self.removed_bits, n_old), np.zeros(n_new, dtype=bool)]))
+
+    def remove(self, positions: np.ndarray):
+        """Tombstone products so no filter query returns them again."""
+        if self.removed_bits is None:
+            removed = np.zeros(self.n_products, dtype=bool)
+        else:
+            removed = self._unpack(self.removed_bits)
+        removed[positions] = True
+        self.removed_bits = self._pack(removed)
+
+    def count_flag(self, col: str) -> int:
+        """Number of live products with a dietary flag set."""
+        if self.removed_bits is None:
+            return self.flag_counts[col]
+        return int(np.unpackbits(self.flag_bits[col] & ~self.removed_bits).sum())
+
+    def _build_brand_tokens(self):
+        """Map each comma-separated brand token to the brand codes containing it."""
+        self.brand_tokens = {}
+        if self.brand_codes is not None:
+            for code, value in enumerate(self.brand_values):
+                for token in value.split(','):
+                    token = token.strip()
+                    if token:
+                        self.brand_tokens.setdefault(token, []).append(code)
+        self._brand_cache = {}
+
+    def to_arrays(self):
+        """Arrays and metadata needed to restore the index without rebuilding it."""
+        arrays = {}
+        for col, bits in self.flag_bits.items():
+            arrays[f'flag/{col}'] = bits
+        for grade, bits in (self.grade_bits or {}).items():
+            arrays[f'grade/{grade}'] = bits
+        for col in self.ranks:
+            arrays[f'sorted_values/{col}'] = self.sorted_values[col]
+            arrays[f'sort_order/{col}'] = self.sort_order[col]
+            arrays[f'ranks/{col}'] = self.ranks[col]
+        if self.removed_bits is not None:
+            arrays['removed'] = self.removed_bits
+        if self.brand_codes is not None:
+            arrays['brand_codes'] = self.brand_codes
+            arrays['brand_values'] = self.brand_values
+            arrays['brand_order'] = self.brand_order
+            arrays['brand_offsets'] = self.brand_offsets
+
+        meta = {
+            'n_products': self.n_products,
+            'dietary_cols': self.dietary_cols,
+            'flag_counts': self.flag_counts,
+            'grade_counts': self.grade_counts if self.grade_bits is not None else None,
+            'n_numeric': self.n_numeric
+        }
+        return arrays, meta
+
+    @classmethod
+    def from_arrays(cls, arrays, meta) -> 'FilterIndex':
+        index = cls.__new__(cls)
+        index.n_products = meta['n_products']
+        index.dietary_cols = meta['dietary_cols']
+        index.removed_bits = arrays.get('removed')
+        index.flag_counts = meta['flag_counts']
+        index.flag_bits = {col: arrays[f'flag/{col}'] for col in index.flag_counts}
+
+        index.grade_bits = None
+        index.grade_counts = {}
+        if meta['grade_counts'] is not None:
+            index.grade_counts = meta['grade_counts']
+            index.grade_bits = {grade: arrays[f'grade/{grade}'] for grade in index.grade_counts}
+
+        index.n_numeric = meta['n_numeric']
+        index.sorted_values = {col: arrays[f'sorted_values/{col}'] for col in index.n_numeric}
+        index.sort_order = {col: arrays[f'sort_order/{col}'] for col in index.n_numeric}
+        index.ranks = {col: arrays[f'ranks/{col}'] for col in index.n_numeric}
+
+        index.brand_codes = arrays.get('brand_codes')
+        if index.brand_codes is not None:
+            index.brand_values = list(arrays['brand_values'])
+            index.brand_order = arrays['brand_order']
+            index.brand_offsets = arrays['brand_offsets']
+        index._build_brand_tokens()
+        return index
+
+    def _pack(self, flags: np.ndarray) -> np.ndarray:
+        return np.packbits(flags)
+
+    def _unpack(self, bits: np.ndarray, count: Optional[int] = None) -> np.ndarray:
+        return np.unpackbits(bits, count=self.n_products if count is None else count).astype(bool)
+
+    @staticmethod
+    def _test_bits(bits: np.ndarray, positions: np.ndarray) -> np.ndarray:
+        return ((bits[positions >> 3] >> (7 - (positions & 7))) & 1).astype(bool)
+
+    def _brand_codes_matching(self, brand: str) -> np.ndarray:
+        """Brand codes whose (lower-cased) brand string contains ``brand``."""
+        brand = brand.lower().strip()
+        if brand not in self._brand_cache:
+            if len(self._brand_cache) >= 1024:
+                self._brand_cache.clear()
+            if not brand:
+                codes = range(len(self.brand_values))
+            elif ',' in brand:
+                codes = [code for code, value in enumerate(self.brand_values) if brand in value]
+            else:
+                # Without a comma the query can only match inside a single brand token
+                codes = set()
+                for token, token_codes in self.brand_tokens.items():
+                    if brand in token:
+                        codes.update(token_codes)
+            # Return the local array: another thread may clear the cache in between
+            codes = self._brand_cache[brand] = np.array(sorted(codes), dtype=np.int32)
+            return codes
+        return self._brand_cache[brand]
+
+    def _compile(self, filters: Dict = None, dietary_preferences: List[str] = None) -> list:
+        """Turn filter arguments into (kind, payload, match count) criteria."""
+        criteria = []
+
+        # Dietary preferences as hard filters
+        for pref in dietary_preferences or []:
+            col = self.dietary_cols.get(pref)
+            if col in self.flag_bits:
+                criteria.append(('bits', self.flag_bits[col], self.flag_counts[col]))
+
+        if not filters:
+            return criteria
+
+        # Nutritional filters
+        for key, (col, comparison) in RANGE_FILTERS.items():
+            if key in filters and col in self.ranks:
+                sorted_values = self.sorted_values[col]
+                if comparison == '<=':
+                    lo, hi = 0, int(np.searchsorted(sorted_values, filters[key], side='right'))
+                else:
+                    lo, hi = int(np.searchsorted(sorted_values, filters[key], side='left')), self.n_numeric[col]
+                criteria.append(('range', (col, lo, hi), max(hi - lo, 0)))
+
+        # NutriScore filter
+        if 'nutriscore' in filters and self.grade_bits is not None:
+            allowed = filters['nutriscore']
+            if isinstance(allowed, str):
+                allowed = [allowed]
+            allowed = [grade for grade in set(allowed) if grade in self.grade_bits]
+            if allowed:
+                bits = np.bitwise_or.reduce([self.grade_bits[grade] for grade in allowed])
+            else:
+                bits = np.zeros((self.n_products + 7) // 8, dtype=np.uint8)
+            criteria.append(('bits', bits, sum(self.grade_counts[grade] for grade in allowed)))
+
+        # Brand filter
+        if 'brands' in filters and self.brand_codes is not None:
+            brands = filters['brands']
+            if isinstance(brands, str):
+                brands = [brands]
+            lookup = np.zeros(len(self.brand_values), dtype=bool)
+            for brand in brands:
+                lookup[self._brand_codes_matching(brand)] = True
+            counts = np.diff(self.brand_offsets)
+            criteria.append(('brand', lookup, int(counts[lookup].sum())))
+
+        return criteria
+
+    def _check(self, criterion, positions: np.ndarray) -> np.ndarray:
+        kind, payload, _ = criterion
+        if kind == 'bits':
+            return self._test_bits(payload, positions)
+        if kind == 'range':
+            col, lo, hi = payload
+            ranks = self.ranks[col][positions]
+            return (ranks >= lo) & (ranks < hi)
+        return payload[self.brand_codes[positions]]
+
+    def _expand(self, criterion) -> np.ndarray:
+        kind, payload, _ = criterion
+        if kind == 'bits':
+            return np.flatnonzero(self._unpack(payload))
+        if kind == 'range':
+            col, lo, hi = payload
+            return np.sort(self.sort_order[col][lo:hi])
+        codes = np.flatnonzero(payload)
+        if len(codes) == 0:
+            return np.array([], dtype=np.int32)
+        return np.sort(np.concatenate([
+            self.brand_order[self.brand_offsets[code]:self.brand_offsets[code + 1]] for code in codes
+        ]))
+
+    def contains(self, positions: np.ndarray, filters: Dict = None,
+                 dietary_preferences: List[str] = None) -> np.ndarray:
+        """Boolean mask over ``positions`` of the products passing every filter."""
+        return self.checker(filters, dietary_preferences)(positions)
+
+    def checker(self, filters: Dict = None,
+                dietary_preferences: List[str] = None) -> Callable[[np.ndarray], np.ndarray]:
+        """``contains`` with the filters compiled once, for checking many position arrays."""
+        criteria = self._compile(filters, dietary_preferences)
+        removed_bits = self.removed_bits
+
+        def check(positions: np.ndarray) -> np.ndarray:
+            mask = np.ones(len(positions), dtype=bool)
+            if removed_bits is not None:
+                mask &= ~self._test_bits(removed_bits, positions)
+            for criterion in criteria:
+                mask &= self._check(criterion, positions)
+            return mask
+        return check
+
+    def matching_positions(self, filters: Dict = None, dietary_preferences: List[str] = None,
+                           max_fraction: float = 1.0) -> Optional[np.ndarray]:
+        """Sorted positions of all products passing every filter.
+
+        Returns ``None`` when no filter applies, or when the most selective
+        filter alone still matches more than ``max_fraction`` of the catalog
+        (expanding it would cost more than checking candidates later).
+        """
+        criteria = self._compile(filters, dietary_preferences)
+        if not criteria:
+            return None
+
+        criteria.sort(key=lambda criterion: criterion[2])
+        if criteria[0][2] > max_fraction * self.n_products:
+            return None
+
+        # Expand the most selective filter and check the others on its products only
+        positions = self._expand(criteria[0])
+        for criterion in criteria[1:]:
+            positions = positions[self._check(criterion, positions)]
+        if self.removed_bits is not None:
+            positions = positions[~self._test_bits(self.removed_bits, positions)]
+        return positions
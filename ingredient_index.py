@@ -0,0 +1,302 @@
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from typing import List
+
+
+def ingredient_terms(ingredients_text: pd.Series, min_length: int = 3) -> pd.Series:
+    """Cleaned ingredient terms of each product: lowercased ``[,;()]``-separated fragments.
+
+    The result is indexed like ``ingredients_text``, one entry per fragment.
+    """
+    fragments = (
+        ingredients_text.dropna()
+        .astype(str)
+        .str.lower()
+        .str.split(r'[,;()]\s*', regex=True)
+        .explode()
+        .dropna()
+        .str.replace(r'\([^)]*\)', '', regex=True)
+        .str.strip()
+    )
+    return fragments[fragments.str.len() >= min_length]
+
+
+class IngredientSuggestionIndex:
+    """Prebuilt vocabulary of cleaned ingredient terms for autocomplete.
+
+    Terms are stored in popularity order (term id 0 is the ingredient found in
+    the most products) together with a suffix array over every term, so both
+    prefix and substring lookups are a binary search followed by picking the
+    smallest term ids in the matching range.
+    """
+
+    def __init__(self, terms: List[str], frequencies: np.ndarray):
+        self.terms = list(terms)
+        self.frequencies = np.asarray(frequencies, dtype=np.int64)
+        self._build_suffix_array()
+
+    @classmethod
+    def from_ingredients(cls, ingredients_text: pd.Series, min_length: int = 3) -> 'IngredientSuggestionIndex':
+        """Build the index from the raw ``ingredients_text`` column."""
+        return cls.from_counts(cls.count_terms(ingredients_text, min_length))
+
+    @classmethod
+    def from_counts(cls, counts: pd.Series) -> 'IngredientSuggestionIndex':
+        """Build the index from product counts per term, e.g. summed over catalog chunks."""
+        if counts.empty:
+            return cls([], np.array([], dtype=np.int64))
+
+        counts = cls._by_popularity(counts.astype(np.int64))
+        return cls(counts.index.tolist(), counts.to_numpy())
+
+    @staticmethod
+    def count_terms(ingredients_text: pd.Series, min_length: int = 3) -> pd.Series:
+        """Number of products listing each cleaned ingredient term."""
+        fragments = ingredient_terms(ingredients_text, min_length)
+
+        # Count each term once per product so popularity means "found in N products"
+        pairs = pd.DataFrame({'row': fragments.index, 'term': fragments.to_numpy()}).drop_duplicates()
+        return pairs['term'].value_counts(sort=False)
+
+    @staticmethod
+    def _by_popularity(counts: pd.Series) -> pd.Series:
+        """Most common terms first, ties in alphabetical order."""
+        return counts.sort_index(kind='stable').sort_values(ascending=False, kind='stable')
+
+    def update(self, added_text: pd.Series, removed_text: pd.Series, min_length: int = 3):
+        """Apply a catalog delta without rebuilding the suffix array from scratch.
+
+        Suffixes of new terms are sorted on their own and merged into the
+        existing array; terms no product uses any more are dropped, and term
+        ids are renumbered to keep popularity order.
+        """
+        delta = self.count_terms(added_text, min_length).sub(
+            self.count_terms(removed_text, min_length), fill_value=0
+        )
+        if delta.empty:
+            return
+
+        current = pd.Series(self.frequencies, index=self.terms)
+        new_terms = [term for term in delta.index if term not in current.index]
+        frequencies = current.add(delta, fill_value=0).reindex(self.terms + new_terms).fillna(0)
+
+        # Merge the suffixes of new terms into the existing suffix array
+        if new_terms:
+            new_ids, new_offsets = [], []
+            for term_id, term in enumerate(new_terms, start=len(self.terms)):
+                new_ids.extend([term_id] * len(term))
+                new_offsets.extend(range(len(term)))
+            self.terms = self.terms + new_terms
+            order = sorted(range(len(new_ids)), key=lambda i: self.terms[new_ids[i]][new_offsets[i]:])
+            new_ids = np.asarray(new_ids, dtype=np.int32)[order]
+            new_offsets = np.asarray(new_offsets, dtype=np.int32)[order]
+            positions = [self._lower_bound(self.terms[term_id][offset:])
+                         for term_id, offset in zip(new_ids, new_offsets)]
+            self._sa_terms = np.insert(self._sa_terms, positions, new_ids)
+            self._sa_offsets = np.insert(self._sa_offsets, positions, new_offsets)
+
+        # Renumber terms in popularity order, dropping unused ones
+        ranked = self._by_popularity(frequencies[frequencies > 0].astype(np.int64))
+        old_ids = {term: term_id for term_id, term in enumerate(self.terms)}
+        remap = np.full(len(self.terms), -1, dtype=np.int32)
+        remap[[old_ids[term] for term in ranked.index]] = np.arange(len(ranked), dtype=np.int32)
+
+        keep = remap[self._sa_terms] >= 0
+        self._sa_terms = remap[self._sa_terms[keep]]
+        self._sa_offsets = self._sa_offsets[keep]
+        self.terms = ranked.index.tolist()
+        self.frequencies = ranked.to_numpy(dtype=np.int64)
+
+    def to_arrays(self):
+        """Arrays and metadata needed to restore the index without rebuilding it."""
+        arrays = {
+            'terms': self.terms,
+            'frequencies': self.frequencies,
+            'sa_terms': self._sa_terms,
+            'sa_offsets': self._sa_offsets
+        }
+        return arrays, {}
+
+    @classmethod
+    def from_arrays(cls, arrays, meta) -> 'IngredientSuggestionIndex':
+        index = cls.__new__(cls)
+        index.terms = list(arrays['terms'])
+        index.frequencies = arrays['frequencies']
+        index._sa_terms = arrays['sa_terms']
+        index._sa_offsets = arrays['sa_offsets']
+        return index
+
+    def _build_suffix_array(self):
+        """Sort every (term, offset) suffix lexicographically."""
+        term_ids = []
+        offsets = []
+        for term_id, term in enumerate(self.terms):
+            term_ids.extend([term_id] * len(term))
+            offsets.extend(range(len(term)))
+
+        term_ids = np.asarray(term_ids, dtype=np.int32)
+        offsets = np.asarray(offsets, dtype=np.int32)
+        order = sorted(range(len(term_ids)), key=lambda i: self.terms[term_ids[i]][offsets[i]:])
+
+        self._sa_terms = term_ids[order] if len(order) else term_ids
+        self._sa_offsets = offsets[order] if len(order) else offsets
+
+    def _suffix(self, position: int) -> str:
+        return self.terms[self._sa_terms[position]][self._sa_offsets[position]:]
+
+    def _lower_bound(self, key: str) -> int:
+        lo, hi = 0, len(self._sa_terms)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._suffix(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _match_range(self, partial: str):
+        """Return the suffix array slice of suffixes starting with ``partial``."""
+        return self._lower_bound(partial), self._lower_bound(partial + '\U0010ffff')
+
+    def search(self, partial: str, limit: int = 10, prefix_only: bool = False) -> List[str]:
+        """Return up to ``limit`` terms containing ``partial``, most popular first."""
+        partial = partial.lower().strip() if partial else ''
+        if not partial or limit <= 0 or not self.terms:
+            return []
+
+        lo, hi = self._match_range(partial)
+        if lo >= hi:
+            return []
+
+        candidates = self._sa_terms[lo:hi]
+        if prefix_only:
+            candidates = candidates[self._sa_offsets[lo:hi] == 0]
+
+        return [self.terms[term_id] for term_id in self._smallest_unique(candidates, limit)]
+
+    @staticmethod
+    def _smallest_unique(ids: np.ndarray, k: int) -> np.ndarray:
+        """Smallest ``k`` distinct ids without sorting the whole range."""
+        if len(ids) == 0:
+            return ids
+
+        take = k
+        while True:
+            if take >= len(ids):
+                return np.unique(ids)[:k]
+            smallest = np.unique(np.partition(ids, take)[:take + 1])
+            if len(smallest) >= k:
+                return smallest[:k]
+            take *= 2
+
+    def containing(self, partial: str) -> List[str]:
+        """Every term containing ``partial`` (taken as is, not normalized)."""
+        if not partial or not self.terms:
+            return []
+        lo, hi = self._match_range(partial)
+        return [self.terms[term_id] for term_id in np.unique(self._sa_terms[lo:hi]).tolist()]
+
+    def frequency(self, term: str) -> int:
+        """Number of products listing ``term`` as an ingredient."""
+        lo, hi = self._match_range(term)
+        for position in range(lo, hi):
+            if self._sa_offsets[position] == 0 and self._suffix(position) == term:
+                return int(self.frequencies[self._sa_terms[position]])
+        return 0
+
+    def __len__(self) -> int:
+        return len(self.terms)
+
+
+class IngredientIncidence:
+    """Product x ingredient-term incidence matrix.
+
+    Row ``i`` marks the cleaned ingredient terms (see ``ingredient_terms``)
+    of the product at position ``i``, so the products listing any of a set
+    of terms are read from the matrix instead of scanning their text.
+    Columns are numbered in order of first appearance; terms only removed
+    products used keep their column.
+    """
+
+    def __init__(self, terms: List[str], matrix: sp.csr_matrix):
+        self.terms = list(terms)
+        self.columns = {term: column for column, term in enumerate(self.terms)}
+        self.matrix = matrix
+
+    @classmethod
+    def from_ingredients(cls, ingredients_text: pd.Series, min_length: int = 3) -> 'IngredientIncidence':
+        """Build the matrix from the raw ``ingredients_text`` column, one row per product."""
+        index = cls([], sp.csr_matrix((0, 0), dtype=np.uint8))
+        index.append(ingredients_text, min_length)
+        return index
+
+    def append(self, ingredients_text: pd.Series, min_length: int = 3):
+        """Add rows for new products at the end, with columns for terms not seen before."""
+        positional = pd.Series(ingredients_text.to_numpy(), index=np.arange(len(ingredients_text)))
+        fragments = ingredient_terms(positional, min_length)
+        pairs = pd.DataFrame({'row': fragments.index.to_numpy(dtype=np.int64), 'term': fragments.to_numpy()})
+        pairs = pairs.drop_duplicates()
+
+        for term in pd.unique(pairs['term']):
+            if term not in self.columns:
+                self.columns[term] = len(self.terms)
+                self.terms.append(term)
+        columns = pairs['term'].map(self.columns).to_numpy(dtype=np.int32)
+
+        rows = sp.csr_matrix(
+            (np.ones(len(pairs), dtype=np.uint8), (pairs['row'].to_numpy(), columns)),
+            shape=(len(ingredients_text), len(self.terms))
+        )
+        rows.sort_indices()
+        matrix = self.matrix
+        matrix = sp.csr_matrix((matrix.data, matrix.indices, matrix.indptr), shape=(matrix.shape[0], len(self.terms)))
+        self.matrix = sp.vstack([matrix, rows], format='csr')
+
+    def term_columns(self, terms: List[str]) -> np.ndarray:
+        """Sorted columns of the given terms, skipping those no product ever listed."""
+        return np.unique(np.array([self.columns[term] for term in terms if term in self.columns], dtype=np.int64))
+
+    def matches(self, positions: np.ndarray, term_sets: List[np.ndarray]) -> np.ndarray:
+        """Whether each product at ``positions`` lists any term of each set (rows x sets, bool).
+
+        ``term_sets`` are sorted column arrays (see ``term_columns``). The
+        rows' stored entries are gathered straight from the CSR arrays and,
+        per set, counted in the set's columns.
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        indptr = self.matrix.indptr
+        starts, lengths = indptr[positions], indptr[positions + 1] - indptr[positions]
+        entries = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        terms = self.matrix.indices[entries]
+        rows = np.repeat(np.arange(len(positions)), lengths)
+
+        matched = np.zeros((len(positions), len(term_sets)), dtype=bool)
+        for i, columns in enumerate(term_sets):
+            if len(columns) == 0:
+                continue
+            slots = np.minimum(np.searchsorted(columns, terms), len(columns) - 1)
+            counts = np.bincount(rows[columns[slots] == terms], minlength=len(positions))
+            matched[:, i] = counts > 0
+        return matched
+
+    def __len__(self) -> int:
+        return self.matrix.shape[0]
+
+    def to_arrays(self):
+        """Arrays and metadata needed to restore the index without rebuilding it."""
+        arrays = {
+            'terms': self.terms,
+            'indices': self.matrix.indices,
+            'indptr': self.matrix.indptr
+        }
+        return arrays, {'shape': list(self.matrix.shape)}
+
+    @classmethod
+    def from_arrays(cls, arrays, meta) -> 'IngredientIncidence':
+        indices = arrays['indices']
+        matrix = sp.csr_matrix(tuple(meta['shape']), dtype=np.uint8)
+        matrix.data = np.ones(len(indices), dtype=np.uint8)
+        matrix.indices = indices
+        matrix.indptr = arrays['indptr']
+        return cls(arrays['terms'], matrix)
@@ -0,0 +1,229 @@
+import numpy as np
+import scipy.sparse as sp
+from typing import Callable, List, Tuple
+
+# Slack on the pruning bounds so floating-point summation order never drops
+# a product the exact path would rank
+BOUND_EPSILON = 1e-9
+
+# Queries whose posting lists hold fewer entries than the catalog has
+# products over this factor merge them; others accumulate by position
+SPARSE_ACCUMULATION_FACTOR = 8
+
+
+class InvertedIndex:
+    """Term -> posting list index over a TF-IDF matrix.
+
+    The matrix is stored column-wise: the products containing term ``t`` are
+    ``docs[offsets[t]:offsets[t + 1]]`` (sorted), with their TF-IDF weights in
+    ``weights`` and BM25 weights in ``bm25_weights``. ``max_weights`` and
+    ``max_bm25`` hold each term's largest weight, the upper bounds MaxScore
+    pruning relies on.
+
+    BM25 term frequencies are recovered from the L2-normalized TF-IDF rows:
+    dividing a row by the IDF gives tf / norm, and the smallest such value in
+    a row is taken as tf = 1 (every product text has some term occurring once).
+    """
+
+    def __init__(self, matrix: sp.csr_matrix, idf: np.ndarray, k1: float = 1.2, b: float = 0.75,
+                 max_health: float = 0.0):
+        self.k1 = k1
+        self.b = b
+        # Largest health score in the catalog, the health half of the pruning bound
+        self.max_health = max_health
+
+        csc = sp.csc_matrix(matrix)
+        csc.sort_indices()
+        self.offsets = csc.indptr.astype(np.int64)
+        self.docs = csc.indices.astype(np.int32)
+        self.weights = csc.data.astype(np.float64)
+        self.max_weights = self._term_max(self.weights)
+
+        self.bm25_weights = self._bm25_weights(sp.csr_matrix(matrix), idf)
+        self.max_bm25 = self._term_max(self.bm25_weights)
+
+    def _term_max(self, weights: np.ndarray) -> np.ndarray:
+        maxima = np.zeros(len(self.offsets) - 1, dtype=weights.dtype)
+        nonempty = np.flatnonzero(np.diff(self.offsets) > 0)
+        if len(nonempty):
+            maxima[nonempty] = np.maximum.reduceat(weights, self.offsets[nonempty])
+        return maxima
+
+    def _bm25_weights(self, matrix: sp.csr_matrix, idf: np.ndarray) -> np.ndarray:
+        """BM25 weight of every posting, in column (posting list) order."""
+        n_products = matrix.shape[0]
+        row_lengths = np.diff(matrix.indptr)
+        rows = np.repeat(np.arange(n_products), row_lengths)
+
+        # Term frequencies, up to the per-row scale fixed by the smallest entry
+        scaled = matrix.data / idf[matrix.indices]
+        row_min = np.full(n_products, np.inf)
+        np.minimum.at(row_min, rows, scaled)
+        tf = np.maximum(np.rint(scaled / row_min[rows]), 1)
+
+        doc_length = np.bincount(rows, weights=tf, minlength=n_products)
+        avg_length = doc_length.mean() if n_products and doc_length.mean() > 0 else 1.0
+        doc_freq = np.diff(self.offsets)
+        bm25_idf = np.log(1 + (n_products - doc_freq + 0.5) / (doc_freq + 0.5))
+
+        saturation = tf * (self.k1 + 1) / (tf + self.k1 * (1 - self.b + self.b * doc_length[rows] / avg_length))
+        weights = sp.csr_matrix((saturation * bm25_idf[matrix.indices], matrix.indices, matrix.indptr),
+                                shape=matrix.shape).tocsc()
+        weights.sort_indices()
+        return weights.data.astype(np.float32)
+
+    def postings(self, term: int, bm25: bool = False) -> Tuple[np.ndarray, np.ndarray]:
+        start, end = self.offsets[term], self.offsets[term + 1]
+        return self.docs[start:end], (self.bm25_weights if bm25 else self.weights)[start:end]
+
+    def max_weight(self, term: int, bm25: bool = False) -> float:
+        return float((self.max_bm25 if bm25 else self.max_weights)[term])
+
+    def to_arrays(self):
+        """Arrays and metadata needed to restore the index without rebuilding it."""
+        arrays = {
+            'offsets': self.offsets,
+            'docs': self.docs,
+            'weights': self.weights,
+            'max_weights': self.max_weights,
+            'bm25_weights': self.bm25_weights,
+            'max_bm25': self.max_bm25
+        }
+        return arrays, {'k1': self.k1, 'b': self.b, 'max_health': self.max_health}
+
+    @classmethod
+    def from_arrays(cls, arrays, meta) -> 'InvertedIndex':
+        index = cls.__new__(cls)
+        for name, values in arrays.items():
+            setattr(index, name, values)
+        index.k1 = meta['k1']
+        index.b = meta['b']
+        # None for indexes saved before the bound was stored; the loader fills it in
+        index.max_health = meta.get('max_health')
+        return index
+
+
+def max_score_candidates(postings: List[Tuple[np.ndarray, np.ndarray, float, float]],
+                         keep: Callable[[np.ndarray], np.ndarray],
+                         health: np.ndarray,
+                         max_health: float,
+                         score_weights: Tuple[float, float],
+                         top_n: int,
+                         min_similarity: float) -> Tuple[np.ndarray, np.ndarray]:
+    """Products that can still make the top ``top_n``, with their similarities.
+
+    ``postings`` holds one ``(docs, weights, query_weight, max_weight)`` list
+    per query term; a product's similarity is the sum of ``query_weight * weight`` over
+    the lists it appears in. Lists are processed term-at-a-time in order of
+    decreasing upper bound (MaxScore). Once the terms left cannot lift an
+    unseen product to ``min_similarity``, or to a final score above the
+    ``top_n``-th best lower bound of the health-blended ranking (see
+    ``_calculate_scores``), the remaining lists only update products already
+    accumulated. Products passing ``keep`` (the filters) are the only ones
+    accumulated, so pruning never favours a product the filters reject.
+
+    A query costs time in the size of its posting lists, not of the
+    catalog: ``health`` (every product's health score) is only indexed, and
+    ``max_health`` is the catalog-wide maximum computed when the index was
+    built. Short posting lists (see ``SPARSE_ACCUMULATION_FACTOR``) are
+    merged once into the products they hold and scores accumulate per
+    merged product; lists covering a good part of the catalog accumulate
+    into arrays indexed by position, which then cost no more than the lists.
+
+    The result is a superset of what the exact path could rank in the top
+    ``top_n``, with identical normalization (maximum similarity).
+    """
+    health_bound = score_weights[1] * max_health / 10.0
+
+    bounds = np.array([query_weight * max_weight for _, _, query_weight, max_weight in postings])
+    order = np.argsort(-bounds, kind='stable')
+    remaining = np.concatenate([np.cumsum(bounds[order][::-1])[::-1], [0.0]])
+    if len(order) == 0:
+        return np.array([], dtype=np.int64), np.array([], dtype=np.float64)
+
+    lists = [postings[term] for term in order]
+    n_postings = sum(len(docs) for docs, _, _, _ in lists)
+    if n_postings * SPARSE_ACCUMULATION_FACTOR < len(health):
+        slots, new_slots, products = _merged_slots(lists)
+    else:
+        slots, new_slots, products = _position_slots(lists, len(health))
+
+    # Per slot: the product's similarity so far, and whether it is accumulated
+    scores = np.zeros(len(products))
+    accumulated = np.zeros(len(products), dtype=bool)
+    acc_slots = np.array([], dtype=np.int64)
+    adding = True
+
+    for step, (_, weights, query_weight, _) in enumerate(lists):
+        # Once pruned, stay pruned: a product skipped now would miss this term's weight
+        adding = adding and _can_add(remaining[step], scores[acc_slots], products[acc_slots], health,
+                                     score_weights, health_bound, top_n, min_similarity)
+        if adding:
+            new = new_slots(step)
+            new = new[keep(products[new])]
+            accumulated[new] = True
+            acc_slots = np.concatenate([acc_slots, new])
+
+        term_slots = slots[step]
+        hit = accumulated[term_slots]
+        scores[term_slots[hit]] += query_weight * weights[hit].astype(np.float64)
+
+    acc_slots = np.sort(acc_slots)
+    return products[acc_slots], scores[acc_slots]
+
+
+def _merged_slots(lists: List[Tuple]) -> Tuple[List[np.ndarray], Callable[[int], np.ndarray], np.ndarray]:
+    """Slots of the products in the posting lists, merged into sorted distinct products.
+
+    Returns each list's slots, a function giving the slots first seen in
+    list ``step``, and the product of every slot.
+    """
+    starts = np.cumsum([0] + [len(docs) for docs, _, _, _ in lists])
+    products, first, slots = np.unique(
+        np.concatenate([docs for docs, _, _, _ in lists]).astype(np.int64), return_index=True, return_inverse=True
+    )
+    first_step = np.searchsorted(starts, first, side='right') - 1
+    by_step = np.argsort(first_step, kind='stable')
+    step_starts = np.searchsorted(first_step[by_step], np.arange(len(lists) + 1))
+
+    def new_slots(step: int) -> np.ndarray:
+        return by_step[step_starts[step]:step_starts[step + 1]]
+
+    return [slots[starts[step]:starts[step + 1]] for step in range(len(lists))], new_slots, products
+
+
+def _position_slots(lists: List[Tuple], n_products: int) -> Tuple[List[np.ndarray], Callable[[int], np.ndarray], np.ndarray]:
+    """Like ``_merged_slots``, with every product's position as its slot."""
+    seen = np.zeros(n_products, dtype=bool)
+
+    def new_slots(step: int) -> np.ndarray:
+        docs = lists[step][0]
+        new = docs[~seen[docs]].astype(np.int64)
+        seen[new] = True
+        return new
+
+    return [docs for docs, _, _, _ in lists], new_slots, np.arange(n_products)
+
+
+def _can_add(bound: float, scores: np.ndarray, docs: np.ndarray, health: np.ndarray,
+             score_weights: Tuple[float, float], health_bound: float, top_n: int, min_similarity: float) -> bool:
+    """Whether a product first seen now (similarity <= ``bound``) could still rank."""
+    if bound < min_similarity - BOUND_EPSILON:
+        return False
+
+    # Products certain to pass min_similarity, whatever the remaining terms add
+    definite = scores >= min_similarity
+    if top_n <= 0 or np.count_nonzero(definite) < top_n:
+        return True
+
+    # An unseen product must not be able to become the normalizing maximum
+    max_lower = scores[definite].max()
+    if bound > max_lower or max_lower <= 0:
+        return True
+
+    # top_n-th best lower bound on the final score vs. the best an unseen product can reach
+    sim_weight, health_weight = score_weights
+    max_upper = scores.max() + bound
+    lower = sim_weight * scores[definite] / max_upper + health_weight * health[docs[definite]] / 10.0
+    threshold = np.partition(lower, len(lower) - top_n)[len(lower) - top_n]
+    return sim_weight * bound / max_lower + health_bound >= threshold - BOUND_EPSILON
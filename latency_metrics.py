@@ -0,0 +1,166 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Sequence
+
+# Histogram bucket upper bounds for stage durations (seconds) and candidate counts
+TIME_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+COUNT_BUCKETS = (0, 10, 100, 1000, 10000, 100000, 1000000, 10000000)
+
+# Trace of the recommend() call running in this thread or task, if it is being traced
+_current_trace = ContextVar('recommend_trace', default=None)
+
+
+class RequestTrace:
+    """Stage durations (seconds) and candidate counts of one ``recommend`` call."""
+    __slots__ = ('seconds', 'counts')
+
+    def __init__(self):
+        self.seconds = {}
+        self.counts = {}
+
+    def as_dict(self) -> Dict:
+        """Durations in milliseconds and counts, e.g. for a ``debug_timings`` response field."""
+        return {
+            'stages_ms': {name: round(seconds * 1000, 3) for name, seconds in self.seconds.items()},
+            'counts': dict(self.counts)
+        }
+
+
+@contextmanager
+def stage(name: str):
+    """Time a block as stage ``name`` of the current trace; a no-op when nothing is traced."""
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.seconds[name] = trace.seconds.get(name, 0.0) + time.perf_counter() - start
+
+
+def count(name: str, value: int):
+    """Record a candidate count in the current trace, if any."""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.counts[name] = int(value)
+
+
+@contextmanager
+def traced(enabled: bool = True):
+    """Trace the enclosed ``recommend`` call; yields the trace, or None when disabled.
+
+    Nested calls (e.g. a cache miss calling the ranking code) add to the
+    outermost trace.
+    """
+    if not enabled or _current_trace.get() is not None:
+        yield None
+        return
+
+    trace = RequestTrace()
+    token = _current_trace.set(trace)
+    start = time.perf_counter()
+    try:
+        yield trace
+    finally:
+        trace.seconds['total'] = time.perf_counter() - start
+        _current_trace.reset(token)
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus style."""
+    __slots__ = ('bounds', 'buckets', 'sum', 'count')
+
+    def __init__(self, bounds: Sequence[float]):
+        self.bounds = list(bounds)
+        self.buckets = [0] * (len(self.bounds) + 1)  # last bucket is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.buckets[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> List[int]:
+        totals, running = [], 0
+        for bucket in self.buckets:
+            running += bucket
+            totals.append(running)
+        return totals
+
+
+class LatencyMetrics:
+    """Thread-safe per-stage latency and candidate-count histograms.
+
+    Traces of ``recommend`` calls are folded in with ``observe``; stages timed
+    outside the recommender (e.g. JSON encoding in the API) with
+    ``observe_seconds``. ``render`` produces the Prometheus text format.
+    """
+
+    def __init__(self, time_buckets: Sequence[float] = TIME_BUCKETS,
+                 count_buckets: Sequence[float] = COUNT_BUCKETS):
+        self.time_buckets = time_buckets
+        self.count_buckets = count_buckets
+        self.stage_seconds = {}  # stage -> Histogram
+        self.stage_counts = {}  # count name -> Histogram
+        self._lock = threading.Lock()
+
+    def observe(self, trace: RequestTrace):
+        with self._lock:
+            for name, seconds in trace.seconds.items():
+                self._histogram(self.stage_seconds, name, self.time_buckets).observe(seconds)
+            for name, value in trace.counts.items():
+                self._histogram(self.stage_counts, name, self.count_buckets).observe(value)
+
+    def observe_seconds(self, name: str, seconds: float):
+        with self._lock:
+            self._histogram(self.stage_seconds, name, self.time_buckets).observe(seconds)
+
+    @staticmethod
+    def _histogram(histograms: Dict[str, Histogram], name: str, bounds: Sequence[float]) -> Histogram:
+        histogram = histograms.get(name)
+        if histogram is None:
+            histogram = histograms[name] = Histogram(bounds)
+        return histogram
+
+    def render(self, prefix: str = 'recommender') -> str:
+        lines = []
+        with self._lock:
+            self._render(lines, f'{prefix}_stage_seconds', 'Time spent in each recommend() stage.',
+                         'stage', self.stage_seconds)
+            self._render(lines, f'{prefix}_candidates', 'Products left after each recommend() stage.',
+                         'stage', self.stage_counts)
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _render(lines: List[str], metric: str, help_text: str, label: str, histograms: Dict[str, Histogram]):
+        lines.append(f'# HELP {metric} {help_text}')
+        lines.append(f'# TYPE {metric} histogram')
+        for name in sorted(histograms):
+            histogram = histograms[name]
+            bounds = [_format_value(bound) for bound in histogram.bounds] + ['+Inf']
+            for bound, total in zip(bounds, histogram.cumulative()):
+                lines.append(f'{metric}_bucket{{{label}="{name}",le="{bound}"}} {total}')
+            lines.append(f'{metric}_sum{{{label}="{name}"}} {_format_value(histogram.sum)}')
+            lines.append(f'{metric}_count{{{label}="{name}"}} {histogram.count}')
+
+
+def render_gauges(prefix: str, values: Optional[Dict], help_text: str) -> str:
+    """Numeric ``values`` (e.g. cache statistics) as Prometheus gauges."""
+    lines = []
+    for name, value in (values or {}).items():
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            lines.append(f'# HELP {prefix}_{name} {help_text}')
+            lines.append(f'# TYPE {prefix}_{name} gauge')
+            lines.append(f'{prefix}_{name} {_format_value(value)}')
+    return '\n'.join(lines) + '\n' if lines else ''
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
@@ -0,0 +1,342 @@
+"""Directory-based model artifact for RecipeProductRecommender.
+
+Layout of a saved model::
+
+    model_dir/
+        manifest.json       format version, column and vectorizer metadata,
+                            and the file backing every stored array
+        arrays/000000.npy   CSR matrices, numeric columns, index arrays
+        ...
+
+The product table is stored in its compact serving form (see product_table):
+categorical columns as codes plus categories, and long display text as the
+``TextColumn`` buffers, which are memory-mapped like every other array.
+
+Text (product columns, vocabularies, brand names) is stored as a UTF-8 byte
+buffer plus an int64 offsets array, so every file is a plain ``.npy`` that can
+be reopened with ``mmap_mode`` and shared through the page cache by several
+worker processes. Nothing is pickled, which keeps artifacts independent of the
+installed pandas/scikit-learn versions.
+"""
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from typing import Dict, List, Optional
+
+from product_table import TextColumn
+from query_encoder import QueryEncoder
+
+FORMAT_VERSION = 4
+# Version 1 artifacts predate incremental updates and have no tombstones;
+# versions 1 and 2 store the full product table, compacted on load;
+# versions 1 to 3 store the float64 TF-IDF matrices, which version 4 only
+# keeps inside the float32 similarity kernel
+SUPPORTED_VERSIONS = (1, 2, 3, 4)
+MANIFEST_NAME = 'manifest.json'
+ARRAYS_DIR = 'arrays'
+
+# Derived text only needed to fit the vectorizers
+TRAINING_COLUMNS = ('search_text', 'cleaned_ingredients')
+
+
+class _ArrayWriter:
+    """Writes arrays to sequentially numbered ``.npy`` files."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.count = 0
+        os.makedirs(os.path.join(path, ARRAYS_DIR), exist_ok=True)
+
+    def array(self, values: np.ndarray) -> str:
+        name = os.path.join(ARRAYS_DIR, f'{self.count:06d}.npy')
+        self.count += 1
+        np.save(os.path.join(self.path, name), np.ascontiguousarray(values), allow_pickle=False)
+        return name
+
+    def strings(self, values: List[str]) -> Dict:
+        encoded = [value.encode('utf-8') for value in values]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(value) for value in encoded], out=offsets[1:])
+        buffer = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+        return {'buffer': self.array(buffer), 'offsets': self.array(offsets)}
+
+    def entry(self, values) -> Dict:
+        """Store an array, or a list of strings, and describe how to read it back."""
+        if isinstance(values, np.ndarray):
+            return {'kind': 'array', 'file': self.array(values)}
+        return {'kind': 'strings', **self.strings(values)}
+
+
+class _ArrayReader:
+    def __init__(self, path: str, mmap_mode: Optional[str]):
+        self.path = path
+        self.mmap_mode = mmap_mode
+
+    def array(self, name: str) -> np.ndarray:
+        try:
+            values = np.load(os.path.join(self.path, name), mmap_mode=self.mmap_mode, allow_pickle=False)
+        except ValueError:
+            # Empty arrays cannot be memory-mapped
+            values = np.load(os.path.join(self.path, name), allow_pickle=False)
+        return np.asarray(values)
+
+    def strings(self, entry: Dict) -> List[str]:
+        buffer = np.load(os.path.join(self.path, entry['buffer']), allow_pickle=False).tobytes()
+        offsets = np.load(os.path.join(self.path, entry['offsets']), allow_pickle=False).tolist()
+        return [buffer[start:end].decode('utf-8') for start, end in zip(offsets[:-1], offsets[1:])]
+
+    def entry(self, entry: Dict):
+        if entry['kind'] == 'array':
+            return self.array(entry['file'])
+        return self.strings(entry)
+
+
+def _load_matrix(reader: _ArrayReader, entry: Dict) -> sp.csr_matrix:
+    # Reuse the (memory-mapped) arrays as-is instead of letting scipy copy them
+    matrix = sp.csr_matrix(tuple(entry['shape']), dtype=np.dtype(reader.array(entry['data']).dtype))
+    matrix.data = reader.array(entry['data'])
+    matrix.indices = reader.array(entry['indices'])
+    matrix.indptr = reader.array(entry['indptr'])
+    return matrix
+
+
+def _save_vectorizer(writer: _ArrayWriter, vectorizer) -> Dict:
+    params = vectorizer.get_params()
+    for name in ('analyzer', 'preprocessor', 'tokenizer'):
+        if callable(params[name]):
+            raise ValueError(f"Cannot store a vectorizer with a custom {name}")
+
+    params['dtype'] = np.dtype(params['dtype']).name
+    params['ngram_range'] = list(params['ngram_range'])
+    if params['stop_words'] is not None and not isinstance(params['stop_words'], str):
+        params['stop_words'] = sorted(params['stop_words'])
+
+    terms = [None] * len(vectorizer.vocabulary_)
+    for term, column in vectorizer.vocabulary_.items():
+        terms[column] = term
+
+    # The resolved stop-word list, so loading never needs scikit-learn's built-in lists
+    stop_words = vectorizer.get_stop_words()
+    return {
+        'params': params,
+        'vocabulary': writer.strings(terms),
+        'idf': writer.array(vectorizer.idf_),
+        'stop_words': None if stop_words is None else writer.strings(sorted(stop_words))
+    }
+
+
+def _load_vectorizer(reader: _ArrayReader, entry: Dict):
+    """A ``QueryEncoder`` for the stored vectorizer, or a ``TfidfVectorizer`` if it uses another analyzer."""
+    params = dict(entry['params'])
+    params['ngram_range'] = tuple(params['ngram_range'])
+
+    if QueryEncoder.supports(params):
+        if entry.get('stop_words') is not None:
+            stop_words = reader.strings(entry['stop_words'])
+        elif params['stop_words'] == 'english':
+            # Artifacts saved before the list was stored
+            from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS
+            stop_words = sorted(ENGLISH_STOP_WORDS)
+        else:
+            stop_words = params['stop_words']
+        return QueryEncoder(params, reader.strings(entry['vocabulary']), reader.array(entry['idf']), stop_words)
+
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    params['dtype'] = np.dtype(params['dtype']).type
+    vectorizer = TfidfVectorizer(**params)
+    vectorizer.vocabulary_ = {term: column for column, term in enumerate(reader.strings(entry['vocabulary']))}
+    vectorizer.idf_ = reader.array(entry['idf'])
+    return vectorizer
+
+
+def _save_column(writer: _ArrayWriter, values: pd.Series) -> Dict:
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return {
+            'kind': 'categorical',
+            'codes': writer.array(values.cat.codes.to_numpy()),
+            'categories': writer.strings([str(value) for value in values.cat.categories])
+        }
+    if pd.api.types.is_bool_dtype(values) or pd.api.types.is_numeric_dtype(values):
+        return {'kind': 'array', 'file': writer.array(values.to_numpy())}
+
+    nulls = values.isna().to_numpy()
+    entry = {'kind': 'strings', **writer.strings(values.fillna('').astype(str).tolist())}
+    if nulls.any():
+        entry['nulls'] = writer.array(nulls)
+    return entry
+
+
+def _load_column(reader: _ArrayReader, entry: Dict):
+    if entry['kind'] == 'array':
+        return reader.array(entry['file'])
+    if entry['kind'] == 'categorical':
+        return pd.Categorical.from_codes(reader.array(entry['codes']), reader.strings(entry['categories']))
+
+    values = pd.Series(reader.strings(entry), dtype=object)
+    if 'nulls' in entry:
+        values[reader.array(entry['nulls'])] = None
+    return values.to_numpy()
+
+
+def _save_text(writer: _ArrayWriter, column: TextColumn) -> Dict:
+    return {'buffer': writer.array(column.buffer), 'offsets': writer.array(column.offsets)}
+
+
+def _load_text(reader: _ArrayReader, entry: Dict) -> TextColumn:
+    return TextColumn(reader.array(entry['buffer']), reader.array(entry['offsets']))
+
+
+def _save_index(writer: _ArrayWriter, index) -> Dict:
+    arrays, meta = index.to_arrays()
+    return {
+        'meta': meta,
+        'arrays': {name: writer.entry(values) for name, values in arrays.items()}
+    }
+
+
+def _load_index(reader: _ArrayReader, index_cls, entry: Dict):
+    arrays = {name: reader.entry(array_entry) for name, array_entry in entry['arrays'].items()}
+    return index_cls.from_arrays(arrays, entry['meta'])
+
+
+def save_model(recommender, path: str):
+    """Write a fitted recommender to the directory ``path``."""
+    os.makedirs(path, exist_ok=True)
+    manifest_path = os.path.join(path, MANIFEST_NAME)
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+    writer = _ArrayWriter(path)
+
+    df = recommender.df.drop(columns=[col for col in TRAINING_COLUMNS if col in recommender.df.columns])
+    manifest = {
+        'format_version': FORMAT_VERSION,
+        'n_products': len(df),
+        'nutrition_cols': recommender.nutrition_cols,
+        'dietary_cols': recommender.dietary_cols,
+        'index': None if df.index.equals(pd.RangeIndex(len(df))) else _save_column(writer, df.index.to_series()),
+        'columns': {col: _save_column(writer, df[col]) for col in df.columns},
+        'column_order': list(df.columns),
+        'product_text': {col: _save_text(writer, column) for col, column in recommender.product_text.items()},
+        'vectorizers': {
+            'general': _save_vectorizer(writer, recommender.vectorizer),
+            'ingredient': None
+        },
+        'removed': writer.array(recommender.removed),
+        'update_stats': recommender.update_stats,
+        'indexes': {
+            'kernel': _save_index(writer, recommender.similarity_kernel),
+            'suggestion': _save_index(writer, recommender.suggestion_index),
+            'incidence': _save_index(writer, recommender.ingredient_incidence),
+            'filter': _save_index(writer, recommender.filter_index),
+            'browse': _save_index(writer, recommender.browse_index),
+            'ann': {name: _save_index(writer, index) for name, index in recommender.ann_indexes.items()},
+            'inverted': {name: _save_index(writer, index) for name, index in recommender.inverted_indexes.items()},
+            'expansion': {name: _save_index(writer, index) for name, index in recommender.query_expanders.items()},
+            'neighbours': None if recommender.neighbour_graph is None else _save_index(writer, recommender.neighbour_graph)
+        }
+    }
+
+    if recommender.ingredient_vectorizer is not None:
+        manifest['vectorizers']['ingredient'] = _save_vectorizer(writer, recommender.ingredient_vectorizer)
+
+    # Write the manifest last so a partially written directory never loads
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1)
+
+
+def load_model(path: str, mmap_mode: Optional[str] = 'r'):
+    """Open a model saved with ``save_model``.
+
+    With the default ``mmap_mode='r'`` the TF-IDF matrices and index arrays are
+    memory-mapped read-only instead of being read into process memory.
+    """
+    from browse_index import BrowseIndex
+    from filter_index import FilterIndex
+    from ingredient_index import IngredientIncidence, IngredientSuggestionIndex
+    from ann_index import IvfIndex
+    from inverted_index import InvertedIndex
+    from neighbour_graph import NeighbourGraph
+    from query_expansion import QueryExpander
+    from similarity_kernel import SimilarityKernel
+    from recommender import RecipeProductRecommender
+
+    with open(os.path.join(path, MANIFEST_NAME), encoding='utf-8') as f:
+        manifest = json.load(f)
+
+    if manifest.get('format_version') not in SUPPORTED_VERSIONS:
+        raise ValueError(
+            f"Unsupported model format version {manifest.get('format_version')} "
+            f"(supported: {', '.join(map(str, SUPPORTED_VERSIONS))})"
+        )
+
+    reader = _ArrayReader(path, mmap_mode)
+
+    index = None
+    if manifest['index'] is not None:
+        index = _load_column(reader, manifest['index'])
+    df = pd.DataFrame(
+        {col: _load_column(reader, manifest['columns'][col]) for col in manifest['column_order']},
+        index=index
+    )
+
+    # Start from the constructor's defaults (empty fit timings, no optional indexes), then restore
+    recommender = RecipeProductRecommender.__new__(RecipeProductRecommender)
+    recommender._init_state(df)
+    recommender.nutrition_cols = manifest['nutrition_cols']
+    recommender.dietary_cols = manifest['dietary_cols']
+    recommender.vectorizer = _load_vectorizer(reader, manifest['vectorizers']['general'])
+    recommender.ingredient_vectorizer = None
+    if manifest['vectorizers']['ingredient'] is not None:
+        recommender.ingredient_vectorizer = _load_vectorizer(reader, manifest['vectorizers']['ingredient'])
+
+    if 'removed' in manifest:
+        recommender.removed = np.array(reader.array(manifest['removed']))
+        recommender.update_stats = manifest['update_stats']
+    else:
+        recommender.removed = np.zeros(len(df), dtype=bool)
+        recommender.update_stats = RecipeProductRecommender._empty_update_stats()
+
+    if 'kernel' in manifest['indexes']:
+        recommender.similarity_kernel = _load_index(reader, SimilarityKernel, manifest['indexes']['kernel'])
+    else:
+        matrices = manifest['matrices']
+        recommender._build_similarity_kernel(
+            _load_matrix(reader, matrices['general']),
+            None if matrices['ingredient'] is None else _load_matrix(reader, matrices['ingredient'])
+        )
+    recommender.suggestion_index = _load_index(reader, IngredientSuggestionIndex, manifest['indexes']['suggestion'])
+    recommender.filter_index = _load_index(reader, FilterIndex, manifest['indexes']['filter'])
+    if 'browse' in manifest['indexes']:
+        recommender.browse_index = _load_index(reader, BrowseIndex, manifest['indexes']['browse'])
+    else:
+        recommender._build_browse_index()
+    recommender.ann_indexes = {
+        name: _load_index(reader, IvfIndex, entry) for name, entry in manifest['indexes'].get('ann', {}).items()
+    }
+    recommender.inverted_indexes = {
+        name: _load_index(reader, InvertedIndex, entry)
+        for name, entry in manifest['indexes'].get('inverted', {}).items()
+    }
+    for index in recommender.inverted_indexes.values():
+        if index.max_health is None:
+            index.max_health = float(df['health_score'].max()) if len(df) else 0.0
+    recommender.query_expanders = {
+        name: _load_index(reader, QueryExpander, entry)
+        for name, entry in manifest['indexes'].get('expansion', {}).items()
+    }
+    recommender.neighbour_graph = None
+    if manifest['indexes'].get('neighbours') is not None:
+        recommender.neighbour_graph = _load_index(reader, NeighbourGraph, manifest['indexes']['neighbours'])
+
+    if 'product_text' in manifest:
+        recommender.product_text = {col: _load_text(reader, entry) for col, entry in manifest['product_text'].items()}
+    else:
+        recommender._compact()
+    if 'incidence' in manifest['indexes']:
+        recommender.ingredient_incidence = _load_index(reader, IngredientIncidence, manifest['indexes']['incidence'])
+    else:
+        recommender._build_ingredient_incidence()
+    return recommender
@@ -0,0 +1,99 @@
+"""Precomputed product-to-product neighbour graph for "similar products" lookups.
+
+For every product the graph stores its ``k`` most similar products, under
+the blend of general and ingredient TF-IDF cosine similarity that
+``recommend`` uses, as two ``n x k`` arrays read best first: neighbour
+positions (``-1`` pads rows with fewer neighbours) and their similarities.
+A lookup reads one row.
+
+Building compares every product with every other one, so it is quadratic in
+the catalog size and meant to run offline. Rows are processed in blocks
+whose dense similarity block holds at most ``block_entries`` values, which
+bounds the memory needed on top of the matrices.
+"""
+import numpy as np
+import scipy.sparse as sp
+from typing import Optional, Tuple
+
+# Similarity values held per block while building (8 bytes each)
+BLOCK_ENTRIES = 16 * 1024 * 1024
+
+
+class NeighbourGraph:
+    """Top-``k`` neighbours of every product.
+
+    Products in ``excluded`` (e.g. tombstoned rows) are nobody's neighbour;
+    products sharing no term with a product are never its neighbours.
+    """
+
+    def __init__(self, general: sp.csr_matrix, ingredient: Optional[sp.csr_matrix] = None,
+                 k: int = 20, ingredient_weight: float = 0.4, excluded: Optional[np.ndarray] = None,
+                 block_entries: int = BLOCK_ENTRIES):
+        n_products = general.shape[0]
+        self.k = k
+        self.ingredient_weight = ingredient_weight
+        self.neighbours = np.full((n_products, k), -1, dtype=np.int32)
+        self.similarities = np.zeros((n_products, k), dtype=np.float32)
+
+        parts = [(general, 1 - ingredient_weight)]
+        if ingredient is not None:
+            parts.append((ingredient, ingredient_weight))
+        # Transpose once, so each block is a CSR x CSR product
+        parts = [(matrix, matrix.T.tocsr(), weight) for matrix, weight in parts if weight != 0]
+
+        block_rows = max(1, block_entries // max(n_products, 1))
+        for start in range(0, n_products, block_rows):
+            end = min(start + block_rows, n_products)
+            block = np.zeros((end - start, n_products))
+            for matrix, transposed, weight in parts:
+                block += weight * (matrix[start:end] @ transposed).toarray()
+
+            # A product is not its own neighbour
+            block[np.arange(end - start), np.arange(start, end)] = 0
+            if excluded is not None and excluded.any():
+                block[:, excluded] = 0
+            self._add_block(start, block)
+
+    def _add_block(self, start: int, block: np.ndarray):
+        """Keep the ``k`` best positive similarities of each row, ties broken by position."""
+        k = min(self.k, block.shape[1])
+        if k == 0:
+            return
+        if k < block.shape[1]:
+            candidates = np.argpartition(-block, k - 1, axis=1)[:, :k]
+        else:
+            candidates = np.broadcast_to(np.arange(block.shape[1]), block.shape)
+        values = np.take_along_axis(block, candidates, axis=1)
+
+        order = np.lexsort((candidates, -values), axis=-1)
+        candidates = np.take_along_axis(candidates, order, axis=1)
+        values = np.take_along_axis(values, order, axis=1)
+
+        rows = slice(start, start + block.shape[0])
+        self.neighbours[rows, :k] = np.where(values > 0, candidates, -1)
+        self.similarities[rows, :k] = np.where(values > 0, values, 0)
+
+    def neighbours_of(self, position: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Neighbour positions and similarities of one product, best first."""
+        neighbours = self.neighbours[position]
+        found = neighbours >= 0
+        return neighbours[found], self.similarities[position][found]
+
+    def append(self, n_new: int):
+        """Add rows without neighbours for new products (rebuild the graph to link them)."""
+        self.neighbours = np.concatenate([self.neighbours, np.full((n_new, self.k), -1, dtype=np.int32)])
+        self.similarities = np.concatenate([self.similarities, np.zeros((n_new, self.k), dtype=np.float32)])
+
+    def to_arrays(self):
+        """Arrays and metadata needed to restore the graph without rebuilding it."""
+        arrays = {'neighbours': self.neighbours, 'similarities': self.similarities}
+        return arrays, {'k': self.k, 'ingredient_weight': self.ingredient_weight}
+
+    @classmethod
+    def from_arrays(cls, arrays, meta) -> 'NeighbourGraph':
+        graph = cls.__new__(cls)
+        graph.neighbours = arrays['neighbours']
+        graph.similarities = arrays['similarities']
+        graph.k = meta['k']
+        graph.ingredient_weight = meta['ingredient_weight']
+        return graph
@@ -0,0 +1,177 @@
+import sys
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+from typing import Dict, List, Tuple
+
+# Low-cardinality display columns stored as categoricals
+CATEGORICAL_COLS = ['brands', 'nutriscore_grade', 'health_category']
+
+# Long display text kept out of the frame and decoded only for returned products
+TEXT_COLS = ['categories', 'ingredients_text']
+
+# Other columns queries read from the serving frame
+SERVING_COLS = ['product_name', 'health_score']
+
+
+class TextColumn:
+    """Strings stored as one UTF-8 buffer plus int64 offsets.
+
+    Rows are decoded only when taken, so a catalog of long ingredient lists
+    costs its encoded size instead of one Python string object per product.
+    The arrays can be memory-mapped straight from a saved artifact.
+    """
+
+    def __init__(self, buffer: np.ndarray, offsets: np.ndarray):
+        self.buffer = buffer
+        self.offsets = offsets
+
+    @classmethod
+    def from_series(cls, values: pd.Series) -> 'TextColumn':
+        encoded = [value.encode('utf-8') for value in values.fillna('').astype(str)]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(value) for value in encoded], out=offsets[1:])
+        return cls(np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def take(self, positions: np.ndarray) -> List[str]:
+        starts = self.offsets[positions].tolist()
+        ends = self.offsets[np.asarray(positions) + 1].tolist()
+        return [self.buffer[start:end].tobytes().decode('utf-8') for start, end in zip(starts, ends)]
+
+    def append(self, other: 'TextColumn') -> 'TextColumn':
+        return TextColumn.concat([self, other])
+
+    @classmethod
+    def concat(cls, columns: List['TextColumn']) -> 'TextColumn':
+        """One column holding the rows of ``columns`` in order."""
+        starts = np.cumsum([0] + [len(column.buffer) for column in columns[:-1]])
+        offsets = [column.offsets[:-1] + start for column, start in zip(columns, starts)]
+        offsets.append(np.array([starts[-1] + len(columns[-1].buffer)], dtype=np.int64))
+        return cls(np.concatenate([column.buffer for column in columns]), np.concatenate(offsets))
+
+
+def compact_frame(df: pd.DataFrame, nutrition_cols: Dict[str, str]) -> Tuple[pd.DataFrame, Dict[str, TextColumn]]:
+    """Serving representation of a prepared product frame.
+
+    Keeps only what ranking and ``_result_columns`` read: categorical brands,
+    grades and health categories, float32 nutrition values and the health
+    score. Training text, dietary flags (held bit-packed by ``FilterIndex``)
+    and unused source columns are dropped; long display text is returned
+    separately as ``TextColumn`` buffers.
+    """
+    frame = pd.DataFrame(index=df.index)
+    for col in df.columns:
+        if col in CATEGORICAL_COLS:
+            frame[col] = df[col].astype('category')
+        elif col in nutrition_cols.values():
+            frame[col] = df[col].to_numpy(dtype=np.float32)
+        elif col in SERVING_COLS:
+            frame[col] = df[col]
+
+    texts = {col: TextColumn.from_series(df[col]) for col in TEXT_COLS if col in df.columns}
+    return frame, texts
+
+
+def append_frame(frame: pd.DataFrame, new_frame: pd.DataFrame) -> pd.DataFrame:
+    """Concatenate compact frames, merging categories instead of falling back to object."""
+    return concat_frames([frame, new_frame])
+
+
+def concat_frames(frames: List[pd.DataFrame], sort_categories: bool = False) -> pd.DataFrame:
+    """Concatenate compact frames in order, with the columns of the first one.
+
+    ``sort_categories`` sorts the merged categories, as ``compact_frame`` on
+    the whole catalog would have; otherwise they keep order of appearance.
+    """
+    first, rest = frames[0], [frame.reindex(columns=frames[0].columns) for frame in frames[1:]]
+    columns = {}
+    for col in first.columns:
+        if isinstance(first[col].dtype, pd.CategoricalDtype):
+            values = union_categoricals([first[col].array] + [frame[col].astype('category').array for frame in rest],
+                                        sort_categories=sort_categories)
+        elif first[col].dtype == np.float32:
+            values = np.concatenate([first[col].to_numpy()]
+                                    + [frame[col].fillna(0).to_numpy(dtype=np.float32) for frame in rest])
+        else:
+            values = pd.concat([first[col]] + [frame[col] for frame in rest], ignore_index=True).array
+        columns[col] = values
+    return pd.DataFrame(columns, index=first.index.append([frame.index for frame in rest]))
+
+
+def widen(values: np.ndarray) -> np.ndarray:
+    """float32 values as float64, via the shortest decimal that round-trips each float32.
+
+    This gives back source values of up to about 7 significant digits (e.g.
+    ``12.3`` rather than ``12.300000190734863``); longer ones stay rounded
+    to float32 precision (``33.333333333`` comes back as ``33.333332``).
+    """
+    return np.asarray(values).astype(str).astype(np.float64)
+
+
+def take_columns(frame: pd.DataFrame, texts: Dict[str, TextColumn], positions: np.ndarray,
+                 columns: List[str]) -> Dict[str, np.ndarray]:
+    """Values of ``columns`` at ``positions`` with original dtypes and long text decoded."""
+    taken = {}
+    for col in columns:
+        if col in texts:
+            taken[col] = np.array(texts[col].take(positions), dtype=object)
+        elif isinstance(frame[col].dtype, pd.CategoricalDtype):
+            taken[col] = np.asarray(frame[col].array.take(positions), dtype=object)
+        elif frame[col].dtype == np.float32:
+            taken[col] = widen(frame[col].to_numpy()[positions])
+        else:
+            taken[col] = frame[col].to_numpy()[positions]
+    return taken
+
+
+class ProductColumns:
+    """Recommendation results as parallel columns, one NumPy array per field.
+
+    Much cheaper than a DataFrame to build and to turn into JSON for the few
+    rows a query returns. Results are shared with the result cache, so the
+    arrays are read-only.
+    """
+    __slots__ = ('columns',)
+
+    def __init__(self, columns: Dict[str, np.ndarray]):
+        for values in columns.values():
+            values.flags.writeable = False
+        self.columns = columns
+
+    def __len__(self) -> int:
+        return len(next(iter(self.columns.values()))) if self.columns else 0
+
+    def __getitem__(self, col: str) -> np.ndarray:
+        return self.columns[col]
+
+    def __contains__(self, col: str) -> bool:
+        return col in self.columns
+
+    @property
+    def fields(self) -> List[str]:
+        return list(self.columns)
+
+    @property
+    def nbytes(self) -> int:
+        size = 0
+        for values in self.columns.values():
+            size += values.nbytes
+            if values.dtype == object:
+                size += sum(sys.getsizeof(value) for value in values)
+        return size
+
+    def select(self, fields: List[str]) -> 'ProductColumns':
+        return ProductColumns({col: values for col, values in self.columns.items() if col in fields})
+
+    def to_records(self) -> List[Dict]:
+        names = list(self.columns)
+        return [dict(zip(names, row)) for row in zip(*(values.tolist() for values in self.columns.values()))]
+
+    def to_frame(self) -> pd.DataFrame:
+        if len(self) == 0:
+            return pd.DataFrame()
+        return pd.DataFrame(self.columns)
@@ -0,0 +1,130 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, List
+
+import pandas as pd
+
+# Filters whose values are sets of alternatives, so their order does not matter
+SET_FILTERS = ('nutriscore', 'brands')
+
+
+def canonical_query(recipe_text: str = "", ingredients: List[str] = None,
+                    dietary_preferences: List[str] = None, filters: Dict = None,
+                    top_n: int = 10, min_similarity: float = 0.05,
+                    prioritize_health: bool = True, ingredient_weight: float = 0.4,
+                    retrieval: str = 'exact', fields: List[str] = None) -> tuple:
+    """Cache key for ``recommend`` arguments that differ only cosmetically.
+
+    Only normalizations ``recommend`` itself is insensitive to are applied:
+    case and surrounding whitespace, whitespace runs in the recipe text, and
+    the order of nutriscore/brand alternatives. Ingredient and dietary
+    preference order is kept, since it changes the n-grams of the query.
+    Selected result fields are a set, since results keep their display order.
+    """
+    text = ' '.join((recipe_text or '').lower().split())
+    ingredient_key = tuple(ing.lower().strip() for ing in ingredients or [])
+    preference_key = tuple(dietary_preferences or [])
+
+    filter_items = []
+    for key, value in (filters or {}).items():
+        if key in SET_FILTERS:
+            values = [value] if isinstance(value, str) else list(value)
+            if key == 'brands':
+                values = [brand.lower().strip() for brand in values]
+            value = tuple(sorted(set(values), key=str))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            value = float(value)
+        else:
+            value = repr(value)
+        filter_items.append((key, value))
+
+    return (
+        text, ingredient_key, preference_key, tuple(sorted(filter_items)),
+        int(top_n), float(min_similarity), bool(prioritize_health), float(ingredient_weight), retrieval,
+        None if fields is None else tuple(sorted(set(fields)))
+    )
+
+
+class QueryCache:
+    """Thread-safe LRU cache of recommendation results with a time-to-live.
+
+    Bounded both by entry count and by the approximate memory of the cached
+    results (DataFrames, ``ProductColumns`` or anything with ``nbytes``); the
+    least recently used entries are evicted first, and entries older than
+    ``ttl`` seconds are treated as misses.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 300.0, max_bytes: int = 64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (expires_at, size, result)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key: Hashable):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    self._drop(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def put(self, key: Hashable, result) -> bool:
+        """Store ``result``; returns False when it alone exceeds ``max_bytes`` and is not cached."""
+        size = _result_size(result)
+        if size > self.max_bytes:
+            return False
+
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (time.monotonic() + self.ttl, size, result)
+            self._bytes += size
+
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+        return True
+
+    def clear(self):
+        """Drop every entry, e.g. because the catalog changed."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self.invalidations += 1
+
+    def _drop(self, key: Hashable):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations
+            }
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def _result_size(result) -> int:
+    if isinstance(result, pd.DataFrame):
+        return int(result.memory_usage(index=True, deep=True).sum())
+    return int(result.nbytes)
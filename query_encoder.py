@@ -0,0 +1,154 @@
+"""Standalone TF-IDF query encoder, so serving does not need scikit-learn.
+
+Encoding a query only takes the fitted vocabulary, IDF weights, stop words
+and tokenization settings of a ``TfidfVectorizer``. ``QueryEncoder`` holds
+exactly those and reimplements the word analyzer (preprocessing, token
+regex, stop-word removal, n-grams) and the TF-IDF weighting, so
+``transform`` returns the same matrix as the fitted vectorizer, bit for bit.
+``model_store`` loads vectorizers as encoders; fitting still uses
+scikit-learn.
+"""
+import re
+import unicodedata
+from math import sqrt
+from typing import Callable, Dict, Iterable, List, Optional
+
+import numpy as np
+import scipy.sparse as sp
+
+
+def strip_accents_unicode(text: str) -> str:
+    """Same as scikit-learn's: NFKD decomposition without the combining marks."""
+    if text.isascii():
+        return text
+    return ''.join(char for char in unicodedata.normalize('NFKD', text) if not unicodedata.combining(char))
+
+
+def strip_accents_ascii(text: str) -> str:
+    return unicodedata.normalize('NFKD', text).encode('ASCII', 'ignore').decode('ASCII')
+
+
+ACCENT_FUNCTIONS = {None: None, 'unicode': strip_accents_unicode, 'ascii': strip_accents_ascii}
+
+
+class QueryEncoder:
+    """The query-side part of a fitted word-analyzer ``TfidfVectorizer``.
+
+    Offers the attributes and methods the recommender uses on a vectorizer
+    (``vocabulary_``, ``idf_``, ``token_pattern``, ``get_stop_words``,
+    ``build_analyzer``, ``transform``, ``get_params``), so it can stand in for
+    one after loading. ``params`` are the vectorizer's ``get_params()``.
+    """
+
+    def __init__(self, params: Dict, terms: List[str], idf: np.ndarray, stop_words: Optional[List[str]]):
+        if not self.supports(params):
+            raise ValueError(f"Cannot encode queries for analyzer={params['analyzer']!r}, "
+                             f"input={params['input']!r}")
+        self.params = params
+        self.vocabulary_ = {term: column for column, term in enumerate(terms)}
+        self.idf_ = idf
+        self.token_pattern = params['token_pattern']
+        self.stop_words = None if stop_words is None else frozenset(stop_words)
+        self._init_analyzer()
+
+    @staticmethod
+    def supports(params: Dict) -> bool:
+        """Whether vectorizer ``params`` use the analyzer this encoder reimplements."""
+        return (params['analyzer'] == 'word' and params['input'] == 'content'
+                and params['preprocessor'] is None and params['tokenizer'] is None
+                and params['strip_accents'] in ACCENT_FUNCTIONS and params['norm'] in (None, 'l1', 'l2'))
+
+    @classmethod
+    def from_vectorizer(cls, vectorizer) -> 'QueryEncoder':
+        terms = [None] * len(vectorizer.vocabulary_)
+        for term, column in vectorizer.vocabulary_.items():
+            terms[column] = term
+        stop_words = vectorizer.get_stop_words()
+        return cls(vectorizer.get_params(), terms, vectorizer.idf_, None if stop_words is None else sorted(stop_words))
+
+    def _init_analyzer(self):
+        self.token_re = re.compile(self.token_pattern)
+        if self.token_re.groups > 1:
+            raise ValueError("More than 1 capturing group in token pattern. Only a single group should be captured.")
+        self.accent_function = ACCENT_FUNCTIONS[self.params['strip_accents']]
+        self.min_n, self.max_n = self.params['ngram_range']
+        self.dtype = np.dtype(self.params['dtype'])
+
+    def get_params(self) -> Dict:
+        return dict(self.params)
+
+    def get_stop_words(self):
+        return self.stop_words
+
+    def build_analyzer(self) -> Callable[[str], List[str]]:
+        return self.analyze
+
+    def analyze(self, text: str) -> List[str]:
+        """Features of a document, in ``TfidfVectorizer.build_analyzer()`` order."""
+        if self.params['lowercase']:
+            text = text.lower()
+        if self.accent_function is not None:
+            text = self.accent_function(text)
+        tokens = self.token_re.findall(text)
+        if self.stop_words is not None:
+            tokens = [token for token in tokens if token not in self.stop_words]
+
+        if self.max_n == 1:
+            return tokens
+        min_n = self.min_n
+        features = list(tokens) if min_n == 1 else []
+        for n in range(max(min_n, 2), min(self.max_n + 1, len(tokens) + 1)):
+            features.extend(' '.join(tokens[i:i + n]) for i in range(len(tokens) - n + 1))
+        return features
+
+    def transform(self, documents: Iterable[str]) -> sp.csr_matrix:
+        """TF-IDF rows of ``documents``, as ``TfidfVectorizer.transform`` computes them."""
+        vocabulary = self.vocabulary_
+        indices, counts, indptr = [], [], [0]
+        for document in documents:
+            row = {}
+            for feature in self.analyze(document):
+                column = vocabulary.get(feature)
+                if column is not None:
+                    row[column] = row.get(column, 0) + 1
+            for column in sorted(row):
+                indices.append(column)
+                counts.append(row[column])
+            indptr.append(len(indices))
+
+        data = np.array(counts, dtype=self.dtype)
+        if self.params['binary']:
+            data.fill(1)
+        if self.params['sublinear_tf']:
+            np.log(data, data)
+            data += 1.0
+        indices = np.array(indices, dtype=np.int32)
+        if self.params['use_idf']:
+            data *= self.idf_[indices]
+        if self.params['norm'] is not None:
+            self._normalize(data, indptr)
+        return sp.csr_matrix((data, indices, np.array(indptr, dtype=np.int32)),
+                             shape=(len(indptr) - 1, len(vocabulary)))
+
+    def _normalize(self, data: np.ndarray, indptr: List[int]):
+        """Scale each row to unit norm in place, summing in the same order as scikit-learn."""
+        terms = (data * data if self.params['norm'] == 'l2' else np.abs(data)).tolist()
+        for start, end in zip(indptr[:-1], indptr[1:]):
+            total = 0.0
+            for value in terms[start:end]:
+                total += value
+            if total == 0.0:
+                continue
+            if self.params['norm'] == 'l2':
+                total = sqrt(total)
+            data[start:end] = data[start:end] / np.float64(total)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for name in ('token_re', 'accent_function', 'min_n', 'max_n', 'dtype'):
+            state.pop(name, None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._init_analyzer()
@@ -0,0 +1,181 @@
+import re
+import unicodedata
+from functools import lru_cache
+from typing import Dict, List
+
+import numpy as np
+
+# Shortest token worth correcting, and the length from which two edits are allowed
+MIN_CORRECTION_LENGTH = 4
+TWO_EDIT_LENGTH = 7
+
+
+def fold(text: str) -> str:
+    """Lowercase and strip accents like the vectorizers (``strip_accents='unicode'``)."""
+    text = unicodedata.normalize('NFKD', text.lower())
+    return ''.join(char for char in text if not unicodedata.combining(char))
+
+
+def trigrams(word: str) -> List[str]:
+    padded = f'^{word}$'
+    return sorted({padded[i:i + 3] for i in range(len(padded) - 2)})
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """Optimal string alignment distance (adjacent swaps count once), or ``limit + 1`` once it exceeds ``limit``."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+
+    previous2, previous = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+class QueryExpander:
+    """Query-side normalization and typo correction against one vectorizer's vocabulary.
+
+    Query tokens are accent-folded and tokenized like the vectorizer does.
+    Every word stays in place, so product n-grams spanning function words
+    ("tarte aux pommes") still match; only the vectorizer's own stop words,
+    which it ignores anyway, are dropped. A token that is no word of the
+    vocabulary (of any of its n-grams) is replaced by the closest vocabulary
+    word within one edit (two for tokens of ``TWO_EDIT_LENGTH`` characters or
+    more), preferring common words (low IDF) on ties.
+
+    Candidates come from a character-trigram index: ``trigram_terms`` lists
+    the words containing each trigram (sliced by ``trigram_offsets``), and
+    only words sharing enough trigrams for the edit budget are verified with
+    ``edit_distance``. Corrections are memoized per token.
+    """
+
+    def __init__(self, words: List[str], idf: np.ndarray, token_pattern: str, stop_words: List[str],
+                 cache_size: int = 65536):
+        self.words = list(words)
+        self.idf = np.asarray(idf, dtype=np.float32)
+        self.token_pattern = token_pattern
+        self.stop_words = frozenset(stop_words)
+        self.cache_size = cache_size
+
+        postings = {}
+        self.trigram_counts = np.empty(len(self.words), dtype=np.int32)
+        for term, word in enumerate(self.words):
+            grams = trigrams(word)
+            self.trigram_counts[term] = len(grams)
+            for gram in grams:
+                postings.setdefault(gram, []).append(term)
+
+        keys = sorted(postings)
+        self.trigram_keys = keys
+        self.trigram_offsets = np.zeros(len(keys) + 1, dtype=np.int64)
+        np.cumsum([len(postings[key]) for key in keys], out=self.trigram_offsets[1:])
+        self.trigram_terms = np.array([term for key in keys for term in postings[key]], dtype=np.int32)
+        self._init_lookup()
+
+    @classmethod
+    def from_vectorizer(cls, vectorizer, cache_size: int = 65536) -> 'QueryExpander':
+        """Index every word occurring in the fitted vocabulary (unigrams and n-gram parts)."""
+        idf = {}
+        for feature, column in vectorizer.vocabulary_.items():
+            weight = float(vectorizer.idf_[column])
+            for word in feature.split(' '):
+                # A word's own unigram IDF when it has one, else that of its most common n-gram
+                if ' ' not in feature or word not in idf:
+                    idf[word] = weight if ' ' not in feature else min(weight, idf.get(word, weight))
+
+        words = sorted(idf)
+        stop_words = sorted(vectorizer.get_stop_words() or [])
+        return cls(words, np.array([idf[word] for word in words]), vectorizer.token_pattern, stop_words,
+                   cache_size)
+
+    def _init_lookup(self):
+        self.word_ids = {word: term for term, word in enumerate(self.words)}
+        self.trigram_ids = {gram: i for i, gram in enumerate(self.trigram_keys)}
+        self.word_lengths = np.array([len(word) for word in self.words], dtype=np.int32)
+        self.token_re = re.compile(self.token_pattern)
+        self.correct = lru_cache(maxsize=self.cache_size)(self._correct)
+
+    def expand(self, text: str) -> str:
+        """The query's tokens with unknown ones corrected (and the vectorizer's stop words dropped)."""
+        tokens = self.token_re.findall(fold(text))
+        return ' '.join(self.correct(token) for token in tokens if token not in self.stop_words)
+
+    def _correct(self, token: str) -> str:
+        if (token in self.word_ids or token in self.stop_words
+                or len(token) < MIN_CORRECTION_LENGTH or not token.isalpha()):
+            return token
+
+        max_edits = 2 if len(token) >= TWO_EDIT_LENGTH else 1
+        candidates = self._candidates(token, max_edits)
+
+        best, best_key = token, None
+        for term in candidates.tolist():
+            distance = edit_distance(token, self.words[term], max_edits)
+            if distance > max_edits:
+                continue
+            key = (distance, float(self.idf[term]), self.words[term])
+            if best_key is None or key < best_key:
+                best, best_key = self.words[term], key
+        return best
+
+    def _candidates(self, token: str, max_edits: int) -> np.ndarray:
+        """Words within ``max_edits`` of ``token`` by length and shared trigram count (a superset)."""
+        grams = [self.trigram_ids[gram] for gram in trigrams(token) if gram in self.trigram_ids]
+        if not grams:
+            return np.array([], dtype=np.int32)
+
+        terms = np.concatenate([self.trigram_terms[self.trigram_offsets[i]:self.trigram_offsets[i + 1]]
+                                for i in grams])
+        candidates, shared = np.unique(terms, return_counts=True)
+
+        # An edit removes at most 3 distinct trigrams from either word, an adjacent swap 4
+        own_count = len(trigrams(token))
+        needed = np.maximum(own_count, self.trigram_counts[candidates]) - 4 * max_edits
+        close = (shared >= needed) & (np.abs(self.word_lengths[candidates] - len(token)) <= max_edits)
+        return candidates[close]
+
+    def cache_info(self):
+        return self.correct.cache_info()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for name in ('word_ids', 'trigram_ids', 'word_lengths', 'token_re', 'correct'):
+            state.pop(name, None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._init_lookup()
+
+    def to_arrays(self):
+        """Arrays and metadata needed to restore the index without rebuilding it."""
+        arrays = {
+            'words': self.words,
+            'idf': self.idf,
+            'trigram_counts': self.trigram_counts,
+            'trigram_keys': self.trigram_keys,
+            'trigram_offsets': self.trigram_offsets,
+            'trigram_terms': self.trigram_terms
+        }
+        meta = {'token_pattern': self.token_pattern, 'stop_words': sorted(self.stop_words),
+                'cache_size': self.cache_size}
+        return arrays, meta
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict, meta: Dict) -> 'QueryExpander':
+        expander = cls.__new__(cls)
+        for name, values in arrays.items():
+            setattr(expander, name, values)
+        expander.token_pattern = meta['token_pattern']
+        expander.stop_words = frozenset(meta['stop_words'])
+        expander.cache_size = meta['cache_size']
+        expander._init_lookup()
+        return expander
@@ -1,79 +1,338 @@
 import pandas as pd
 import numpy as np
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+import scipy.sparse as sp
 import re
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 import builtins
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+from filter_index import FilterIndex
+from ingredient_index import IngredientIncidence, IngredientSuggestionIndex
+from product_table import TextColumn, ProductColumns, compact_frame, append_frame, take_columns, widen
+from query_cache import QueryCache, canonical_query
+from result_pages import CandidateSet, make_cursor, new_token, parse_cursor
+from ann_index import IvfIndex
+from browse_index import BrowseIndex
+from inverted_index import InvertedIndex, max_score_candidates
+from neighbour_graph import BLOCK_ENTRIES, NeighbourGraph
+from query_expansion import QueryExpander
+from sharded_scoring import MIN_SHARD_ROWS, ShardPool
+from similarity_kernel import SimilarityKernel
+from latency_metrics import LatencyMetrics, count, stage, traced
+import model_store
+
+# Ingredient cleaning patterns, compiled once
+QUALIFIER_PATTERN = re.compile(r'\b(organic|natural|fresh|dried|powdered|extract)\b')
+QUANTITY_PATTERN = re.compile(r'\([^)]*\d+[^)]*\)')
+WHITESPACE_PATTERN = re.compile(r'\s+')
+
+# Columns concatenated into the general search text, in order
+SEARCH_TEXT_COLS = ['product_name', 'brands', 'categories', 'ingredients_text', 'health_flags', 'allergen_friendly']
+
+# Candidate retrieval strategies accepted by recommend()
+RETRIEVAL_MODES = ('exact', 'ann', 'inverted', 'bm25', 'browse')
+
+# recommend() arguments a pagination cursor carries (see result_pages)
+PAGED_QUERY_PARAMS = ('recipe_text', 'ingredients', 'dietary_preferences', 'filters', 'top_n', 'min_similarity',
+                      'prioritize_health', 'ingredient_weight', 'retrieval', 'fields')
+
+# Columns of a recommendation result, in order (those the catalog lacks are skipped)
+RESULT_FIELDS = ['product_name', 'brands', 'final_score', 'similarity_score', 'health_score',
+                 'matched_ingredients', 'matched_ingredient_names', 'nutriscore_grade', 'health_category', 'energy-kcal_100g',
+                 'proteins_100g', 'sugars_100g', 'categories', 'ingredients_text']
+
+# Weights of (normalized similarity, health score / 10) in the final score,
+# keyed by prioritize_health
+SCORE_WEIGHTS = {True: (0.55, 0.45), False: (0.70, 0.30)}
+
+# Rows per chunk when text preparation runs in a process pool
+PREPARE_CHUNK_SIZE = 50000
+
+# Column mapping for nutritional data
+NUTRITION_COLS = {
+    'calories': 'energy-kcal_100g',
+    'carbs': 'carbohydrates_100g',
+    'sugars': 'sugars_100g',
+    'proteins': 'proteins_100g'
+}
+
+# Dietary restriction columns
+DIETARY_COLS = {
+    'gluten_free': 'is_gluten_free',
+    'low_sugar': 'is_low_sugar',
+    'high_protein': 'is_high_protein',
+    'low_calorie': 'is_low_calorie',
+    'dairy_free': 'is_dairy_free',
+    'nut_free': 'is_nut_free',
+    'soy_free': 'is_soy_free',
+    'egg_free': 'is_egg_free'
+}
+
+# General vectorizer for overall search
+GENERAL_VECTORIZER_PARAMS = {
+    'max_features': 10000,
+    'stop_words': 'english',
+    'ngram_range': (1, 3),
+    'min_df': 2,
+    'max_df': 0.95,
+    'lowercase': True,
+    'strip_accents': 'unicode',
+    'token_pattern': r'\b[a-zA-Z][a-zA-Z0-9]*\b'
+}
+
+# Ingredient-specific vectorizer
+INGREDIENT_VECTORIZER_PARAMS = {
+    'max_features': 5000,
+    'stop_words': 'english',
+    'ngram_range': (1, 2),
+    'min_df': 1,
+    'max_df': 0.9,
+    'lowercase': True,
+    'strip_accents': 'unicode'
+}
+
+
+def clean_ingredients(ingredients: pd.Series) -> pd.Series:
+    """Vectorized equivalent of ``RecipeProductRecommender._clean_ingredient_text``."""
+    return (
+        ingredients.fillna('').astype(str).str.lower()
+        .str.replace(QUALIFIER_PATTERN, '', regex=True)
+        .str.replace(QUANTITY_PATTERN, '', regex=True)
+        .str.replace(WHITESPACE_PATTERN, ' ', regex=True)
+        .str.strip()
+    )
+
+
+def prepare_text(columns: pd.DataFrame) -> pd.DataFrame:
+    """Build ``search_text`` and ``cleaned_ingredients`` for a chunk of products.
+
+    ``columns`` holds ``SEARCH_TEXT_COLS`` (missing values allowed). Module-level
+    so chunks can be sent to worker processes.
+    """
+    parts = []
+    for col in SEARCH_TEXT_COLS:
+        text = columns[col].fillna('').astype(str)
+        if col in ('health_flags', 'allergen_friendly'):
+            text = text.str.replace('_', ' ', regex=False)
+        parts.append(text)
+
+    # Lower-case the joined text once instead of every column separately
+    search_text = parts[0].str.cat(parts[1:], sep=' ').str.lower().str.strip()
+
+    return pd.DataFrame({
+        'search_text': search_text,
+        'cleaned_ingredients': clean_ingredients(columns['ingredients_text'])
+    }, index=columns.index)
+
 
 class RecipeProductRecommender:
 
-    def __init__(self, df: pd.DataFrame):
-        self.df = df.copy()
-        self.vectorizer = None
-        self.tfidf_matrix = None
-        self.ingredient_vectorizer = None
-        self.ingredient_tfidf_matrix = None
-
-        # Column mapping for nutritional data
-        self.nutrition_cols = {
-            'calories': 'energy-kcal_100g',
-            'carbs': 'carbohydrates_100g',
-            'sugars': 'sugars_100g',
-            'proteins': 'proteins_100g'
-        }
+    # Filters matching at most this fraction of the catalog are applied before
+    # similarity is computed, so only the matching rows get scored
+    prefilter_fraction = 0.1
 
-        # Dietary restriction columns
-        self.dietary_cols = {
-            'gluten_free': 'is_gluten_free',
-            'low_sugar': 'is_low_sugar',
-            'high_protein': 'is_high_protein',
-            'low_calorie': 'is_low_calorie',
-            'dairy_free': 'is_dairy_free',
-            'nut_free': 'is_nut_free',
-            'soy_free': 'is_soy_free',
-            'egg_free': 'is_egg_free'
-        }
+    # Share of unknown words in newly added products, or of tombstoned rows,
+    # above which refitting the vectorizers is recommended
+    refit_threshold = 0.25
+
+    # Worker processes for text preparation (-1 uses every core)
+    n_jobs = 1
+
+    # ANN retrieval: inverted lists probed per query and candidate pool size
+    # per index (see build_ann_index)
+    ann_n_probe = 8
+    ann_pool_size = 1000
+
+    # QueryCache of recommend() results, off unless enable_result_cache is called
+    result_cache = None
+
+    # QueryCache of CandidateSets behind pagination cursors, off unless enable_pagination is called
+    page_cache = None
+
+    # LatencyMetrics fed by every recommend() call, off unless enable_metrics is called
+    metrics = None
+
+    # ShardPool scoring exact queries shard by shard, off unless enable_parallel_scoring is called
+    shard_pool = None
+
+    def __init__(self, df: pd.DataFrame, n_jobs: int = 1):
+        self._init_state(df.copy(), n_jobs)
 
         self._prepare_data()
-        self._setup_vectorizers()
+        general, ingredient = self._setup_vectorizers()
+        with self._timed('similarity_kernel'):
+            self._build_similarity_kernel(general, ingredient)
+        del general, ingredient
+        with self._timed('suggestion_index'):
+            self._build_suggestion_index()
+        with self._timed('ingredient_incidence'):
+            self._build_ingredient_incidence()
+        with self._timed('filter_index'):
+            self._build_filter_index()
+        with self._timed('browse_index'):
+            self._build_browse_index()
+        with self._timed('compact'):
+            self._compact()
+
+    def _init_state(self, df: pd.DataFrame, n_jobs: int = 1):
+        self.df = df
+        self.n_jobs = n_jobs
+        self.fit_timings = {}
+        self.fit_peak_rss_mb = {}
+        self.vectorizer = None
+        self.ingredient_vectorizer = None
+        self.similarity_kernel = None
+        self.suggestion_index = None
+        self.ingredient_incidence = None
+        self.filter_index = None
+        self.browse_index = None
+        self.product_text = {}
+        self.ann_indexes = {}
+        self.inverted_indexes = {}
+        self.query_expanders = {}
+        self.neighbour_graph = None
+        self.removed = np.zeros(len(df), dtype=bool)
+        self.update_stats = self._empty_update_stats()
+
+        self.nutrition_cols = dict(NUTRITION_COLS)
+        self.dietary_cols = dict(DIETARY_COLS)
+
+    @classmethod
+    def from_csv(cls, path: str, chunksize: int = 100000, n_jobs: int = 1, term_counts: str = 'exact',
+                 hash_buckets: Optional[int] = None, index_col: Optional[str] = None,
+                 **read_csv_kwargs) -> 'RecipeProductRecommender':
+        """Fit on a CSV export streamed in chunks (see ``catalog_builder``).
+
+        Learns the same vocabularies and IDF weights as
+        ``RecipeProductRecommender(pd.read_csv(path))`` without ever holding
+        the raw export in memory. ``term_counts='hashed'`` also bounds the
+        memory used to count n-grams, at the cost of reading the export once
+        more; n-grams tied at the ``max_features`` cut-off are then kept
+        alphabetically, so its vocabularies can differ among those ties. ``index_col`` names the product code column (e.g. ``'code'``)
+        to label the catalog with, so ``update_products``, ``remove_products``
+        and ``similar_products`` take codes instead of row numbers. Extra
+        keyword arguments go to ``pd.read_csv``.
+        """
+        import catalog_builder
+        return catalog_builder.build_from_csv(path, chunksize, n_jobs, term_counts,
+                                              hash_buckets or catalog_builder.HASH_BUCKETS, index_col,
+                                              **read_csv_kwargs)
+
+    @contextmanager
+    def _timed(self, stage: str, timings: Optional[Dict] = None):
+        """Record the wall time of a fit stage in ``fit_timings`` (seconds)."""
+        start = time.perf_counter()
+        yield
+        (self.fit_timings if timings is None else timings)[stage] = time.perf_counter() - start
+
+    def __getstate__(self):
+        # The caches, metrics and shard pool hold locks or threads and are only valid for this process
+        state = self.__dict__.copy()
+        state.pop('result_cache', None)
+        state.pop('page_cache', None)
+        state.pop('metrics', None)
+        state.pop('shard_pool', None)
+        state.pop('_ingredient_column_cache', None)
+        return state
+
+    def __setstate__(self, state):
+        # Models pickled before the lookup indexes existed get them rebuilt on load
+        self.__dict__.update(state)
+        if self.__dict__.get('suggestion_index') is None:
+            self._build_suggestion_index()
+        if self.__dict__.get('filter_index') is None:
+            self._build_filter_index()
+        if self.__dict__.get('browse_index') is None:
+            self._build_browse_index()
+        if self.__dict__.get('similarity_kernel') is None:
+            self._build_similarity_kernel(self.__dict__.get('tfidf_matrix'), self.__dict__.get('ingredient_tfidf_matrix'))
+        # Older pickles also hold the float64 matrices the kernel replaces
+        self.__dict__.pop('tfidf_matrix', None)
+        self.__dict__.pop('ingredient_tfidf_matrix', None)
+        if self.__dict__.get('removed') is None:
+            self.removed = np.zeros(len(self.df), dtype=bool)
+            self.update_stats = self._empty_update_stats()
+        if 'product_text' not in self.__dict__:
+            self._compact()
+        if self.__dict__.get('ingredient_incidence') is None:
+            self._build_ingredient_incidence()
+        if 'ann_indexes' not in self.__dict__:
+            self.ann_indexes = {}
+        if 'inverted_indexes' not in self.__dict__:
+            self.inverted_indexes = {}
+        for index in self.inverted_indexes.values():
+            if getattr(index, 'max_health', None) is None:
+                index.max_health = float(self.df['health_score'].max()) if len(self.df) else 0.0
+        if 'query_expanders' not in self.__dict__:
+            self.query_expanders = {}
+        if 'neighbour_graph' not in self.__dict__:
+            self.neighbour_graph = None
+        self.__dict__.setdefault('fit_timings', {})
+        self.__dict__.setdefault('fit_peak_rss_mb', {})
+
+    def save(self, path: str):
+        """Save the fitted model as a versioned artifact directory (see model_store)."""
+        model_store.save_model(self, path)
+
+    @classmethod
+    def load(cls, path: str, mmap_mode: Optional[str] = 'r') -> 'RecipeProductRecommender':
+        """Open a model saved with ``save``, memory-mapping its arrays by default."""
+        return model_store.load_model(path, mmap_mode)
 
     def _prepare_data(self):
-        # Handle missing values for text columns
-        text_cols = ['product_name', 'brands', 'categories', 'ingredients_text', 'allergens']
-        for col in text_cols:
-            if col in self.df.columns:
-                self.df[col] = self.df[col].fillna('')
-
-        # Create comprehensive search text
-        health_flags_text = self.df.get('health_flags', pd.Series('')).fillna('').str.replace('_', ' ')
-        allergen_friendly_text = self.df.get('allergen_friendly', pd.Series('')).fillna('').str.replace('_', ' ')
-
-        self.df['search_text'] = (
-            self.df.get('product_name', pd.Series('')).str.lower() + ' ' +
-            self.df.get('brands', pd.Series('')).str.lower() + ' ' +
-            self.df.get('categories', pd.Series('')).str.lower() + ' ' +
-            self.df.get('ingredients_text', pd.Series('')).str.lower() + ' ' +
-            health_flags_text.str.lower() + ' ' +
-            allergen_friendly_text.str.lower()
-        ).str.strip()
-
-        # Clean ingredients text for better processing
-        self.df['cleaned_ingredients'] = self.df.get('ingredients_text', pd.Series('')).fillna('').apply(self._clean_ingredient_text)
-
-        # Calculate health score if not available
-        if 'health_score' not in self.df.columns:
-            self.df['health_score'] = self._calculate_health_score()
-
-        # Clean numerical columns
-        for col in self.nutrition_cols.values():
-            if col in self.df.columns:
-                self.df[col] = pd.to_numeric(self.df[col], errors='coerce').fillna(0)
-
-        # Ensure boolean columns are properly typed
-        for col in self.dietary_cols.values():
-            if col in self.df.columns:
-                self.df[col] = self.df[col].astype(bool)
+        self.df = self._prepare_frame(self.df, self.fit_timings)
+
+    def _prepare_frame(self, df: pd.DataFrame, timings: Optional[Dict] = None) -> pd.DataFrame:
+        """Clean product rows and derive the text the vectorizers work on."""
+        timings = {} if timings is None else timings
+
+        with self._timed('prepare_text', timings):
+            # Handle missing values for text columns
+            text_cols = ['product_name', 'brands', 'categories', 'ingredients_text', 'allergens']
+            for col in text_cols:
+                if col in df.columns:
+                    df[col] = df[col].fillna('')
+
+            # Create comprehensive search text and clean ingredients text
+            text = self._prepare_text(df)
+            df['search_text'] = text['search_text']
+            df['cleaned_ingredients'] = text['cleaned_ingredients']
+
+        with self._timed('health_score', timings):
+            # Calculate health score if not available
+            if 'health_score' not in df.columns:
+                df['health_score'] = self._calculate_health_score(df)
+            elif df['health_score'].isna().any():
+                df['health_score'] = df['health_score'].fillna(self._calculate_health_score(df))
+
+        with self._timed('clean_columns', timings):
+            # Clean numerical columns
+            for col in self.nutrition_cols.values():
+                if col in df.columns:
+                    df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
+
+            # Ensure boolean columns are properly typed
+            for col in self.dietary_cols.values():
+                if col in df.columns:
+                    df[col] = df[col].where(df[col].notna(), False).astype(bool)
+
+        return df
+
+    def _prepare_text(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Run ``prepare_text`` over the catalog, in chunks across processes if ``n_jobs`` allows."""
+        columns = df.reindex(columns=SEARCH_TEXT_COLS)
+        n_jobs = (os.cpu_count() or 1) if self.n_jobs == -1 else self.n_jobs
+
+        if n_jobs <= 1 or len(columns) <= PREPARE_CHUNK_SIZE:
+            return prepare_text(columns)
+
+        chunks = [columns.iloc[start:start + PREPARE_CHUNK_SIZE]
+                  for start in range(0, len(columns), PREPARE_CHUNK_SIZE)]
+        with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+            return pd.concat(pool.map(prepare_text, chunks))
 
     def _clean_ingredient_text(self, text: str) -> str:
         """Clean and normalize ingredient text."""
@@ -81,80 +340,120 @@ class RecipeProductRecommender:
             return ""
 
         # Remove common prefixes and suffixes
-        text = re.sub(r'\b(organic|natural|fresh|dried|powdered|extract)\b', '', text.lower())
+        text = QUALIFIER_PATTERN.sub('', text.lower())
         # Remove percentages and numbers in parentheses
-        text = re.sub(r'\([^)]*\d+[^)]*\)', '', text)
+        text = QUANTITY_PATTERN.sub('', text)
         # Remove extra whitespace
-        text = re.sub(r'\s+', ' ', text).strip()
+        text = WHITESPACE_PATTERN.sub(' ', text).strip()
 
         return text
 
-    def _setup_vectorizers(self):
-        """Setup both general and ingredient-specific vectorizers."""
+    def _setup_vectorizers(self) -> tuple:
+        """Setup both general and ingredient-specific vectorizers.
+
+        Returns the general and ingredient TF-IDF matrices (None without
+        ingredient text), which only live until the similarity kernel is built.
+        """
+        # Imported here: loaded models encode queries with query_encoder instead
+        from sklearn.feature_extraction.text import TfidfVectorizer
+
         valid_texts = self.df['search_text'][self.df['search_text'].str.len() > 0]
 
         if len(valid_texts) == 0:
             raise ValueError("No valid text data found")
 
         # General vectorizer for overall search
-        self.vectorizer = TfidfVectorizer(
-            max_features=10000,
-            stop_words='english',
-            ngram_range=(1, 3),
-            min_df=2,
-            max_df=0.95,
-            lowercase=True,
-            strip_accents='unicode',
-            token_pattern=r'\b[a-zA-Z][a-zA-Z0-9]*\b'
-        )
+        self.vectorizer = TfidfVectorizer(**GENERAL_VECTORIZER_PARAMS)
 
-        self.tfidf_matrix = self.vectorizer.fit_transform(self.df['search_text'])
+        with self._timed('general_vectorizer'):
+            general = self.vectorizer.fit_transform(self.df['search_text'])
 
         # Ingredient-specific vectorizer
+        ingredient = None
         valid_ingredients = self.df['cleaned_ingredients'][self.df['cleaned_ingredients'].str.len() > 0]
 
         if len(valid_ingredients) > 0:
-            self.ingredient_vectorizer = TfidfVectorizer(
-                max_features=5000,
-                stop_words='english',
-                ngram_range=(1, 2),
-                min_df=1,
-                max_df=0.9,
-                lowercase=True,
-                strip_accents='unicode'
-            )
+            self.ingredient_vectorizer = TfidfVectorizer(**INGREDIENT_VECTORIZER_PARAMS)
+
+            with self._timed('ingredient_vectorizer'):
+                ingredient = self.ingredient_vectorizer.fit_transform(self.df['cleaned_ingredients'])
+        return general, ingredient
+
+    def _build_similarity_kernel(self, general: sp.csr_matrix, ingredient: Optional[sp.csr_matrix] = None):
+        """Stack both TF-IDF matrices into the float32 matrix exact queries are scored on."""
+        self.similarity_kernel = SimilarityKernel(general, ingredient)
+
+    @property
+    def tfidf_matrix(self) -> sp.csr_matrix:
+        """General TF-IDF rows (float32), sliced from the similarity kernel on each access."""
+        return self.similarity_kernel.general()
+
+    @property
+    def ingredient_tfidf_matrix(self) -> Optional[sp.csr_matrix]:
+        """Ingredient TF-IDF rows (float32) sliced from the similarity kernel, None without them."""
+        return self.similarity_kernel.ingredient()
+
+    def _build_suggestion_index(self):
+        """Build the ingredient autocomplete index once, at fit/load time."""
+        self.suggestion_index = IngredientSuggestionIndex.from_ingredients(
+            self.df.get('ingredients_text', pd.Series('', dtype=object))
+        )
 
-            self.ingredient_tfidf_matrix = self.ingredient_vectorizer.fit_transform(self.df['cleaned_ingredients'])
+    def _build_ingredient_incidence(self):
+        """Build the product x ingredient-term matrix ingredient matches are counted from."""
+        if 'ingredients_text' in self.df.columns:
+            texts = self.df['ingredients_text']
+        elif 'ingredients_text' in self.product_text:
+            texts = pd.Series(self.product_text['ingredients_text'].take(np.arange(len(self.df))), dtype=object)
+        else:
+            texts = pd.Series('', index=self.df.index, dtype=object)
+        self.ingredient_incidence = IngredientIncidence.from_ingredients(texts)
 
-    def _calculate_health_score(self) -> pd.Series:
+    def _build_filter_index(self):
+        """Build bitsets, sorted columns and the brand index used by the filters."""
+        self.filter_index = FilterIndex(self.df, self.dietary_cols, self.nutrition_cols)
+
+    def _build_browse_index(self):
+        """Presort products by health score for queries without text (needs the filter index)."""
+        self.browse_index = BrowseIndex(self.df['health_score'].to_numpy(), self.filter_index)
+
+    def _compact(self):
+        """Switch ``self.df`` to the serving representation (see product_table).
+
+        Must run after the lookup indexes are built, since it drops the
+        training text and dietary columns they are built from.
+        """
+        self.df, self.product_text = compact_frame(self.df, self.nutrition_cols)
+
+    def _calculate_health_score(self, df: pd.DataFrame) -> pd.Series:
         """Calculate health score based on available nutritional data."""
-        score = pd.Series(5.0, index=self.df.index)  # Default middle score
+        score = pd.Series(5.0, index=df.index)  # Default middle score
 
         # NutriScore mapping (A=best, E=worst)
         nutri_map = {'A': 8, 'B': 6, 'C': 5, 'D': 3, 'E': 1}
-        if 'nutriscore_grade' in self.df.columns:
-            nutri_scores = self.df['nutriscore_grade'].map(nutri_map)
+        if 'nutriscore_grade' in df.columns:
+            nutri_scores = df['nutriscore_grade'].map(nutri_map)
             score = score.where(nutri_scores.isna(), nutri_scores)
 
         # Boost score based on health flags
-        if 'health_flags' in self.df.columns:
-            health_flags = self.df['health_flags'].fillna('')
+        if 'health_flags' in df.columns:
+            health_flags = df['health_flags'].fillna('')
             positive_flags = ['low_sugar', 'high_protein', 'gluten_free', 'low_calorie']
             for flag in positive_flags:
                 flag_boost = health_flags.str.contains(flag, case=False).astype(int) * 0.5
                 score = np.minimum(score + flag_boost, 10)
 
         # Adjust based on nutritional content
-        if 'sugars_100g' in self.df.columns:
-            sugar_penalty = np.clip(self.df['sugars_100g'] / 15, 0, 2)
+        if 'sugars_100g' in df.columns:
+            sugar_penalty = np.clip(df['sugars_100g'] / 15, 0, 2)
             score = np.maximum(score - sugar_penalty, 1)
 
-        if 'proteins_100g' in self.df.columns:
-            protein_boost = np.clip(self.df['proteins_100g'] / 25, 0, 2)
+        if 'proteins_100g' in df.columns:
+            protein_boost = np.clip(df['proteins_100g'] / 25, 0, 2)
             score = np.minimum(score + protein_boost, 10)
 
-        if 'energy-kcal_100g' in self.df.columns:
-            calorie_penalty = np.where(self.df['energy-kcal_100g'] > 500, 1, 0)
+        if 'energy-kcal_100g' in df.columns:
+            calorie_penalty = np.where(df['energy-kcal_100g'] > 500, 1, 0)
             score = np.maximum(score - calorie_penalty, 1)
 
         return score.fillna(5.0)
@@ -167,36 +466,805 @@ class RecipeProductRecommender:
                  top_n: int = 10,
                  min_similarity: float = 0.05,
                  prioritize_health: bool = True,
-                 ingredient_weight: float = 0.4) -> pd.DataFrame:
-        
+                 ingredient_weight: float = 0.4,
+                 retrieval: str = 'exact',
+                 fields: List[str] = None,
+                 as_frame: bool = True,
+                 timings: Optional[Dict] = None,
+                 page_size: Optional[int] = None):
+        """Recommend products for a recipe.
+
+        ``retrieval='exact'`` scores every product sharing a term with the
+        query; ``'ann'`` only scores the candidate pool proposed by the ANN
+        indexes (see ``build_ann_index``). ``'inverted'`` returns the same
+        results as ``'exact'`` but walks posting lists with MaxScore pruning,
+        and ``'bm25'`` ranks by BM25 relevance instead of cosine similarity
+        (both need ``build_inverted_index``). ``'browse'`` ignores the recipe
+        text and ingredients (and ``min_similarity``) and returns the products
+        passing the filters with the best health scores, found by walking
+        presorted lists (see browse_index). An ``'exact'`` query without any
+        text and ``min_similarity <= 0`` ranks the same way and is served
+        like ``'browse'``.
+
+        ``fields`` limits the result to some of ``RESULT_FIELDS``, so long text
+        that is not needed is never decoded. With ``as_frame=False`` the result is
+        a read-only ``ProductColumns`` instead of a DataFrame.
+
+        Passing a dict as ``timings`` fills it with this call's per-stage
+        durations (``stages_ms``) and candidate counts (``counts``); see also
+        ``enable_metrics``.
+
+        With ``page_size`` the ``top_n`` results are paged: the call returns
+        ``(first_page, cursor)`` and ``next_page(cursor, page_size)`` returns
+        the following pages from the scored candidates kept in the page cache
+        (see ``enable_pagination``). ``cursor`` is None after the last page.
+        """
+        if page_size is not None and self.page_cache is None:
+            raise ValueError("Pagination needs a page cache; call enable_pagination() first")
+        self._check_request(retrieval, fields)
+
+        params = {
+            'recipe_text': recipe_text,
+            'ingredients': ingredients,
+            'dietary_preferences': dietary_preferences,
+            'filters': filters,
+            'top_n': top_n,
+            'min_similarity': min_similarity,
+            'prioritize_health': prioritize_health,
+            'ingredient_weight': ingredient_weight,
+            'retrieval': retrieval,
+            'fields': fields
+        }
+        cursor = None
+        with traced(self.metrics is not None or timings is not None) as trace:
+            if page_size is not None:
+                result, cursor = self._first_page(params, page_size)
+            elif self.result_cache is None:
+                result = self._recommend(**params)
+            else:
+                with stage('cache_lookup'):
+                    key = canonical_query(**params)
+                    result = self.result_cache.get(key)
+                if result is None:
+                    result = self._recommend(**params)
+                    self.result_cache.put(key, result)
+
+            if as_frame:
+                with stage('to_frame'):
+                    result = result.to_frame()
+
+        if trace is not None:
+            if self.metrics is not None:
+                self.metrics.observe(trace)
+            if timings is not None:
+                timings.update(trace.as_dict())
+        return result if page_size is None else (result, cursor)
+
+    def _check_request(self, retrieval: str, fields: Optional[List[str]]):
+        """Raise ValueError for unknown fields or retrieval modes, or ones whose index is missing."""
+        self._check_fields(fields)
+        if retrieval not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode {retrieval!r} (expected one of {', '.join(RETRIEVAL_MODES)})")
+        if retrieval == 'ann' and not self.ann_indexes:
+            raise ValueError("ANN retrieval needs an index; call build_ann_index() first")
+        if retrieval in ('inverted', 'bm25') and not self.inverted_indexes:
+            raise ValueError(f"{retrieval} retrieval needs an index; call build_inverted_index() first")
+
+    def next_page(self, cursor: str, page_size: int = 10, fields: List[str] = None, as_frame: bool = True,
+                  timings: Optional[Dict] = None) -> Tuple:
+        """The ``page_size`` results after ``cursor``, and the cursor of the page after them.
+
+        ``fields`` defaults to the fields of the query that returned the first
+        page. Cursors carry their query, so any process serving the same
+        model can continue them: when the candidates are not in this
+        process's page cache (another worker scored them, or they were
+        evicted), the query is scored again. Raises ValueError when the cursor
+        is malformed.
+        """
+        self._check_fields(fields)
+        token, offset, query = parse_cursor(cursor)
+        if set(query) != set(PAGED_QUERY_PARAMS):
+            raise ValueError(f"Invalid cursor {cursor!r}")
+        self._check_request(query['retrieval'], query['fields'])
+
+        with traced(self.metrics is not None or timings is not None) as trace:
+            candidates = None if self.page_cache is None else self.page_cache.get(token)
+            count('page_cache_hit', candidates is not None)
+            if candidates is None:
+                candidates = self._recommend(**query, paged=True)
+                if isinstance(candidates, CandidateSet) and self.page_cache is not None:
+                    self.page_cache.put(token, candidates)
+            if isinstance(candidates, CandidateSet):
+                result, cursor = self._page(candidates, token, query, offset, page_size, fields)
+            else:
+                # Nothing passes the filters any more
+                result, cursor = candidates, None
+            if as_frame:
+                with stage('to_frame'):
+                    result = result.to_frame()
+
+        if trace is not None:
+            if self.metrics is not None:
+                self.metrics.observe(trace)
+            if timings is not None:
+                timings.update(trace.as_dict())
+        return result, cursor
+
+    def _first_page(self, params: Dict, page_size: int) -> Tuple[ProductColumns, Optional[str]]:
+        candidates = self._recommend(**params, paged=True)
+        if not isinstance(candidates, CandidateSet):
+            # Nothing passed the filters
+            return candidates, None
+        token = new_token()
+        with stage('page_cache'):
+            self.page_cache.put(token, candidates)
+        return self._page(candidates, token, params, 0, page_size)
+
+    def _page(self, candidates: CandidateSet, token: str, query: Dict, offset: int, page_size: int,
+              fields: Optional[List[str]] = None) -> Tuple[ProductColumns, Optional[str]]:
+        """Format the results ranked ``offset`` to ``offset + page_size`` and the cursor after them."""
+        with stage('top_k'):
+            rows = candidates.page(offset, page_size)
+        count('page', len(rows))
+
+        end = offset + len(rows)
+        cursor = make_cursor(token, end, query) if end < len(candidates) else None
+        if len(rows) == 0:
+            return ProductColumns({}), cursor
+        with stage('format'):
+            return self._result_columns(
+                candidates.positions[rows], candidates.similarities[rows], candidates.scores[rows],
+                candidates.ingredients, candidates.fields if fields is None else fields
+            ), cursor
+
+    @staticmethod
+    def _check_fields(fields: Optional[List[str]]):
+        unknown = [field for field in fields or [] if field not in RESULT_FIELDS]
+        if unknown:
+            raise ValueError(f"Unknown result fields {unknown} (expected some of {', '.join(RESULT_FIELDS)})")
+
+    def _recommend(self, recipe_text: str, ingredients: List[str], dietary_preferences: List[str],
+                   filters: Dict, top_n: int, min_similarity: float, prioritize_health: bool,
+                   ingredient_weight: float, retrieval: str, fields: Optional[List[str]],
+                   paged: bool = False):
         # Build search query
-        search_query = self._build_query(recipe_text, ingredients, dietary_preferences)
-
-        # Calculate similarities
-        general_similarities = self._get_general_similarities(search_query)
-        ingredient_similarities = self._get_ingredient_similarities(ingredients)
+        with stage('build_query'):
+            search_query = self._build_query(recipe_text, ingredients, dietary_preferences)
+
+        ranking = {
+            'ingredients': ingredients,
+            'dietary_preferences': dietary_preferences,
+            'filters': filters,
+            'top_n': top_n,
+            'min_similarity': min_similarity,
+            'prioritize_health': prioritize_health,
+            'fields': fields,
+            'paged': paged
+        }
 
-        # Combine similarities
-        combined_similarities = self._combine_similarities(
-            general_similarities,
-            ingredient_similarities,
-            ingredient_weight
-        )
+        # Without text every similarity is zero, so only the health score ranks products
+        if retrieval == 'browse' or (retrieval == 'exact' and min_similarity <= 0
+                                     and self._is_empty_query(search_query, ingredients)):
+            return self._browse(ingredients, dietary_preferences, filters, top_n, prioritize_health, fields, paged)
+
+        # Posting-list retrieval: only products that can still make the top_n
+        if retrieval in ('inverted', 'bm25'):
+            with stage('inverted_candidates'):
+                docs, similarities = self._inverted_candidates(
+                    search_query, ingredients, ingredient_weight, retrieval == 'bm25',
+                    dietary_preferences, filters, top_n, min_similarity, prioritize_health
+                )
+            count('inverted_candidates', len(docs))
+            if retrieval == 'bm25':
+                row = sp.csr_matrix((similarities, docs, [0, len(docs)]), shape=(1, len(self.df)))
+                return self._rank_similarity_row(row, 0, **ranking)
+
+        # Restrict similarity to the matching products when the filters are selective
+        with stage('prefilter'):
+            allowed = self.filter_index.matching_positions(filters, dietary_preferences, self.prefilter_fraction)
+        if allowed is not None:
+            count('prefiltered', len(allowed))
+
+        # Or to the approximate nearest neighbours of the query
+        if retrieval == 'ann':
+            with stage('ann_candidates'):
+                pool = self._ann_candidates(search_query, ingredients)
+            count('ann_pool', len(pool))
+            allowed = pool if allowed is None else np.intersect1d(allowed, pool, assume_unique=True)
+        elif retrieval == 'inverted':
+            # Rescore the surviving products exactly, like the prefilter path
+            allowed = docs
+
+        # Score every product, shard by shard in parallel
+        if allowed is None and self.shard_pool is not None:
+            return self._rank_shards(search_query, ingredient_weight, **ranking)
+
+        # Calculate the blended similarities in one pass over the stacked matrices
+        similarities = self._get_similarities(search_query, ingredients, ingredient_weight, allowed)
+        return self._rank_similarity_row(similarities, 0, **ranking)
+
+    def recommend_batch(self,
+                        queries: List[Dict],
+                        top_n: int = 10,
+                        min_similarity: float = 0.05,
+                        prioritize_health: bool = True,
+                        ingredient_weight: float = 0.4,
+                        batch_size: int = 256,
+                        fields: List[str] = None,
+                        as_frame: bool = True) -> List:
+        """Recommend products for many queries at once.
+
+        Each query is a dict of ``recommend`` keyword arguments (``recipe_text``,
+        ``ingredients``, ``dietary_preferences``, ``filters`` and optionally any of
+        the ranking settings, which otherwise default to the values given here).
+        Queries are vectorized together and scored with one sparse
+        query x product product per vectorizer, ``batch_size`` queries at a time.
+        Results are returned in query order, as DataFrames or, with
+        ``as_frame=False``, as ``ProductColumns`` (see ``recommend``).
+        """
+        self._check_fields(fields)
+        defaults = {
+            'top_n': top_n,
+            'min_similarity': min_similarity,
+            'prioritize_health': prioritize_health,
+            'ingredient_weight': ingredient_weight
+        }
+        queries = [{**defaults, **query} for query in queries]
+
+        results = []
+        for start in range(0, len(queries), batch_size):
+            chunk = queries[start:start + batch_size]
+            similarities = self._get_batch_similarities(chunk)
+            for row, query in enumerate(chunk):
+                result = self._rank_similarity_row(
+                    similarities, row,
+                    ingredients=query.get('ingredients'),
+                    dietary_preferences=query.get('dietary_preferences'),
+                    filters=query.get('filters'),
+                    top_n=query['top_n'],
+                    min_similarity=query['min_similarity'],
+                    prioritize_health=query['prioritize_health'],
+                    fields=fields
+                )
+                results.append(result.to_frame() if as_frame else result)
+
+        return results
+
+    def _get_batch_similarities(self, queries: List[Dict]) -> sp.csr_matrix:
+        """Weighted general + ingredient cosine similarities, one sparse row per query."""
+        general_queries = [
+            self._build_query(query.get('recipe_text', ''), query.get('ingredients'),
+                              query.get('dietary_preferences'))
+            for query in queries
+        ]
+        ingredient_weights = np.array([query['ingredient_weight'] for query in queries], dtype=float)
+
+        general_vecs = self.vectorizer.transform(general_queries)
+        ingredient_vecs = None
+        if self.ingredient_vectorizer:
+            ingredient_queries = [self._build_ingredient_query(query.get('ingredients')) for query in queries]
+            ingredient_vecs = self.ingredient_vectorizer.transform(ingredient_queries)
+
+        stacked = self.similarity_kernel.query_matrix(general_vecs, ingredient_vecs, ingredient_weights)
+        return self.similarity_kernel.batch_similarities(stacked)
+
+    def _rank_similarity_row(self, similarities: sp.csr_matrix, row: int,
+                             ingredients: List[str] = None,
+                             dietary_preferences: List[str] = None,
+                             filters: Dict = None,
+                             top_n: int = 10,
+                             min_similarity: float = 0.05,
+                             prioritize_health: bool = True,
+                             fields: List[str] = None,
+                             paged: bool = False):
+        """Filter, score and select the top products for one row of similarities."""
+        with stage('candidates'):
+            candidates, candidate_sims = self._get_candidates(similarities, row, min_similarity)
+        count('candidates', len(candidates))
 
         # Apply filters
-        valid_mask = self._apply_filters(filters, dietary_preferences)
-        valid_mask &= (combined_similarities >= min_similarity)
+        with stage('filters'):
+            valid_mask = self._apply_filters(filters, dietary_preferences, candidates)
+            candidates, candidate_sims = candidates[valid_mask], candidate_sims[valid_mask]
+        count('filtered', len(candidates))
 
-        if not valid_mask.any():
-            return pd.DataFrame()
+        if len(candidates) == 0:
+            return ProductColumns({})
 
         # Calculate final scores
-        final_scores = self._calculate_scores(combined_similarities, valid_mask, prioritize_health)
+        with stage('scores'):
+            final_scores = self._calculate_scores(candidate_sims, candidates, prioritize_health)
 
         # Get top results
-        top_indices = final_scores.nlargest(top_n).index
+        return self._top_results(candidates, candidate_sims, final_scores, top_n, ingredients, fields, paged)
+
+    def _top_results(self, positions: np.ndarray, similarities: np.ndarray, scores: np.ndarray, top_n: int,
+                     ingredients: List[str], fields: Optional[List[str]], paged: bool = False):
+        """Format the ``top_n`` best scored products, or keep them unsorted in a ``CandidateSet`` when ``paged``."""
+        with stage('top_k'):
+            if paged:
+                return CandidateSet(positions, similarities, scores, top_n, self._top_k, ingredients, fields)
+            top = self._top_k(scores, positions, top_n)
+
+        with stage('format'):
+            return self._result_columns(positions[top], similarities[top], scores[top], ingredients, fields)
+
+    def _rank_shards(self, query: str, ingredient_weight: float,
+                     ingredients: List[str] = None,
+                     dietary_preferences: List[str] = None,
+                     filters: Dict = None,
+                     top_n: int = 10,
+                     min_similarity: float = 0.05,
+                     prioritize_health: bool = True,
+                     fields: List[str] = None,
+                     paged: bool = False):
+        """``_rank_similarity_row`` of the exact similarities, computed per row shard in ``shard_pool``.
+
+        Each shard scores its rows with one matrix-vector product over its
+        rows of the similarity kernel, then keeps the products passing ``min_similarity`` and the
+        filters. Scores are normalized by the largest similarity over all
+        shards, so each shard's top ``top_n`` is selected once that maximum is
+        known; the top ``top_n`` of those is the serial ranking.
+        """
+        vector = self.similarity_kernel.query_vector(*self._query_vectors(query, ingredients), ingredient_weight)
+        views = self.shard_pool.views('kernel', self.similarity_kernel.matrix)
+
+        bounds = self.shard_pool.bounds(len(self.df))
+        keep = self.filter_index.checker(filters, dietary_preferences)
+
+        def shard_candidates(shard: int):
+            start, end = bounds[shard], bounds[shard + 1]
+            similarities = (views[shard] @ vector).astype(np.float64)
+
+            rows = np.flatnonzero(similarities >= min_similarity) if min_similarity > 0 else np.arange(end - start)
+            valid = keep(rows + start)
+            return len(rows), rows[valid] + start, similarities[rows[valid]]
+
+        with stage('shard_candidates'):
+            shards = self.shard_pool.map(shard_candidates, len(bounds) - 1)
+        count('shards', len(shards))
+        count('candidates', sum(n_candidates for n_candidates, _, _ in shards))
+        count('filtered', sum(len(positions) for _, positions, _ in shards))
+
+        if not any(len(positions) for _, positions, _ in shards):
+            return ProductColumns({})
+        max_sim = max(similarities.max() for _, _, similarities in shards if len(similarities))
+
+        def shard_top(shard: int):
+            _, positions, similarities = shards[shard]
+            scores = self._calculate_scores(similarities, positions, prioritize_health, max_sim)
+            top = self._top_k(scores, positions, top_n)
+            return positions[top], similarities[top], scores[top]
+
+        with stage('shard_top_k'):
+            positions, similarities, scores = (np.concatenate(column) for column in zip(
+                *self.shard_pool.map(shard_top, len(shards))
+            ))
+        return self._top_results(positions, similarities, scores, top_n, ingredients, fields, paged)
+
+    def _is_empty_query(self, search_query: str, ingredients: List[str] = None) -> bool:
+        if search_query.strip():
+            return False
+        return not (self.ingredient_vectorizer and self._build_ingredient_query(ingredients).strip())
+
+    def _browse(self, ingredients: List[str], dietary_preferences: List[str], filters: Dict, top_n: int,
+                prioritize_health: bool, fields: Optional[List[str]], paged: bool = False):
+        """The ``top_n`` products passing the filters with the best health scores (ties by position).
+
+        Selective filters are expanded and their matches ranked directly;
+        otherwise the shortest applicable browse list is walked until
+        ``top_n`` products pass the filters.
+        """
+        with stage('prefilter'):
+            allowed = self.filter_index.matching_positions(filters, dietary_preferences, self.prefilter_fraction)
+
+        with stage('browse'):
+            if allowed is not None:
+                count('prefiltered', len(allowed))
+                positions = allowed
+            else:
+                dietary_columns = [self.dietary_cols[pref] for pref in dietary_preferences or []
+                                   if pref in self.dietary_cols]
+                name = self.browse_index.list_for(filters, dietary_columns)
+                keep = self.filter_index.checker(filters, dietary_preferences)
+                positions, walked = self.browse_index.first(
+                    name, keep, top_n,
+                    key=lambda found: self._calculate_scores(np.zeros(len(found)), found, prioritize_health)
+                )
+                count('browse_walked', walked)
+        count('filtered', len(positions))
+
+        if len(positions) == 0:
+            return ProductColumns({})
+
+        # Rank by the blended score like the exact path, whose ties can join distinct health scores
+        similarities = np.zeros(len(positions))
+        with stage('scores'):
+            final_scores = self._calculate_scores(similarities, positions, prioritize_health)
+        return self._top_results(positions, similarities, final_scores, top_n, ingredients, fields, paged)
+
+    @staticmethod
+    def _get_candidates(similarities: sp.csr_matrix, row: int, min_similarity: float):
+        """Product positions and similarities that pass ``min_similarity``.
+
+        With a positive threshold only the stored (nonzero) entries of the
+        sparse row can qualify, so the rest of the catalog is never touched.
+        """
+        start, end = similarities.indptr[row], similarities.indptr[row + 1]
+        indices = similarities.indices[start:end]
+        values = similarities.data[start:end]
+
+        if min_similarity > 0:
+            keep = values >= min_similarity
+            return indices[keep], values[keep]
+
+        dense = np.zeros(similarities.shape[1])
+        dense[indices] = values
+        return np.arange(similarities.shape[1]), dense
+
+    @staticmethod
+    def _top_k(scores: np.ndarray, order: np.ndarray, k: int) -> np.ndarray:
+        """Positions of the ``k`` best scores, ties broken by ascending ``order``.
+
+        Uses ``argpartition`` so only the selected ``k`` entries get sorted.
+        """
+        if k <= 0 or len(scores) == 0:
+            return np.array([], dtype=np.intp)
+
+        if k < len(scores):
+            threshold = scores[np.argpartition(-scores, k - 1)[k - 1]]
+            selected = np.flatnonzero(scores >= threshold)
+        else:
+            selected = np.arange(len(scores))
+
+        ranked = selected[np.lexsort((order[selected], -scores[selected]))]
+        return ranked[:k]
+
+    def build_ann_index(self, n_components: int = 128, n_lists: Optional[int] = None,
+                        random_state: int = 0) -> Dict[str, float]:
+        """Build the IVF indexes used by ``recommend(retrieval='ann')`` (see ann_index).
+
+        One index is built per TF-IDF matrix; ``n_lists`` defaults to the
+        square root of the catalog size. Returns the build time per index.
+        """
+        timings = {}
+        self.ann_indexes = {}
+        matrices = {'general': self.tfidf_matrix, 'ingredient': self.ingredient_tfidf_matrix}
+        for name, matrix in matrices.items():
+            if matrix is not None:
+                with self._timed(name, timings):
+                    self.ann_indexes[name] = IvfIndex(matrix, n_components, n_lists, random_state=random_state)
+        self._invalidate_results()
+        return timings
+
+    def _ann_candidates(self, query: str, ingredients: List[str] = None) -> np.ndarray:
+        """Union of the general and ingredient ANN candidate pools for a query."""
+        pools = [np.array([], dtype=np.int64)]
+        if query.strip():
+            pools.append(self.ann_indexes['general'].search(
+                self.vectorizer.transform([query]), self.ann_n_probe, self.ann_pool_size
+            ))
+
+        ingredient_query = self._build_ingredient_query(ingredients)
+        if ingredient_query.strip() and 'ingredient' in self.ann_indexes:
+            pools.append(self.ann_indexes['ingredient'].search(
+                self.ingredient_vectorizer.transform([ingredient_query]), self.ann_n_probe, self.ann_pool_size
+            ))
+        return np.unique(np.concatenate(pools))
+
+    def build_inverted_index(self, k1: float = 1.2, b: float = 0.75) -> Dict[str, float]:
+        """Build the posting-list indexes used by ``retrieval='inverted'`` and ``'bm25'``.
+
+        ``k1`` and ``b`` are the BM25 parameters. Returns the build time per index.
+        """
+        timings = {}
+        self.inverted_indexes = {}
+        max_health = float(self.df['health_score'].max()) if len(self.df) else 0.0
+        sources = {
+            'general': (self.tfidf_matrix, self.vectorizer),
+            'ingredient': (self.ingredient_tfidf_matrix, self.ingredient_vectorizer)
+        }
+        for name, (matrix, vectorizer) in sources.items():
+            if matrix is not None:
+                with self._timed(name, timings):
+                    self.inverted_indexes[name] = InvertedIndex(matrix, vectorizer.idf_, k1, b, max_health)
+        self._invalidate_results()
+        return timings
+
+    def _inverted_candidates(self, query: str, ingredients: List[str], ingredient_weight: float,
+                             bm25: bool, dietary_preferences: List[str], filters: Dict,
+                             top_n: int, min_similarity: float, prioritize_health: bool) -> tuple:
+        """Products that can make the top ``top_n`` and their similarities (see inverted_index).
+
+        TF-IDF similarities match the exact path; BM25 scores are divided by
+        the query's largest attainable score per index, so they also lie in
+        [0, 1] before the ``ingredient_weight`` blend.
+        """
+        parts = [('general', query, self.vectorizer, 1 - ingredient_weight)]
+        if self.ingredient_vectorizer:
+            parts.append(('ingredient', self._build_ingredient_query(ingredients),
+                          self.ingredient_vectorizer, ingredient_weight))
+
+        postings, max_health = [], 0.0
+        for name, text, vectorizer, part_weight in parts:
+            if not text.strip() or part_weight == 0 or name not in self.inverted_indexes:
+                continue
+            index = self.inverted_indexes[name]
+            max_health = max(max_health, index.max_health)
+            query_vec = vectorizer.transform([text])
+            if bm25:
+                bound = float(index.max_bm25[query_vec.indices].sum())
+                weights = np.full(len(query_vec.indices), part_weight / bound if bound > 0 else 0.0)
+            else:
+                weights = part_weight * query_vec.data
+            for term, weight in zip(query_vec.indices, weights):
+                docs, term_weights = index.postings(term, bm25)
+                postings.append((docs, term_weights, weight, index.max_weight(term, bm25)))
+
+        # With min_similarity <= 0 every product is a candidate, so nothing can be pruned
+        return max_score_candidates(
+            postings,
+            keep=self.filter_index.checker(filters, dietary_preferences),
+            health=self.df['health_score'].to_numpy(dtype=float),
+            max_health=max_health,
+            score_weights=SCORE_WEIGHTS[bool(prioritize_health)],
+            top_n=top_n if min_similarity > 0 else 0,
+            min_similarity=min_similarity
+        )
 
-        return self._format_output(top_indices, combined_similarities, final_scores, ingredients)
+    def build_neighbour_graph(self, k: int = 20, ingredient_weight: float = 0.4,
+                              block_entries: int = BLOCK_ENTRIES) -> Dict[str, float]:
+        """Precompute every product's ``k`` most similar products for ``similar_products`` (see neighbour_graph).
+
+        Similarity blends general and ingredient cosine similarity with
+        ``ingredient_weight``, as in ``recommend``. Building is quadratic in
+        the catalog size; ``block_entries`` bounds the similarity values held
+        at once. Returns the build time.
+        """
+        timings = {}
+        with self._timed('neighbour_graph', timings):
+            self.neighbour_graph = NeighbourGraph(
+                self.tfidf_matrix, self.ingredient_tfidf_matrix, k, ingredient_weight, self.removed, block_entries
+            )
+        return timings
+
+    def similar_products(self, product_id, k: int = 10, healthier_only: bool = False,
+                         fields: List[str] = None, as_frame: bool = True):
+        """Products most similar to the product labelled ``product_id``, from the neighbour graph.
+
+        Only the ``k`` neighbours stored by ``build_neighbour_graph`` are
+        considered, less removed products and, with ``healthier_only``,
+        products whose ``health_score`` is not higher than this one's.
+        Products added since the graph was built have no neighbours until it
+        is rebuilt. ``similarity_score`` and ``final_score`` both hold the
+        similarity; ``fields`` and ``as_frame`` work as in ``recommend``.
+        """
+        if self.neighbour_graph is None:
+            raise ValueError("similar_products needs a neighbour graph; call build_neighbour_graph() first")
+        self._check_fields(fields)
+
+        position = self._label_position(product_id)
+        neighbours, similarities = self.neighbour_graph.neighbours_of(position)
+        keep = ~self.removed[neighbours]
+        if healthier_only:
+            health = self.df['health_score'].to_numpy()
+            keep &= health[neighbours] > health[position]
+        neighbours, similarities = neighbours[keep][:k], similarities[keep][:k].astype(float)
+
+        result = self._result_columns(neighbours, similarities, similarities, fields=fields)
+        return result.to_frame() if as_frame else result
+
+    def _label_position(self, label) -> int:
+        """Position of the live row labelled ``label``: a hash lookup when labels are unique."""
+        try:
+            location = self.df.index.get_loc(label)
+        except (KeyError, TypeError):
+            raise KeyError(f"Product not in the catalog: {label!r}")
+
+        # Updated products leave tombstoned rows with the same label behind (a slice or mask)
+        if isinstance(location, (int, np.integer)):
+            positions = [location]
+        else:
+            positions = np.arange(len(self.df))[location]
+        live = [position for position in positions if not self.removed[position]]
+        if not live:
+            raise KeyError(f"Product not in the catalog: {label!r}")
+        return int(live[-1])
+
+    def build_query_expansion(self, cache_size: int = 65536) -> Dict[str, float]:
+        """Build the typo-tolerant query expanders over each vocabulary (see query_expansion).
+
+        Once built, query tokens are accent-folded, French stop words dropped
+        and words missing from a vocabulary replaced by their closest
+        vocabulary word. ``cache_size`` bounds the memoized corrections per
+        expander. Returns the build time per expander.
+        """
+        timings = {}
+        self.query_expanders = {}
+        vectorizers = {'general': self.vectorizer, 'ingredient': self.ingredient_vectorizer}
+        for name, vectorizer in vectorizers.items():
+            if vectorizer is not None:
+                with self._timed(name, timings):
+                    self.query_expanders[name] = QueryExpander.from_vectorizer(vectorizer, cache_size)
+        self._invalidate_results()
+        return timings
+
+    def _expand_query(self, name: str, query: str) -> str:
+        expander = self.query_expanders.get(name)
+        if expander is None or not query:
+            return query
+        with stage('expand_query'):
+            return expander.expand(query)
+
+    def enable_result_cache(self, max_entries: int = 1024, ttl: float = 300.0,
+                            max_bytes: int = 64 * 1024 * 1024) -> QueryCache:
+        """Cache ``recommend`` results by canonicalized query (see query_cache).
+
+        The cache is cleared whenever products are added, updated or removed.
+        """
+        self.result_cache = QueryCache(max_entries, ttl, max_bytes)
+        return self.result_cache
+
+    def enable_pagination(self, max_entries: int = 256, ttl: float = 300.0,
+                          max_bytes: int = 64 * 1024 * 1024) -> QueryCache:
+        """Keep the scored candidates of paged queries for ``next_page`` (see result_pages).
+
+        Candidate sets are evicted least recently used first, or after
+        ``ttl`` seconds, and dropped whenever the catalog changes.
+        """
+        self.page_cache = QueryCache(max_entries, ttl, max_bytes)
+        return self.page_cache
+
+    def enable_metrics(self) -> LatencyMetrics:
+        """Record per-stage latency and candidate-count histograms for every ``recommend`` call."""
+        self.metrics = LatencyMetrics()
+        return self.metrics
+
+    def enable_parallel_scoring(self, workers: Optional[int] = None,
+                                min_shard_rows: int = MIN_SHARD_ROWS) -> ShardPool:
+        """Score exact queries over row shards of the TF-IDF matrices in a thread pool (see sharded_scoring).
+
+        The catalog is split into at most ``workers`` shards (default: one per
+        core) of at least ``min_shard_rows`` products. Rankings are the same as
+        with serial scoring. Prefiltered, ANN and posting-list queries, which
+        only score a few rows, stay serial.
+        """
+        if self.shard_pool is not None:
+            self.shard_pool.shutdown()
+        self.shard_pool = ShardPool(workers, min_shard_rows)
+        return self.shard_pool
+
+    def cache_stats(self) -> Optional[Dict]:
+        """Hit/miss counters of the result cache, or None when it is disabled."""
+        return None if self.result_cache is None else self.result_cache.stats()
+
+    def add_products(self, df: pd.DataFrame) -> Dict:
+        """Add new products using the fitted vocabularies, without refitting.
+
+        Products are identified by their index labels (e.g. the Open Food Facts
+        ``code``), which must not already be in the catalog. Returns a summary
+        including whether a refit is recommended (see ``refit_recommended``).
+        """
+        live_labels = self.df.index[~self.removed]
+        duplicates = df.index[df.index.isin(live_labels) | df.index.duplicated()]
+        if len(duplicates) > 0:
+            raise ValueError(f"Products already in the catalog: {list(duplicates[:10])}")
+
+        self._append_products(df)
+        return self._update_summary(added=len(df))
+
+    def update_products(self, df: pd.DataFrame) -> Dict:
+        """Replace existing products (matched by index label) with new versions.
+
+        The old rows are tombstoned and the new versions appended.
+        """
+        positions = self._live_positions(df.index)
+        self._remove_positions(positions)
+        self._append_products(df)
+        return self._update_summary(updated=len(df))
+
+    def remove_products(self, codes: List) -> Dict:
+        """Remove products by index label; their rows are tombstoned, not deleted."""
+        positions = self._live_positions(pd.Index(codes))
+        self._remove_positions(positions)
+        return self._update_summary(removed=len(positions))
+
+    def vocabulary_drift(self) -> float:
+        """Share of words in products added since fitting that the general vocabulary lacks."""
+        if self.update_stats['words'] == 0:
+            return 0.0
+        return self.update_stats['unknown_words'] / self.update_stats['words']
+
+    def refit_recommended(self) -> bool:
+        """Whether incremental updates have drifted far enough to warrant a full refit."""
+        removed_share = self.removed.mean() if len(self.removed) else 0.0
+        return bool(self.vocabulary_drift() > self.refit_threshold or removed_share > self.refit_threshold)
+
+    @staticmethod
+    def _empty_update_stats() -> Dict:
+        return {'added': 0, 'updated': 0, 'removed': 0, 'words': 0, 'unknown_words': 0}
+
+    def _live_positions(self, codes: pd.Index) -> np.ndarray:
+        """Positions of the live (not tombstoned) rows with the given labels."""
+        live = np.flatnonzero(~self.removed)
+        found = self.df.index[live].get_indexer(codes)
+        if (found < 0).any():
+            raise KeyError(f"Products not in the catalog: {list(codes[found < 0][:10])}")
+        return live[found]
+
+    def _append_products(self, df: pd.DataFrame):
+        """Prepare, vectorize and index new rows at the end of the catalog."""
+        new_rows = self._prepare_frame(df.copy())
+
+        # Transform with the existing vocabularies and append to the kernel
+        general = self.vectorizer.transform(new_rows['search_text'])
+        ingredient = None
+        if self.ingredient_vectorizer:
+            ingredient = self.ingredient_vectorizer.transform(new_rows['cleaned_ingredients'])
+        self.similarity_kernel.append(general, ingredient)
+
+        self._record_vocabulary_drift(new_rows['search_text'])
+        self.suggestion_index.update(new_rows.get('ingredients_text', pd.Series(dtype=object)), pd.Series(dtype=object))
+        self.ingredient_incidence.append(new_rows.get('ingredients_text', pd.Series('', index=new_rows.index, dtype=object)))
+        self.filter_index.append(new_rows)
+        if 'general' in self.ann_indexes:
+            self.ann_indexes['general'].append(general)
+        if 'ingredient' in self.ann_indexes:
+            self.ann_indexes['ingredient'].append(ingredient)
+        if self.neighbour_graph is not None:
+            self.neighbour_graph.append(len(new_rows))
+        if self.inverted_indexes:
+            # Posting lists are rebuilt from the grown matrices (linear in their size)
+            first = next(iter(self.inverted_indexes.values()))
+            self.build_inverted_index(first.k1, first.b)
+
+        new_frame, new_text = compact_frame(new_rows, self.nutrition_cols)
+        self.df = append_frame(self.df, new_frame)
+        # Presorted lists are rebuilt, new products can fall anywhere in them
+        self._build_browse_index()
+        for col, column in self.product_text.items():
+            if col not in new_text:
+                new_text[col] = TextColumn.from_series(pd.Series('', index=new_frame.index))
+            self.product_text[col] = column.append(new_text[col])
+        self.removed = np.concatenate([self.removed, np.zeros(len(new_rows), dtype=bool)])
+        self._invalidate_results()
+
+    def _remove_positions(self, positions: np.ndarray):
+        self.removed[positions] = True
+        self._invalidate_results()
+        self.filter_index.remove(positions)
+        if 'ingredients_text' in self.product_text:
+            removed_text = pd.Series(self.product_text['ingredients_text'].take(positions), dtype=object)
+            self.suggestion_index.update(pd.Series(dtype=object), removed_text)
+
+    def _invalidate_results(self):
+        if self.result_cache is not None:
+            self.result_cache.clear()
+        if self.page_cache is not None:
+            self.page_cache.clear()
+        # New terms can contain the ingredients looked up so far
+        self.__dict__.pop('_ingredient_column_cache', None)
+
+    def _record_vocabulary_drift(self, search_text: pd.Series):
+        """Count the words of new products the general vectorizer has never seen."""
+        analyzer = self.vectorizer.build_analyzer()
+        vocabulary = self.vectorizer.vocabulary_
+        for text in search_text:
+            words = [term for term in analyzer(text) if ' ' not in term]
+            self.update_stats['words'] += len(words)
+            self.update_stats['unknown_words'] += sum(1 for word in words if word not in vocabulary)
+
+    def _update_summary(self, added: int = 0, updated: int = 0, removed: int = 0) -> Dict:
+        self.update_stats['added'] += added
+        self.update_stats['updated'] += updated
+        self.update_stats['removed'] += removed
+        return {
+            'added': added,
+            'updated': updated,
+            'removed': removed,
+            'vocabulary_drift': builtins.round(self.vocabulary_drift(), 4),
+            'refit_recommended': self.refit_recommended()
+        }
 
     def _build_query(self, recipe_text: str, ingredients: List[str] = None,
                     dietary_preferences: List[str] = None) -> str:
@@ -218,185 +1286,154 @@ class RecipeProductRecommender:
                     diet_terms.append(pref)
             parts.extend(diet_terms)
 
-        return ' '.join(parts)
+        return self._expand_query('general', ' '.join(parts))
 
-    def _get_general_similarities(self, query: str) -> pd.Series:
-        """Calculate general cosine similarities."""
-        if not query.strip():
-            return pd.Series(0.0, index=self.df.index)
-
-        query_vec = self.vectorizer.transform([query])
-        similarities = cosine_similarity(query_vec, self.tfidf_matrix).flatten()
-
-        return pd.Series(similarities, index=self.df.index)
-
-    def _get_ingredient_similarities(self, ingredients: List[str] = None) -> pd.Series:
-        """Calculate ingredient-specific similarities."""
-        if not ingredients or not self.ingredient_vectorizer:
-            return pd.Series(0.0, index=self.df.index)
+    def _build_ingredient_query(self, ingredients: List[str] = None) -> str:
+        """Clean and combine ingredients into one ingredient-vectorizer query."""
+        if not ingredients:
+            return ""
 
-        # Clean and combine ingredients
         clean_ingredients = [self._clean_ingredient_text(ing) for ing in ingredients if ing.strip()]
-        ingredient_query = ' '.join(clean_ingredients)
-
-        if not ingredient_query.strip():
-            return pd.Series(0.0, index=self.df.index)
-
-        query_vec = self.ingredient_vectorizer.transform([ingredient_query])
-        similarities = cosine_similarity(query_vec, self.ingredient_tfidf_matrix).flatten()
-
-        return pd.Series(similarities, index=self.df.index)
-
-    def _combine_similarities(self, general_sim: pd.Series, ingredient_sim: pd.Series,
-                            ingredient_weight: float) -> pd.Series:
-        """Combine general and ingredient similarities."""
-        general_weight = 1 - ingredient_weight
-
-        return general_weight * general_sim + ingredient_weight * ingredient_sim
-
-    def _apply_filters(self, filters: Dict = None, dietary_preferences: List[str] = None) -> pd.Series:
-        """Apply filters including dietary preferences."""
-        mask = pd.Series(True, index=self.df.index)
-
-        # Apply dietary preferences as hard filters
-        if dietary_preferences:
-            for pref in dietary_preferences:
-                if pref in self.dietary_cols:
-                    col_name = self.dietary_cols[pref]
-                    if col_name in self.df.columns:
-                        mask &= self.df[col_name] == True
-
-        if not filters:
-            return mask
-
-        # Nutritional filters
-        if 'max_calories' in filters and 'energy-kcal_100g' in self.df.columns:
-            mask &= self.df['energy-kcal_100g'] <= filters['max_calories']
-
-        if 'max_sugar' in filters and 'sugars_100g' in self.df.columns:
-            mask &= self.df['sugars_100g'] <= filters['max_sugar']
-
-        if 'min_protein' in filters and 'proteins_100g' in self.df.columns:
-            mask &= self.df['proteins_100g'] >= filters['min_protein']
-
-        if 'max_carbs' in filters and 'carbohydrates_100g' in self.df.columns:
-            mask &= self.df['carbohydrates_100g'] <= filters['max_carbs']
-
-        # NutriScore filter
-        if 'nutriscore' in filters and 'nutriscore_grade' in self.df.columns:
-            allowed = filters['nutriscore']
-            if isinstance(allowed, str):
-                allowed = [allowed]
-            mask &= self.df['nutriscore_grade'].isin(allowed)
-
-        # Brand filter
-        if 'brands' in filters and 'brands' in self.df.columns:
-            brands = filters['brands']
-            if isinstance(brands, str):
-                brands = [brands]
-            brand_mask = pd.Series(False, index=self.df.index)
-            for brand in brands:
-                brand_mask |= self.df['brands'].str.contains(brand, case=False, na=False)
-            mask &= brand_mask
-
-        return mask
-
-    def _calculate_scores(self, similarities: pd.Series, valid_mask: pd.Series,
-                        prioritize_health: bool = True) -> pd.Series:
-        """Calculate final ranking scores."""
-        scores = pd.Series(0.0, index=self.df.index)
-
-        if not valid_mask.any():
-            return scores
-
-        valid_sim = similarities[valid_mask]
-        valid_health = self.df.loc[valid_mask, 'health_score']
+        return self._expand_query('ingredient', ' '.join(clean_ingredients))
+
+    def _query_vectors(self, query: str, ingredients: List[str] = None):
+        """General and ingredient TF-IDF rows of a query (``None`` where that query is empty)."""
+        general_vec = ingredient_vec = None
+        if query.strip():
+            with stage('general_transform'):
+                general_vec = self.vectorizer.transform([query])
+
+        ingredient_query = self._build_ingredient_query(ingredients) if self.ingredient_vectorizer else ''
+        if ingredient_query.strip():
+            with stage('ingredient_transform'):
+                ingredient_vec = self.ingredient_vectorizer.transform([ingredient_query])
+        return general_vec, ingredient_vec
+
+    def _get_similarities(self, query: str, ingredients: List[str] = None, ingredient_weight: float = 0.4,
+                          rows: Optional[np.ndarray] = None) -> sp.csr_matrix:
+        """Weighted general + ingredient cosine similarities as a sparse 1 x N row (of ``rows`` only, if given)."""
+        vector = self.similarity_kernel.query_vector(*self._query_vectors(query, ingredients), ingredient_weight)
+        with stage('similarity'):
+            return self.similarity_kernel.similarity_row(vector, rows)
+
+    def _apply_filters(self, filters: Dict = None, dietary_preferences: List[str] = None,
+                       candidates: Optional[np.ndarray] = None) -> np.ndarray:
+        """Apply filters including dietary preferences.
+
+        Returns a boolean mask over ``candidates`` (product positions), or over
+        the whole catalog when no candidates are given.
+        """
+        if candidates is None:
+            candidates = np.arange(len(self.df))
+
+        return self.filter_index.contains(candidates, filters, dietary_preferences)
+
+    def _calculate_scores(self, similarities: np.ndarray, candidates: np.ndarray,
+                        prioritize_health: bool = True, max_sim: Optional[float] = None) -> np.ndarray:
+        """Calculate final ranking scores for the candidate products.
+
+        Similarities are normalized by ``max_sim``, by default their maximum.
+        """
+        health = self.df['health_score'].to_numpy()[candidates].astype(float)
 
         # Normalize scores
-        if valid_sim.max() > 0:
-            norm_sim = valid_sim / valid_sim.max()
-        else:
-            norm_sim = pd.Series(0.0, index=valid_sim.index)
+        max_sim = similarities.max() if max_sim is None else max_sim
+        norm_sim = similarities / max_sim if max_sim > 0 else np.zeros_like(similarities)
 
-        norm_health = valid_health / 10.0
+        norm_health = health / 10.0
 
         # Calculate weighted scores
-        if prioritize_health:
-            scores[valid_mask] = 0.55 * norm_sim + 0.45 * norm_health
-        else:
-            scores[valid_mask] = 0.70 * norm_sim + 0.30 * norm_health
-
-        return scores
-
-    def _format_output(self, indices: pd.Index, similarities: pd.Series,
-                      final_scores: pd.Series, matched_ingredients: List[str] = None) -> pd.DataFrame:
-        """Format results with ingredient matching information."""
-        if len(indices) == 0:
-            return pd.DataFrame()
-
-        result = self.df.loc[indices].copy()
-        result['similarity_score'] = similarities.loc[indices].round(3)
-        result['final_score'] = final_scores.loc[indices].round(3)
+        sim_weight, health_weight = SCORE_WEIGHTS[bool(prioritize_health)]
+        return sim_weight * norm_sim + health_weight * norm_health
+
+    def _format_output(self, positions: np.ndarray, similarities: np.ndarray,
+                      final_scores: np.ndarray, matched_ingredients: List[str] = None) -> pd.DataFrame:
+        """Format results (given by product position) with ingredient matching information."""
+        return self._result_columns(positions, similarities, final_scores, matched_ingredients).to_frame()
+
+    def _result_columns(self, positions: np.ndarray, similarities: np.ndarray, final_scores: np.ndarray,
+                        matched_ingredients: List[str] = None, fields: List[str] = None) -> ProductColumns:
+        """Result columns for the products at ``positions``, decoding only the selected fields."""
+        if len(positions) == 0:
+            return ProductColumns({})
+
+        wanted = [col for col in RESULT_FIELDS if fields is None or col in fields]
+        stored = [col for col in wanted if col in self.df.columns or col in self.product_text]
+        columns = take_columns(self.df, self.product_text, positions, stored)
+        columns['final_score'] = np.round(final_scores, 3)
+        columns['similarity_score'] = np.round(similarities, 3)
 
         # Add ingredient matching information
-        if matched_ingredients:
-            result['matched_ingredients'] = result['ingredients_text'].apply(
-                lambda x: self._count_ingredient_matches(x, matched_ingredients)
-            )
-
-        # Select display columns
-        display_cols = ['product_name', 'brands', 'final_score', 'similarity_score', 'health_score']
-
-        if matched_ingredients:
-            display_cols.append('matched_ingredients')
-
-        # Add available columns
-        optional_cols = ['nutriscore_grade', 'health_category', 'energy-kcal_100g',
-                        'proteins_100g', 'sugars_100g', 'categories', 'ingredients_text']
-
-        for col in optional_cols:
-            if col in result.columns:
-                display_cols.append(col)
-
-        # Filter existing columns
-        final_cols = [col for col in display_cols if col in result.columns]
-
-        return result[final_cols].reset_index(drop=True)
-
-    def _count_ingredient_matches(self, product_ingredients: str, search_ingredients: List[str]) -> int:
-        """Count how many search ingredients are found in product ingredients."""
-        if not product_ingredients or not search_ingredients:
-            return 0
-
-        product_lower = product_ingredients.lower()
-        matches = 0
-
-        for ingredient in search_ingredients:
-            if ingredient.lower().strip() in product_lower:
-                matches += 1
-
-        return matches
+        if (matched_ingredients and 'ingredients_text' in self.product_text
+                and ('matched_ingredients' in wanted or 'matched_ingredient_names' in wanted)):
+            counts, names = self._ingredient_matches(positions, matched_ingredients, columns.get('ingredients_text'))
+            columns['matched_ingredients'] = counts
+            columns['matched_ingredient_names'] = names
+
+        # Display order, selected fields only
+        return ProductColumns({col: columns[col] for col in wanted if col in columns})
+
+    def _ingredient_matches(self, positions: np.ndarray, search_ingredients: List[str],
+                            texts: Optional[np.ndarray] = None) -> tuple:
+        """How many, and which, of ``search_ingredients`` each product contains.
+
+        An ingredient matches a product whose ingredients text contains it
+        (case-insensitively). A substring without separators lies within one
+        cleaned ingredient term, so the ingredient is looked up in the
+        suggestion index's suffix array to find every term containing it and
+        the matches are read from the rows of ``ingredient_incidence``.
+        Ingredients shorter than a term (3 characters) or containing a
+        separator (``,;()``) are checked on ``texts`` instead (the products'
+        ingredients text, decoded when not given). Names are returned
+        lowercased and stripped, as the result cache key normalizes them.
+        """
+        needles = [ingredient.lower().strip() for ingredient in search_ingredients]
+        term_sets = [self._ingredient_columns(needle) for needle in needles]
+
+        matched = np.zeros((len(positions), len(needles)), dtype=bool)
+        by_terms = [i for i, columns in enumerate(term_sets) if columns is not None]
+        if by_terms:
+            matched[:, by_terms] = self.ingredient_incidence.matches(positions, [term_sets[i] for i in by_terms])
+
+        by_text = [i for i, columns in enumerate(term_sets) if columns is None]
+        if by_text:
+            if texts is None:
+                texts = self.product_text['ingredients_text'].take(positions)
+            lowered = [text.lower() if text else '' for text in texts]
+            for i in by_text:
+                matched[:, i] = [bool(text) and needles[i] in text for text in lowered]
+
+        names = np.empty(len(positions), dtype=object)
+        if len(needles) < 63:
+            # One tuple of names per distinct match pattern (a bit mask), shared by its rows
+            bits = np.int64(1) << np.arange(len(needles), dtype=np.int64)
+            patterns, inverse = np.unique(matched.astype(np.int64) @ bits, return_inverse=True)
+            table = np.empty(len(patterns), dtype=object)
+            for k, pattern in enumerate(patterns.tolist()):
+                table[k] = tuple(needle for j, needle in enumerate(needles) if pattern >> j & 1)
+            names = table[inverse]
+        else:
+            for row, flags in enumerate(matched.tolist()):
+                names[row] = tuple(needle for needle, flag in zip(needles, flags) if flag)
+        return matched.sum(axis=1).astype(np.int64), names
+
+    def _ingredient_columns(self, needle: str) -> Optional[np.ndarray]:
+        """Incidence columns of the terms containing ``needle``, or None if it can span terms (memoized)."""
+        if len(needle) < 3 or any(separator in needle for separator in ',;()'):
+            return None
+        cache = self.__dict__.setdefault('_ingredient_column_cache', {})
+        if needle not in cache:
+            if len(cache) >= 4096:
+                cache.clear()
+            cache[needle] = self.ingredient_incidence.term_columns(self.suggestion_index.containing(needle))
+        return cache[needle]
 
     def get_ingredient_suggestions(self, partial: str, limit: int = 10) -> List[str]:
-        """Get ingredient suggestions based on partial input."""
+        """Get ingredient suggestions based on partial input, most common first."""
         if not partial or len(partial) < 2:
             return []
 
-        all_ingredients = set()
-        partial_lower = partial.lower()
-
-        for ing_text in self.df['ingredients_text'].dropna():
-            # Split by common separators
-            ingredients = re.split(r'[,;()]\s*', ing_text.lower())
-            for ing in ingredients:
-                ing = ing.strip()
-                if len(ing) > 2 and partial_lower in ing:
-                    # Clean the ingredient suggestion
-                    clean_ing = re.sub(r'\([^)]*\)', '', ing).strip()
-                    if clean_ing:
-                        all_ingredients.add(clean_ing)
-
-        return sorted(all_ingredients, key=len)[:limit]
+        return self.suggestion_index.search(partial, limit)
 
     def search_by_ingredients_only(self, ingredients: List[str], top_n: int = 10) -> pd.DataFrame:
         """Search products based only on ingredients list."""
@@ -415,28 +1452,34 @@ class RecipeProductRecommender:
         """Get available dietary options and their counts."""
         options = {}
         for diet_name, col_name in self.dietary_cols.items():
-            if col_name in self.df.columns:
-                count = self.df[col_name].sum()
-                options[diet_name] = int(count)
+            # Dietary flags live bit-packed in the filter index
+            if col_name in self.filter_index.flag_bits:
+                options[diet_name] = self.filter_index.count_flag(col_name)
         return options
 
     def get_nutrition_summary(self, product_indices: List[int] = None) -> Dict:
-        """Get nutritional summary of products."""
+        """Get nutritional summary of products.
+
+        Nutrition values are served as float32, so the statistics are
+        computed from float32-rounded values (about 7 significant digits).
+        Minimum and maximum are shown as the shortest decimal of their
+        float32 value, like result columns.
+        """
         if product_indices:
             subset = self.df.iloc[product_indices]
         else:
-            subset = self.df
+            subset = self.df[~self.removed]
 
         summary = {}
         for col in self.nutrition_cols.values():
             if col in subset.columns:
-                col_data = subset[col].dropna()
+                col_data = subset[col].dropna().to_numpy(dtype=np.float64)
                 if len(col_data) > 0:
                     summary[col] = {
-                        'mean': builtins.round(col_data.mean(), 2),
-                        'median': builtins.round(col_data.median(), 2),
-                        'min': col_data.min(),
-                        'max': col_data.max(),
+                        'mean': float(builtins.round(np.mean(col_data), 2)),
+                        'median': float(builtins.round(np.median(col_data), 2)),
+                        'min': widen(np.float32(col_data.min())).item(),
+                        'max': widen(np.float32(col_data.max())).item(),
                         'count': len(col_data)
                     }
         return summary
@@ -0,0 +1,95 @@
+"""Scored candidate sets kept server-side for cursor pagination.
+
+``recommend(..., page_size=...)`` scores and filters the candidates once,
+keeps the best ``top_n`` of them (selected with ``argpartition``, unsorted)
+in a ``CandidateSet`` and returns the first page with a cursor. The set is
+stored in a ``QueryCache`` (LRU with a time-to-live) under a random token,
+and ``next_page`` serves later pages by slicing it. Only the products shown
+so far are sorted: each page ranks just the next ``page_size`` products of
+the remainder, so "show more" never reruns the query or re-sorts the set.
+
+A cursor is self-contained: besides the token and offset it carries the
+query's ``recommend`` arguments. A process that does not hold the set (a
+different server worker, or after eviction) scores the query again and
+caches the set under the same token; ranking is deterministic, so the pages
+continue where they left off as long as the catalog did not change.
+"""
+import base64
+import json
+import secrets
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+def make_cursor(token: str, offset: int, query: Dict) -> str:
+    """URL-safe cursor of the results from ``offset`` on of ``query`` (``recommend`` arguments)."""
+    payload = json.dumps({'token': token, 'offset': offset, 'query': query}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def parse_cursor(cursor: str) -> Tuple[str, int, Dict]:
+    """Token, result offset and query of a cursor; raises ValueError when malformed."""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        token, offset, query = payload['token'], payload['offset'], payload['query']
+    except (TypeError, ValueError, KeyError):
+        raise ValueError(f"Invalid cursor {cursor!r}") from None
+    if (not isinstance(token, str) or isinstance(offset, bool) or not isinstance(offset, int)
+            or offset < 0 or not isinstance(query, dict)):
+        raise ValueError(f"Invalid cursor {cursor!r}")
+    return token, offset, query
+
+
+def new_token() -> str:
+    return secrets.token_urlsafe(12)
+
+
+class CandidateSet:
+    """The best ``limit`` scored candidates of a query, ranked lazily page by page.
+
+    ``top_k(scores, order, k)`` selects and sorts the ``k`` best scores with
+    ties broken by ascending ``order`` (the recommender's ``_top_k``), so
+    pages follow the same ranking as a single ``recommend`` call.
+    ``ingredients`` and ``fields`` are kept to format the pages.
+    """
+
+    def __init__(self, positions: np.ndarray, similarities: np.ndarray, scores: np.ndarray, limit: int,
+                 top_k: Callable[[np.ndarray, np.ndarray, int], np.ndarray],
+                 ingredients: Optional[List[str]] = None, fields: Optional[List[str]] = None):
+        self.limit = min(max(limit, 0), len(scores))
+        if 0 < self.limit < len(scores):
+            # Everything tied with the limit-th score stays, the ranking decides between them
+            threshold = scores[np.argpartition(-scores, self.limit - 1)[self.limit - 1]]
+            keep = np.flatnonzero(scores >= threshold)
+            positions, similarities, scores = positions[keep], similarities[keep], scores[keep]
+        self.positions = positions
+        self.similarities = similarities
+        self.scores = scores
+        self.top_k = top_k
+        self.ingredients = ingredients
+        self.fields = fields
+
+        self.ranked = np.array([], dtype=np.intp)  # rows in rank order, shown or about to be
+        self.rest = np.arange(len(scores))  # rows not ranked yet
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self.limit
+
+    @property
+    def nbytes(self) -> int:
+        arrays = (self.positions, self.similarities, self.scores, self.ranked, self.rest)
+        return sum(array.nbytes for array in arrays)
+
+    def page(self, offset: int, size: int) -> np.ndarray:
+        """Rows of the results ranked ``offset`` to ``offset + size`` (fewer at the end)."""
+        end = min(offset + max(size, 0), self.limit)
+        with self._lock:
+            missing = end - len(self.ranked)
+            if missing > 0:
+                top = self.top_k(self.scores[self.rest], self.positions[self.rest], missing)
+                self.ranked = np.concatenate([self.ranked, self.rest[top]])
+                self.rest = np.delete(self.rest, top)
+            return self.ranked[offset:end]
@@ -0,0 +1,128 @@
+"""Production entry points for the recommender API.
+
+Two modes::
+
+    python serve.py prefork --model recipe_recommender --workers 4 --port 8000
+    python serve.py asgi --model recipe_recommender --workers 4 --pool thread
+
+``prefork`` loads the model once in the parent, binds the listening socket and
+forks the workers, which share the loaded arrays copy-on-write (POSIX only).
+``gc.freeze()`` moves the model's objects out of the collector's reach so that
+garbage collection in the workers does not touch, and thereby copy, their pages.
+This is what ``gunicorn --preload app:app`` does; use gunicorn instead when it
+is installed.
+
+``asgi`` runs ``asgi_app`` under uvicorn, which must be installed.
+"""
+import argparse
+import gc
+import logging
+import os
+import signal
+import socketserver
+import sys
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+import app as api
+
+logger = logging.getLogger(__name__)
+
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+
+class _ThreadingWSGIServer(socketserver.ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+
+def _run_worker(server: WSGIServer):
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    try:
+        server.serve_forever()
+    finally:
+        os._exit(0)
+
+
+def serve_prefork(model_path: str, host: str, port: int, workers: int):
+    if not hasattr(os, 'fork'):
+        raise SystemExit("prefork mode needs os.fork (POSIX); use the asgi mode instead")
+    if not api.load_recommender(model_path):
+        raise SystemExit(f"Could not load model from {model_path}")
+
+    # Bound before forking, so every worker accepts on the same socket
+    server = make_server(host, port, api.app, server_class=_ThreadingWSGIServer, handler_class=_QuietHandler)
+    gc.collect()
+    gc.freeze()
+
+    children = set()
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            _run_worker(server)
+        children.add(pid)
+
+    for _ in range(workers):
+        spawn()
+    logger.info(f"Serving on http://{host}:{port} with {workers} workers")
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        children.discard(pid)
+        if not stopping:
+            logger.warning(f"Worker {pid} exited with status {status}, restarting")
+            spawn()
+    server.server_close()
+
+
+def serve_asgi(model_path: str, host: str, port: int, workers: int, pool: str, queue_size: int, timeout: float):
+    try:
+        import uvicorn
+    except ImportError:
+        raise SystemExit("asgi mode needs uvicorn (pip install uvicorn)")
+    from asgi_app import create_app
+
+    uvicorn.run(create_app(model_path, pool, workers, queue_size, timeout), host=host, port=port)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the recommender API")
+    parser.add_argument('mode', choices=['prefork', 'asgi'])
+    parser.add_argument('--model', default='recipe_recommender2.pkl', help='artifact directory or pickle')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='forked processes (prefork) or pool size (asgi)')
+    parser.add_argument('--pool', choices=['thread', 'process'], default='thread', help='asgi worker pool kind')
+    parser.add_argument('--queue-size', type=int, default=64, help='asgi requests queued before answering 429')
+    parser.add_argument('--timeout', type=float, default=10.0, help='asgi seconds per request before answering 504')
+    args = parser.parse_args()
+
+    if args.mode == 'prefork':
+        serve_prefork(args.model, args.host, args.port, args.workers)
+    else:
+        serve_asgi(args.model, args.host, args.port, args.workers, args.pool, args.queue_size, args.timeout)
+
+
+if __name__ == '__main__':
+    main()
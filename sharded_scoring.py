@@ -0,0 +1,80 @@
+"""Row shards of the product matrices, scored concurrently in a thread pool.
+
+A shard is a contiguous range of product rows. Its matrix is a CSR view
+sharing the ``data`` and ``indices`` arrays of the full matrix (memory-mapped
+ones included), so sharding copies nothing but ``indptr``. The sparse
+matrix-vector products and NumPy kernels run per shard release the GIL, so
+threads score shards on separate cores without copying the model into
+worker processes.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import scipy.sparse as sp
+
+# Shards smaller than this cost more in task overhead than they save
+MIN_SHARD_ROWS = 50000
+
+
+def shard_bounds(n_rows: int, n_shards: int) -> np.ndarray:
+    """First row of each of ``n_shards`` near-equal shards, followed by ``n_rows``."""
+    return np.arange(n_shards + 1, dtype=np.int64) * n_rows // n_shards
+
+
+def row_view(matrix: sp.csr_matrix, start: int, end: int) -> sp.csr_matrix:
+    """Rows ``start:end`` of a CSR matrix without copying its data or indices."""
+    lo, hi = matrix.indptr[start], matrix.indptr[end]
+    view = sp.csr_matrix((end - start, matrix.shape[1]), dtype=matrix.dtype)
+    view.data = matrix.data[lo:hi]
+    view.indices = matrix.indices[lo:hi]
+    view.indptr = matrix.indptr[start:end + 1] - lo
+    return view
+
+
+class ShardPool:
+    """Thread pool plus cached row shards of the matrices it scores.
+
+    Catalogs get at most ``workers`` shards (one per core by default) of at
+    least ``min_shard_rows`` rows; matrices with the same number of rows are
+    sharded identically. Shards are rebuilt when a matrix is replaced, e.g.
+    after ``add_products``.
+    """
+
+    def __init__(self, workers: Optional[int] = None, min_shard_rows: int = MIN_SHARD_ROWS):
+        self.workers = workers or os.cpu_count() or 1
+        self.min_shard_rows = min_shard_rows
+        self.executor = ThreadPoolExecutor(self.workers, thread_name_prefix='shard')
+        self._shards = {}  # name -> (matrix, bounds, views)
+        self._lock = threading.Lock()
+
+    def bounds(self, n_rows: int) -> np.ndarray:
+        n_shards = max(1, min(self.workers, n_rows // max(self.min_shard_rows, 1)))
+        return shard_bounds(n_rows, n_shards)
+
+    def views(self, name: str, matrix: sp.csr_matrix) -> List[sp.csr_matrix]:
+        """Row views of ``matrix``, one per range of ``bounds(matrix.shape[0])``."""
+        with self._lock:
+            cached = self._shards.get(name)
+            if cached is None or cached[0] is not matrix:
+                bounds = self.bounds(matrix.shape[0])
+                views = [row_view(matrix, start, end) for start, end in zip(bounds[:-1], bounds[1:])]
+                cached = self._shards[name] = (matrix, bounds, views)
+            return cached[2]
+
+    def map(self, fn: Callable[[int], object], n_shards: int) -> List:
+        """``fn(shard)`` for every shard, in shard order; shard 0 runs in the calling thread."""
+        futures = [self.executor.submit(fn, shard) for shard in range(1, n_shards)]
+        return [fn(0)] + [future.result() for future in futures]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'shards': {name: len(views) for name, (_, _, views) in self._shards.items()}
+            }
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,112 @@
+"""Fused general + ingredient similarity kernel.
+
+Both TF-IDF matrices are stacked side by side, once, into one float32 CSR
+matrix with int32 indices: the general vocabulary's columns first, then the
+ingredient vocabulary's. TF-IDF rows are already L2-normalized, so a
+product's blended cosine similarity is the dot product of its stacked row
+with the stacked query vector, whose two halves are scaled by the general
+and ingredient weights. A request thus costs one matrix-vector product over
+the catalog, instead of one sparse product per vectorizer (each transposing
+the product matrix) and a sparse sum of the two results.
+
+The kernel is the only copy of the TF-IDF rows a fitted recommender keeps:
+the ANN, posting-list and neighbour-graph indexes are built from its column
+slices (``general``, ``ingredient``).
+"""
+import numpy as np
+import scipy.sparse as sp
+from typing import List, Optional
+
+
+def _compact_csr(matrix: sp.spmatrix) -> sp.csr_matrix:
+    """``matrix`` as float32 CSR; scipy keeps its indices int32 while the matrix is small enough."""
+    return sp.csr_matrix(matrix, dtype=np.float32)
+
+
+class SimilarityKernel:
+    """Stacked ``[general | ingredient]`` product matrix scored in a single pass.
+
+    ``split`` is the number of general columns. A kernel built without an
+    ingredient matrix scores general similarity only.
+    """
+
+    def __init__(self, general: sp.csr_matrix, ingredient: Optional[sp.csr_matrix] = None):
+        self.split = general.shape[1]
+        self.matrix = _compact_csr(general if ingredient is None else sp.hstack([general, ingredient], format='csr'))
+
+    @classmethod
+    def stack(cls, kernels: List['SimilarityKernel']) -> 'SimilarityKernel':
+        """One kernel with the rows of ``kernels`` (built with the same vocabularies), in order."""
+        kernel = cls.__new__(cls)
+        kernel.split = kernels[0].split
+        kernel.matrix = _compact_csr(sp.vstack([part.matrix for part in kernels], format='csr'))
+        return kernel
+
+    def general(self) -> sp.csr_matrix:
+        """The general TF-IDF rows (float32), sliced out of the stacked matrix."""
+        return self.matrix[:, :self.split]
+
+    def ingredient(self) -> Optional[sp.csr_matrix]:
+        """The ingredient TF-IDF rows (float32), or None for a general-only kernel."""
+        if self.matrix.shape[1] == self.split:
+            return None
+        return self.matrix[:, self.split:]
+
+    def query_vector(self, general_vec: Optional[sp.csr_matrix], ingredient_vec: Optional[sp.csr_matrix],
+                     ingredient_weight: float) -> np.ndarray:
+        """Dense stacked query: each vectorizer's query row scaled by its weight."""
+        vector = np.zeros(self.matrix.shape[1], dtype=np.float32)
+        if general_vec is not None:
+            vector[general_vec.indices] = (1 - ingredient_weight) * general_vec.data
+        if ingredient_vec is not None and self.matrix.shape[1] > self.split:
+            vector[self.split + ingredient_vec.indices] = ingredient_weight * ingredient_vec.data
+        return vector
+
+    def query_matrix(self, general_vecs: sp.csr_matrix, ingredient_vecs: Optional[sp.csr_matrix],
+                     ingredient_weights: np.ndarray) -> sp.csr_matrix:
+        """Sparse stacked queries, one row per query (see ``query_vector``)."""
+        blocks = [sp.diags(1 - ingredient_weights) @ general_vecs]
+        if self.matrix.shape[1] > self.split:
+            if ingredient_vecs is None:
+                ingredient_vecs = sp.csr_matrix((general_vecs.shape[0], self.matrix.shape[1] - self.split))
+            blocks.append(sp.diags(ingredient_weights) @ ingredient_vecs)
+        return sp.hstack(blocks, format='csr', dtype=np.float32)
+
+    def scores(self, vector: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Blended similarity of every product (or of ``rows``) with a stacked query vector."""
+        if rows is None:
+            return self.matrix @ vector
+        return self.matrix[rows] @ vector
+
+    def similarity_row(self, vector: np.ndarray, rows: Optional[np.ndarray] = None) -> sp.csr_matrix:
+        """``scores`` as a sparse ``1 x N`` row holding only the products with a nonzero similarity."""
+        scores = self.scores(vector, rows)
+        found = np.flatnonzero(scores)
+        indices = found if rows is None else rows[found]
+        # Ranking works in float64 from here on, like the rest of the scoring
+        return sp.csr_matrix((scores[found].astype(np.float64), indices, [0, len(found)]), shape=(1, self.matrix.shape[0]))
+
+    def batch_similarities(self, queries: sp.csr_matrix) -> sp.csr_matrix:
+        """Blended similarities of stacked query rows (``query_matrix``), one sparse row per query."""
+        # Products x queries only transposes the small query matrix; float64 like similarity_row
+        return sp.csr_matrix((self.matrix @ queries.T).T, dtype=np.float64)
+
+    def append(self, general: sp.csr_matrix, ingredient: Optional[sp.csr_matrix] = None):
+        """Add the rows of new products."""
+        rows = SimilarityKernel(general, ingredient if self.matrix.shape[1] > self.split else None).matrix
+        self.matrix = _compact_csr(sp.vstack([self.matrix, rows], format='csr'))
+
+    def to_arrays(self):
+        """Arrays and metadata needed to restore the kernel without rebuilding it."""
+        arrays = {'data': self.matrix.data, 'indices': self.matrix.indices, 'indptr': self.matrix.indptr}
+        return arrays, {'shape': list(self.matrix.shape), 'split': self.split}
+
+    @classmethod
+    def from_arrays(cls, arrays, meta) -> 'SimilarityKernel':
+        kernel = cls.__new__(cls)
+        kernel.split = meta['split']
+        kernel.matrix = sp.csr_matrix(tuple(meta['shape']), dtype=np.float32)
+        kernel.matrix.data = arrays['data']
+        kernel.matrix.indices = arrays['indices']
+        kernel.matrix.indptr = arrays['indptr']
+        return kernel